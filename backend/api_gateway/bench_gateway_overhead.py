@@ -0,0 +1,130 @@
+"""
+Бенчмарк накладных расходов шлюза на один запрос.
+
+1. Разбор запроса до проксирования, старая схема против новой:
+   - было: поиск в списке PUBLIC_ROUTES, split заголовка, jwt.decode на каждый
+     запрос, новый httpx.AsyncClient на каждый запрос;
+   - стало: таблица маршрутов, кеш проверенных токенов, общий клиент на сервис.
+2. Сквозная задержка: запрос через шлюз (in-process, httpx.ASGITransport)
+   к локальному поддельному сервису против прямого запроса к нему же.
+   Разница — собственное время шлюза.
+
+    cd backend/api_gateway
+    PYTHONPATH=.. python bench_gateway_overhead.py --requests 2000
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import timeit
+from datetime import datetime, timedelta, timezone
+
+FAKE_PORT = int(os.getenv("FAKE_UPSTREAM_PORT", "18013"))
+FAKE_URL = f"http://127.0.0.1:{FAKE_PORT}"
+
+# Лимиты не должны срабатывать во время замера, но сама проверка остаётся в пути запроса
+os.environ.update({
+    "DEFECTS_SERVICE_URL": FAKE_URL,
+    "RATE_LIMIT_USER_PER_MINUTE": "1e12",
+    "RATE_LIMIT_USER_BURST": "1e12",
+    "RATE_LIMIT_IP_PER_MINUTE": "1e12",
+    "RATE_LIMIT_IP_BURST": "1e12",
+})
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+from jose import jwt  # noqa: E402
+
+import main  # noqa: E402
+
+LEGACY_PUBLIC_ROUTES = ["/", "/auth/register", "/auth/token", "/v1/auth/register", "/v1/auth/token", "/docs", "/openapi.json", "/redoc"]
+BODY = b'[{"id": 1, "title": "Defect", "status": "new"}]'
+
+
+async def fake_upstream(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(BODY)).encode())]})
+    await send({"type": "http.response.body", "body": BODY})
+
+
+def legacy_preprocess(path: str, auth_header: str) -> None:
+    if path not in LEGACY_PUBLIC_ROUTES:
+        scheme, token = auth_header.split()
+        jwt.decode(token, main.SECRET_KEY, algorithms=[main.ALGORITHM])
+
+
+def current_preprocess(path: str, auth_header: str) -> None:
+    route = main.route_table.match(path)
+    if not route.public:
+        _, _, token = auth_header.partition(" ")
+        main.token_cache.verify(token)
+
+
+def per_call_us(func, number: int) -> float:
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+async def client_setup_us(iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        client = httpx.AsyncClient(timeout=30.0)
+        await client.aclose()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+async def latencies(client: httpx.AsyncClient, url: str, count: int):
+    result = []
+    for _ in range(count):
+        started = time.perf_counter()
+        response = await client.get(url)
+        response.raise_for_status()
+        result.append((time.perf_counter() - started) * 1e6)
+    return result
+
+
+def summary(values) -> str:
+    q = statistics.quantiles(values, n=100)
+    return f"p50 {q[49]:8.0f} us   p99 {q[98]:8.0f} us   mean {statistics.fmean(values):8.0f} us"
+
+
+async def run(requests: int) -> None:
+    token = jwt.encode({"sub": "bench", "exp": datetime.now(timezone.utc) + timedelta(hours=1)}, main.SECRET_KEY, algorithm=main.ALGORITHM)
+    auth_header = f"Bearer {token}"
+    path = "/v1/defects/"
+
+    print("Request preprocessing (routing + JWT):")
+    legacy = per_call_us(lambda: legacy_preprocess(path, auth_header), 2000)
+    current = per_call_us(lambda: current_preprocess(path, auth_header), 2000)
+    print(f"  before: {legacy:8.1f} us/request")
+    print(f"  after:  {current:8.1f} us/request  ({legacy / current:.0f}x)")
+    print(f"  per-request httpx.AsyncClient (before only): {await client_setup_us(200):8.1f} us/request")
+
+    server = uvicorn.Server(uvicorn.Config(fake_upstream, host="127.0.0.1", port=FAKE_PORT, log_level="warning", lifespan="off"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    try:
+        async with httpx.AsyncClient(base_url=FAKE_URL) as direct, httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://gateway", headers={"Authorization": auth_header}) as gateway:
+            # Прогрев: соединения, кеш токена
+            await latencies(direct, "/defects/", 50)
+            await latencies(gateway, path, 50)
+            direct_us = await latencies(direct, "/defects/", requests)
+            gateway_us = await latencies(gateway, path, requests)
+    finally:
+        server.should_exit = True
+        await server_task
+        await main.close_upstream_clients()
+
+    print(f"\nEnd to end, {requests} sequential GET requests:")
+    print(f"  direct:  {summary(direct_us)}")
+    print(f"  gateway: {summary(gateway_us)}")
+    print(f"  gateway overhead (p50): {statistics.median(gateway_us) - statistics.median(direct_us):.0f} us")
+    print(f"  token cache: {main.token_cache.snapshot()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-request API gateway overhead")
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests))
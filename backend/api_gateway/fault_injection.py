@@ -0,0 +1,195 @@
+"""
+Стенд внедрения отказов для шлюза.
+
+Поднимает локальный поддельный сервис дефектов (uvicorn на 127.0.0.1),
+который по команде отвечает 503, зависает или замедляет часть ответов,
+и гоняет через шлюз (in-process, httpx.ASGITransport) сценарии:
+предохранитель, восстановление через half-open, повторы только для
+идемпотентных методов, бюджет повторов, таймауты, hedging.
+
+    cd backend/api_gateway
+    PYTHONPATH=.. python fault_injection.py
+
+Код возврата 1, если хотя бы одна проверка не прошла.
+"""
+
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+FAKE_PORT = int(os.getenv("FAKE_UPSTREAM_PORT", "18003"))
+FAKE_URL = f"http://127.0.0.1:{FAKE_PORT}"
+
+# Настройки шлюза читаются при импорте main, поэтому задаются заранее
+os.environ.update({
+    "DEFECTS_SERVICE_URL": FAKE_URL,
+    "RATE_LIMIT_ENABLED": "false",
+    "UPSTREAM_TIMEOUT": "0.5",
+    "CIRCUIT_FAILURE_THRESHOLD": "5",
+    "CIRCUIT_RESET_TIMEOUT": "1.0",
+    "RETRY_MAX": "1",
+    "HEDGE_DELAY": "0",
+})
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+from jose import jwt  # noqa: E402
+
+import main  # noqa: E402
+from resilience import CircuitBreaker, RetryBudget  # noqa: E402
+
+
+class Fault:
+    """Поведение поддельного сервиса; меняется сценариями на лету"""
+
+    def __init__(self):
+        self.set("ok")
+
+    def set(self, mode: str, delay: float = 0.0) -> None:
+        self.mode = mode
+        self.delay = delay
+        self.hits = 0
+
+
+fault = Fault()
+
+
+async def fake_upstream(scope, receive, send):
+    fault.hits += 1
+    n = fault.hits
+    status = 200
+    if fault.mode == "error":
+        status = 503
+    elif fault.mode == "flaky" and n % 2 == 0:
+        status = 503
+    elif fault.mode == "slow":
+        await asyncio.sleep(fault.delay)
+    elif fault.mode == "tail" and n % 10 == 0:
+        await asyncio.sleep(fault.delay)
+    body = json.dumps({"n": n}).encode()
+    await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+upstream = main.upstreams["defects"]
+results = []
+
+
+def reset_upstream(**budget) -> None:
+    upstream.breaker = CircuitBreaker(upstream.name, int(os.environ["CIRCUIT_FAILURE_THRESHOLD"]), float(os.environ["CIRCUIT_RESET_TIMEOUT"]))
+    upstream.retry_budget = RetryBudget(**budget)
+    upstream.hedge_delay = None
+
+
+def check(scenario: str, ok: bool, details: str) -> None:
+    results.append((scenario, ok, details))
+    print(f"[{'PASS' if ok else 'FAIL'}] {scenario}: {details}")
+
+
+async def call(gateway: httpx.AsyncClient, method: str = "GET"):
+    started = time.perf_counter()
+    response = await gateway.request(method, "/defects/", json={} if method == "POST" else None)
+    code = response.json().get("error", {}).get("code") if response.status_code >= 400 else None
+    return response.status_code, code, time.perf_counter() - started
+
+
+async def sequential(gateway, count: int, method: str = "GET"):
+    return [await call(gateway, method) for _ in range(count)]
+
+
+def p99(latencies) -> float:
+    return statistics.quantiles(latencies, n=100)[98]
+
+
+async def scenario_outage(gateway) -> None:
+    reset_upstream()
+    fault.set("error")
+    calls = []
+    for _ in range(12):
+        hits = fault.hits
+        _, code, latency = await call(gateway)
+        calls.append((code, latency, fault.hits - hits))
+    state = upstream.breaker.state
+    # Только отказы без обращения к сервису: если первая попытка дошла до сервиса,
+    # а повтор упёрся в открытый предохранитель, в задержку входит пауза перед повтором
+    fast = [latency for code, latency, hits in calls if code == "CIRCUIT_OPEN" and hits == 0]
+    check("outage opens circuit", state == "open" and len(fast) > 0, f"state={state}, upstream hits={fault.hits}, rejected fast={len(fast)}")
+    check("open circuit fails fast", bool(fast) and max(fast) < 0.05, f"max rejection latency={max(fast, default=0) * 1000:.1f} ms")
+
+    fault.set("ok")
+    await asyncio.sleep(upstream.breaker.reset_timeout + 0.1)
+    status, _, _ = await call(gateway)
+    check("half-open probe closes circuit", status == 200 and upstream.breaker.state == "closed", f"probe status={status}, state={upstream.breaker.state}")
+
+
+async def scenario_flaky(gateway) -> None:
+    reset_upstream()
+    fault.set("flaky")
+    gets = await sequential(gateway, 20)
+    posts = await sequential(gateway, 10, "POST")
+    get_failures = sum(1 for status, _, _ in gets if status != 200)
+    post_failures = sum(1 for status, _, _ in posts if status != 200)
+    check("GET retried through flaky upstream", get_failures == 0, f"{get_failures}/20 GET failures")
+    check("POST is never retried", post_failures > 0, f"{post_failures}/10 POST failures reached the client")
+
+
+async def scenario_retry_budget(gateway) -> None:
+    reset_upstream(ratio=0.1, min_per_second=0.0, max_balance=2.0)
+    upstream.breaker.failure_threshold = 10 ** 6
+    fault.set("error")
+    await sequential(gateway, 20)
+    # 20 запросов + не больше 2 (стартовый запас) + 20 * 0.1 повторов
+    limit = 20 + 2 + 2
+    check("retry budget caps retries", fault.hits <= limit, f"upstream hits={fault.hits} (<= {limit}, without budget 40)")
+
+
+async def scenario_timeout(gateway) -> None:
+    reset_upstream()
+    fault.set("slow", delay=3.0)
+    status, code, latency = await call(gateway)
+    check("slow upstream times out", status == 504 and latency < 1.5, f"status={status} {code}, latency={latency:.2f}s instead of 30s")
+
+
+async def scenario_hedging(gateway) -> None:
+    reset_upstream()
+    fault.set("tail", delay=0.3)
+    plain = [latency for _, _, latency in await sequential(gateway, 100)]
+
+    reset_upstream()
+    upstream.hedge_delay = 0.05
+    fault.set("tail", delay=0.3)
+    hedged_calls = await sequential(gateway, 100)
+    hedged = [latency for _, _, latency in hedged_calls]
+    ok = all(status == 200 for status, _, _ in hedged_calls) and p99(hedged) < p99(plain) / 2
+    check("hedged GET cuts tail latency", ok, f"p99 {p99(plain) * 1000:.0f} ms -> {p99(hedged) * 1000:.0f} ms, hedges sent={upstream.retry_budget.spent}")
+
+
+async def run() -> int:
+    server = uvicorn.Server(uvicorn.Config(fake_upstream, host="127.0.0.1", port=FAKE_PORT, log_level="warning", lifespan="off"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    token = jwt.encode({"sub": "fault-injection", "exp": datetime.now(timezone.utc) + timedelta(hours=1)}, main.SECRET_KEY, algorithm=main.ALGORITHM)
+    transport = httpx.ASGITransport(app=main.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://gateway", headers={"Authorization": f"Bearer {token}"}, timeout=10.0) as gateway:
+            for scenario in (scenario_outage, scenario_flaky, scenario_retry_budget, scenario_timeout, scenario_hedging):
+                await scenario(gateway)
+            status = (await gateway.get("/gateway/status")).json()
+            print(json.dumps(status["defects"], indent=2))
+    finally:
+        server.should_exit = True
+        await server_task
+
+    failed = [name for name, ok, _ in results if not ok]
+    print(f"\n{len(results) - len(failed)}/{len(results)} checks passed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run()))
@@ -0,0 +1,339 @@
+"""
+Лента изменений: события defect.* и project.* клиентам в реальном времени.
+
+Шлюз держит по одному соединению /events/live к каждому сервису-
+производителю (shared/event_log.py) и раздаёт события подписчикам:
+
+- GET /v1/feed/stream — Server-Sent Events (EventSource в браузере);
+- /v1/feed/ws — WebSocket, фильтр можно менять сообщением
+  {"projects": [1, 2]} без переподключения.
+
+Фильтр — project_id (список через запятую, без него — все проекты) и
+types (префиксы типов: defect., project.created). Подписчики
+проиндексированы по проекту, поэтому событие проверяется только у тех,
+кому оно нужно. Каждое событие сериализуется один раз на все соединения.
+
+Токен проверяется один раз при подключении (подпись — кешем шлюза,
+отзыв — запросом в auth), поток закрывается по истечении токена.
+Простаивающее соединение — одна корутина и пустая очередь, без опроса.
+
+Back-pressure: у подписчика очередь на FEED_BUFFER_SIZE событий. Запись
+в сокет ждёт, пока клиент примет данные; если клиент не успевает и
+очередь переполнилась, поток закрывается событием overflow. Клиент
+переподключается с Last-Event-ID (EventSource делает это сам) и получает
+пропущенное из кольцевого буфера последних FEED_REPLAY_SIZE событий, а
+если пропуск старше буфера — событие resync: состояние надо перечитать
+через REST, дальше поток идёт как обычно.
+
+id события — позиции всех производителей на момент события
+("defects:120,projects:45"), поэтому по одному Last-Event-ID
+восстанавливается поток из обоих журналов.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from typing import Deque, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from shared.event_consumer import EventLogClient
+from shared.metrics import SERVICE, registry
+
+logger = logging.getLogger(__name__)
+
+FEED_BUFFER_SIZE = int(os.getenv("FEED_BUFFER_SIZE", "256"))
+FEED_REPLAY_SIZE = int(os.getenv("FEED_REPLAY_SIZE", "10000"))
+FEED_HEARTBEAT_INTERVAL = float(os.getenv("FEED_HEARTBEAT_INTERVAL", "20"))
+FEED_MAX_SUBSCRIBERS = int(os.getenv("FEED_MAX_SUBSCRIBERS", "20000"))
+
+FEED_SUBSCRIBERS = registry.gauge("feed_subscribers", "Open change feed connections", ("service", "transport"))
+FEED_EVENTS = registry.counter("feed_events_total", "Events received from producers for the change feed", ("service", "source"))
+FEED_OVERFLOWS = registry.counter("feed_overflows_total", "Feed connections closed because the client could not keep up", ("service",))
+
+
+class FeedItem:
+    """Событие, уже сериализованное для SSE и WebSocket"""
+
+    __slots__ = ("source", "position", "event_type", "project_id", "sse", "text")
+
+    def __init__(self, source: str, position: int, event: dict, cursor: str):
+        self.source = source
+        self.position = position
+        self.event_type = event["event_type"]
+        self.project_id = event["data"].get("project_id")
+        self.text = json.dumps({
+            "id": cursor,
+            "event_type": self.event_type,
+            "data": event["data"],
+            "user_id": event.get("user_id"),
+            "timestamp": event.get("timestamp"),
+        }, ensure_ascii=False)
+        self.sse = f"id: {cursor}\nevent: {self.event_type}\ndata: {self.text}\n\n".encode("utf-8")
+
+
+class Subscription:
+    def __init__(self, projects: Optional[FrozenSet[int]], types: Tuple[str, ...], buffer_size: int, transport: str):
+        self.projects = projects
+        self.types = types
+        self.buffer_size = buffer_size
+        self.transport = transport
+        self.queue: Deque[FeedItem] = deque()
+        self.overflowed = False
+        self.resync = False
+        self._wakeup = asyncio.Event()
+
+    def wants(self, item: FeedItem) -> bool:
+        return not self.types or item.event_type.startswith(self.types)
+
+    def offer(self, item: FeedItem) -> None:
+        if self.overflowed or not self.wants(item):
+            return
+        if len(self.queue) >= self.buffer_size:
+            # Клиент не успевает: не копим дальше, поток закроется, клиент догонит по Last-Event-ID
+            self.overflowed = True
+            self.queue.clear()
+        else:
+            self.queue.append(item)
+        self._wakeup.set()
+
+    async def next_batch(self, timeout: float) -> List[FeedItem]:
+        """Все накопившиеся события; пустой список — за timeout ничего не пришло"""
+        if not self.queue and not self.overflowed:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        self._wakeup.clear()
+        items = list(self.queue)
+        self.queue.clear()
+        return items
+
+
+def parse_cursor(value: Optional[str]) -> Optional[Dict[str, int]]:
+    """"defects:120,projects:45" -> {"defects": 120, "projects": 45}; None, если формат не тот"""
+    if not value:
+        return None
+    cursor = {}
+    for part in value.split(","):
+        source, _, position = part.partition(":")
+        if not position.isdigit():
+            return None
+        cursor[source.strip()] = int(position)
+    return cursor
+
+
+class ChangeFeed:
+    def __init__(self, sources: Dict[str, str], buffer_size: int = FEED_BUFFER_SIZE, replay_size: int = FEED_REPLAY_SIZE, max_subscribers: int = FEED_MAX_SUBSCRIBERS):
+        self.sources = sources
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self.positions: Dict[str, int] = {name: 0 for name in sources}
+        # События с позицией <= floor вытеснены из буфера (или были до старта шлюза)
+        self.floor: Dict[str, int] = {name: 0 for name in sources}
+        self.connected: Dict[str, bool] = {name: False for name in sources}
+        self.recent: Deque[FeedItem] = deque(maxlen=replay_size)
+        self.by_project: Dict[int, Set[Subscription]] = defaultdict(set)
+        self.everything: Set[Subscription] = set()
+        self.count = 0
+        self._tasks: List[asyncio.Task] = []
+
+    # ---------- производители ----------
+
+    async def start(self) -> None:
+        for name, url in self.sources.items():
+            client = EventLogClient(url, "api-gateway", upstream=name)
+            self._tasks.append(asyncio.create_task(self._tail(name, client), name=f"feed-{name}"))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def _tail(self, name: str, client: EventLogClient) -> None:
+        backoff = 0.5
+        started = False
+        while True:
+            try:
+                if not started:
+                    # Историю до старта шлюза лента не раздаёт
+                    self.positions[name] = self.floor[name] = await client.head()
+                    started = True
+                async for event in client.live(after=self.positions[name]):
+                    self.connected[name] = True
+                    backoff = 0.5
+                    self._dispatch(name, event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Change feed source %s disconnected: %s", name, e)
+            self.connected[name] = False
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    def cursor(self) -> str:
+        return ",".join(f"{name}:{position}" for name, position in self.positions.items())
+
+    def _dispatch(self, source: str, event: dict) -> None:
+        position = event["position"]
+        if position <= self.positions[source]:
+            return
+        self.positions[source] = position
+        item = FeedItem(source, position, event, self.cursor())
+        FEED_EVENTS.labels(SERVICE["name"], source).inc()
+        if len(self.recent) == self.recent.maxlen:
+            evicted = self.recent[0]
+            self.floor[evicted.source] = evicted.position
+        self.recent.append(item)
+        for subscription in self.everything:
+            subscription.offer(item)
+        if item.project_id is not None:
+            for subscription in self.by_project.get(item.project_id, ()):
+                subscription.offer(item)
+
+    # ---------- подписчики ----------
+
+    def full(self) -> bool:
+        return self.count >= self.max_subscribers
+
+    def subscribe(self, projects: Optional[Iterable[int]], types: Iterable[str], last_event_id: Optional[str], transport: str) -> Subscription:
+        subscription = Subscription(frozenset(projects) if projects else None, tuple(types), self.buffer_size, transport)
+        cursor = parse_cursor(last_event_id)
+        if cursor is not None:
+            self._replay(subscription, cursor)
+        # Синхронно с _replay: между ними ни одно событие не потеряется и не придёт дважды
+        self._register(subscription)
+        self.count += 1
+        FEED_SUBSCRIBERS.labels(SERVICE["name"], transport).inc()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._unregister(subscription)
+        self.count -= 1
+        FEED_SUBSCRIBERS.labels(SERVICE["name"], subscription.transport).dec()
+
+    def update_projects(self, subscription: Subscription, projects: Optional[Iterable[int]]) -> None:
+        self._unregister(subscription)
+        subscription.projects = frozenset(projects) if projects else None
+        self._register(subscription)
+
+    def _register(self, subscription: Subscription) -> None:
+        if subscription.projects is None:
+            self.everything.add(subscription)
+        else:
+            for project_id in subscription.projects:
+                self.by_project[project_id].add(subscription)
+
+    def _unregister(self, subscription: Subscription) -> None:
+        self.everything.discard(subscription)
+        for project_id in subscription.projects or ():
+            subscribers = self.by_project.get(project_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.by_project[project_id]
+
+    def _replay(self, subscription: Subscription, cursor: Dict[str, int]) -> None:
+        if any(cursor.get(name, 0) < self.floor[name] for name in self.sources):
+            subscription.resync = True
+            return
+        for item in self.recent:
+            if item.position > cursor.get(item.source, 0) and (subscription.projects is None or item.project_id in subscription.projects):
+                subscription.offer(item)
+        if subscription.overflowed:
+            # Пропущено больше, чем помещается в очередь: дешевле перечитать состояние
+            subscription.overflowed = False
+            subscription.queue.clear()
+            subscription.resync = True
+
+    def snapshot(self) -> dict:
+        return {
+            "subscribers": self.count,
+            "projects_watched": len(self.by_project),
+            "positions": dict(self.positions),
+            "connected": dict(self.connected),
+            "replay_buffer": len(self.recent),
+        }
+
+
+# ==================== Транспорты ====================
+
+async def sse_stream(feed: ChangeFeed, projects: Optional[List[int]], types: List[str], last_event_id: Optional[str], expires_at: float):
+    """
+    Тело ответа text/event-stream. Подписка создаётся здесь, а не в
+    обработчике: если клиент ушёл до первой итерации, генератор не
+    запускается и finally не выполнился бы — подписка осталась бы в индексе
+    """
+    subscription = feed.subscribe(projects, types, last_event_id, "sse")
+    try:
+        # retry — пауза EventSource перед переподключением; строка сразу отдаёт заголовки ответа
+        head = b"retry: 3000\n\n"
+        if subscription.resync:
+            head += f"event: resync\ndata: {json.dumps({'id': feed.cursor()})}\n\n".encode("utf-8")
+        yield head
+        while True:
+            timeout = min(FEED_HEARTBEAT_INTERVAL, expires_at - time.time())
+            if timeout <= 0:
+                yield b"event: expired\ndata: {}\n\n"
+                return
+            items = await subscription.next_batch(timeout)
+            if subscription.overflowed:
+                FEED_OVERFLOWS.labels(SERVICE["name"]).inc()
+                yield b"event: overflow\ndata: {}\n\n"
+                return
+            if not items:
+                yield b": ping\n\n"
+                continue
+            yield b"".join(item.sse for item in items)
+    finally:
+        feed.unsubscribe(subscription)
+
+
+def parse_projects(value) -> Optional[List[int]]:
+    """project_id из строки "1,2,3" или списка; ValueError, если не числа"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        value = value.split(",")
+    return [int(item) for item in value]
+
+
+async def websocket_session(feed: ChangeFeed, websocket, projects: Optional[List[int]], types: List[str], last_event_id: Optional[str], expires_at: float) -> None:
+    """Подписка на время сессии; запись событий и чтение команд клиента ({"projects": [...]}) в двух задачах"""
+    subscription = feed.subscribe(projects, types, last_event_id, "websocket")
+
+    async def writer():
+        if subscription.resync:
+            await websocket.send_text(json.dumps({"event_type": "resync", "id": feed.cursor()}))
+        while True:
+            timeout = expires_at - time.time()
+            if timeout <= 0:
+                await websocket.send_text('{"event_type":"expired"}')
+                return
+            items = await subscription.next_batch(min(FEED_HEARTBEAT_INTERVAL, timeout))
+            if subscription.overflowed:
+                FEED_OVERFLOWS.labels(SERVICE["name"]).inc()
+                await websocket.send_text('{"event_type":"overflow"}')
+                return
+            for item in items:
+                await websocket.send_text(item.text)
+
+    async def reader():
+        while True:
+            message = await websocket.receive_json()
+            if isinstance(message, dict) and "projects" in message:
+                try:
+                    feed.update_projects(subscription, parse_projects(message["projects"]))
+                except (TypeError, ValueError):
+                    await websocket.send_text('{"event_type":"error","message":"projects must be a list of integers"}')
+
+    tasks = [asyncio.create_task(writer()), asyncio.create_task(reader())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        feed.unsubscribe(subscription)
@@ -1,56 +1,41 @@
+import math
 import os
 import httpx
-import yaml
-from fastapi import FastAPI, Request, HTTPException, status
+from fastapi import FastAPI, Request, HTTPException, WebSocket, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, Response
-from jose import JWTError, jwt
+from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html, get_swagger_ui_oauth2_redirect_html
+from fastapi.openapi.utils import get_openapi
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.websockets import WebSocketState
+from jose import JWTError
 
-app = FastAPI(title="API Gateway", version="1.0.0")
+import resilience
+from feed import ChangeFeed, parse_projects, sse_stream, websocket_session
+from openapi_cache import OpenAPIDocument, default_openapi_path
+from rate_limit import BucketLimit, RateLimiter, UpstreamLimiter, UpstreamOverloaded, create_bucket_store
+from resilience import CircuitBreaker, CircuitOpenError, RetryBudget, Upstream
+from routes import API_VERSION_PREFIXES, Route, RouteTable, strip_version
+from token_cache import TokenCache, VerifiedToken
+from shared.logging_config import setup_logging
+from shared import tracing
+from shared.observability import setup_observability
+from shared.responses import CompressionMiddleware, FastJSONResponse, negotiate_encoding
+
+# Логирование через очередь: файл logs/api-gateway.log и stdout (shared/logging_config.py)
+setup_logging("api-gateway")
+# /openapi.json и /docs объявлены ниже: схема отдаётся готовыми байтами
+app = FastAPI(title="API Gateway", version="1.0.0", default_response_class=FastJSONResponse, openapi_url=None, docs_url=None, redoc_url=None)
+
+# OpenAPI из docs/openapi.yaml: разбор при старте и при изменении файла, не в запросе (openapi_cache.py)
+def generated_openapi() -> dict:
+    return get_openapi(title=app.title, version=app.version, routes=app.routes)
+
+openapi_document = OpenAPIDocument(default_openapi_path(), generated_openapi)
 
-# Переопределяем OpenAPI документацию кастомным файлом
 def custom_openapi():
-    # ВАЖНО: не кешируем, всегда читаем файл заново для отладки
-    # if app.openapi_schema:
-    #     return app.openapi_schema
-    
-    # Путь к кастомному openapi.yaml
-    # В Docker: /app/docs/openapi.yaml
-    # Локально: ../../docs/openapi.yaml
-    if os.path.exists("/app/docs/openapi.yaml"):
-        openapi_file = "/app/docs/openapi.yaml"
-    else:
-        openapi_file = os.path.join(os.path.dirname(__file__), "..", "..", "docs", "openapi.yaml")
-    
-    print(f"[DEBUG] Загрузка OpenAPI из: {openapi_file}")
-    print(f"[DEBUG] Файл существует: {os.path.exists(openapi_file)}")
-    
-    if os.path.exists(openapi_file):
-        try:
-            with open(openapi_file, "r", encoding="utf-8") as f:
-                openapi_schema = yaml.safe_load(f)
-                print(f"[DEBUG] OpenAPI загружен! Количество путей: {len(openapi_schema.get('paths', {}))}")
-                app.openapi_schema = openapi_schema
-                return app.openapi_schema
-        except Exception as e:
-            print(f"[ERROR] Ошибка загрузки openapi.yaml: {e}")
-            import traceback
-            traceback.print_exc()
-    else:
-        print(f"[ERROR] Файл openapi.yaml не найден по пути: {openapi_file}")
-    
-    # Если файл не найден, используем стандартную генерацию FastAPI
-    print("[WARNING] Используем стандартную генерацию OpenAPI")
-    from fastapi.openapi.utils import get_openapi
-    openapi_schema = get_openapi(
-        title=app.title,
-        version=app.version,
-        routes=app.routes,
-    )
-    app.openapi_schema = openapi_schema
-    return app.openapi_schema
+    return openapi_document.get().schema
 
-# Заменяем метод openapi
 app.openapi = custom_openapi
 
 AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://localhost:8001")
@@ -61,152 +46,410 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
 ALGORITHM = os.getenv("JWT_ALG", "HS256")
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "http://localhost:3000").split(",")
 
+# Лимиты запросов (см. rate_limit.py и docsfme/TRACING_AND_RATE_LIMITING.md)
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory")
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() == "true"
+UPSTREAM_MAX_IN_FLIGHT = int(os.getenv("UPSTREAM_MAX_IN_FLIGHT", "64"))
+UPSTREAM_MAX_QUEUE = int(os.getenv("UPSTREAM_MAX_QUEUE", "128"))
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "2.0"))
+
+# Таймауты, предохранители, повторы и hedging (см. resilience.py)
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "2.0"))
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "10.0"))
+REPORTS_TIMEOUT = float(os.getenv("REPORTS_TIMEOUT", "30.0"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "10.0"))
+RETRY_MAX = int(os.getenv("RETRY_MAX", "1"))
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.2"))
+HEDGE_DELAY = float(os.getenv("HEDGE_DELAY", "0")) or None
+
 app.add_middleware(CORSMiddleware, allow_origins=ALLOWED_ORIGINS, allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", "1024")))
+# Request ID, trace, метрики и access-лог за один проход (shared/observability.py)
+setup_observability(app, "gateway", edge=True)
+
+rate_limiter = RateLimiter(
+    store=create_bucket_store(RATE_LIMIT_STORE),
+    user_limit=BucketLimit.per_minute(float(os.getenv("RATE_LIMIT_USER_PER_MINUTE", "120")), float(os.getenv("RATE_LIMIT_USER_BURST", "60"))),
+    ip_limit=BucketLimit.per_minute(float(os.getenv("RATE_LIMIT_IP_PER_MINUTE", "300")), float(os.getenv("RATE_LIMIT_IP_BURST", "100"))),
+    enabled=RATE_LIMIT_ENABLED,
+)
+
+def make_upstream(name: str, url: str, max_in_flight: int = UPSTREAM_MAX_IN_FLIGHT, timeout: float = UPSTREAM_TIMEOUT) -> Upstream:
+    return Upstream(
+        name=name,
+        url=url,
+        limiter=UpstreamLimiter(name, max_in_flight, UPSTREAM_MAX_QUEUE, UPSTREAM_QUEUE_TIMEOUT),
+        breaker=CircuitBreaker(name, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT),
+        retry_budget=RetryBudget(ratio=RETRY_BUDGET_RATIO),
+        timeout=httpx.Timeout(timeout, connect=UPSTREAM_CONNECT_TIMEOUT),
+        max_retries=RETRY_MAX,
+        hedge_delay=HEDGE_DELAY,
+    )
+
+# Отчёты тяжелее остальных: у reports-service меньше одновременных запросов и дольше таймаут
+upstreams = {
+    "auth": make_upstream("auth", AUTH_SERVICE_URL),
+    "projects": make_upstream("projects", PROJECTS_SERVICE_URL),
+    "defects": make_upstream("defects", DEFECTS_SERVICE_URL),
+    "reports": make_upstream("reports", REPORTS_SERVICE_URL, int(os.getenv("REPORTS_MAX_IN_FLIGHT", "16")), REPORTS_TIMEOUT),
+}
 
-PUBLIC_ROUTES = ["/", "/auth/register", "/auth/token", "/v1/auth/register", "/v1/auth/token", "/docs", "/openapi.json", "/redoc"]
+# Маршруты проксирования (см. routes.py): точные пути и префиксы, cost — стоимость для rate limiter
+route_table = RouteTable([
+    Route("/auth/register", upstreams["auth"], public=True, cost=5.0),
+    Route("/auth/token", upstreams["auth"], public=True, cost=5.0),
+    Route("/auth/", upstreams["auth"]),
+    Route("/projects/", upstreams["projects"]),
+    Route("/defects/search", upstreams["defects"], cost=2.0),
+    Route("/defects/", upstreams["defects"]),
+    Route("/reports/defects/export", upstreams["reports"], cost=10.0),
+    Route("/reports/analytics/", upstreams["reports"], cost=5.0),
+    Route("/reports/", upstreams["reports"]),
+])
 
-async def verify_token(request: Request):
+PROXY_METHODS = ["GET", "HEAD", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"]
+
+token_cache = TokenCache(SECRET_KEY, ALGORITHM, max_size=int(os.getenv("TOKEN_CACHE_SIZE", "10000")))
+
+def verify_token(request: Request) -> VerifiedToken:
     auth_header = request.headers.get("Authorization")
     if not auth_header:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authorization header missing", headers={"WWW-Authenticate": "Bearer"})
-    try:
-        scheme, token = auth_header.split()
-        if scheme.lower() != "bearer":
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid authentication scheme")
-    except ValueError:
+    scheme, _, token = auth_header.partition(" ")
+    if not token or " " in token:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid authorization header format")
+    if scheme.lower() != "bearer":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid authentication scheme")
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
-        return token
+        verified = token_cache.verify(token)
     except JWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
+    if verified is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
+    return verified
+
+# Заголовки запроса, которые пробрасываются в сервисы как есть
+FORWARDED_REQUEST_HEADERS = ["Authorization", "Range", "If-Range", "If-None-Match", "If-Modified-Since"]
+
+# Ответы до этого размера читаются из сервиса целиком, большие — потоком
+BUFFERED_RESPONSE_LIMIT = 256 * 1024
+
+# Hop-by-hop заголовки не должны проходить через прокси (RFC 7230, 6.1)
+HOP_BY_HOP_HEADERS = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te", "trailers", "transfer-encoding", "upgrade"}
+
+def response_headers(response: httpx.Response) -> dict:
+    return {k: v for k, v in response.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+
+def client_ip(request: Request) -> str:
+    if TRUST_FORWARDED_FOR and "X-Forwarded-For" in request.headers:
+        return request.headers["X-Forwarded-For"].split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+def rate_limit_headers(result) -> dict:
+    return {
+        "X-RateLimit-Limit": str(int(result.limit.burst)),
+        "X-RateLimit-Remaining": str(int(result.remaining)),
+    }
+
+def error_response(status_code: int, code: str, message: str, headers: dict = None) -> JSONResponse:
+    return JSONResponse(status_code=status_code, content={"success": False, "error": {"code": code, "message": message}}, headers=headers)
 
-async def proxy_request(request: Request, service_url: str, path: str, require_auth: bool = True):
+def rate_limited_response(result) -> JSONResponse:
+    retry_after = max(1, math.ceil(result.retry_after))
+    return error_response(
+        status.HTTP_429_TOO_MANY_REQUESTS, "RATE_LIMIT_EXCEEDED", f"Rate limit exceeded, retry in {retry_after}s",
+        {**rate_limit_headers(result), "Retry-After": str(retry_after)},
+    )
+
+async def proxy_request(request: Request, route: Route):
     if request.method == "OPTIONS":
         return JSONResponse(status_code=200, content={})
     
-    if require_auth and request.url.path not in PUBLIC_ROUTES:
-        await verify_token(request)
+    # IP проверяется до разбора токена: перебор токенов/паролей тоже упирается в лимит
+    limit_result = await rate_limiter.check_ip(client_ip(request), route.cost)
+    if limit_result is not None and not limit_result.allowed:
+        return rate_limited_response(limit_result)
+    
+    identity = {}
+    if not route.public:
+        verified = verify_token(request)
+        # Сервисы получают проверенную личность и не декодируют JWT повторно (shared/identity.py)
+        identity = verified.headers
+        user_result = await rate_limiter.check_user(verified.subject, route.cost)
+        if user_result is not None:
+            if not user_result.allowed:
+                return rate_limited_response(user_result)
+            limit_result = user_result
     
-    headers = {}
+    upstream = route.upstream
+    try:
+        # Ожидание в очереди к сервису видно в trace отдельным span-ом
+        with tracing.span(f"queue {upstream.name}"):
+            lease = await upstream.limiter.acquire()
+    except UpstreamOverloaded as e:
+        return error_response(status.HTTP_503_SERVICE_UNAVAILABLE, "SERVICE_OVERLOADED", str(e), {"Retry-After": "1"})
+    try:
+        response = await forward_request(request, upstream, strip_version(request.url.path), lease, identity)
+    except BaseException:
+        lease.release()
+        raise
+    if limit_result is not None:
+        response.headers.update(rate_limit_headers(limit_result))
+    return response
+
+async def forward_request(request: Request, upstream: Upstream, path: str, lease, identity: dict):
+    headers = dict(identity)
     content_type = request.headers.get("Content-Type", "")
     if content_type:
         headers["Content-Type"] = content_type
-    if "Authorization" in request.headers:
-        headers["Authorization"] = request.headers["Authorization"]
+    for name in FORWARDED_REQUEST_HEADERS:
+        if name in request.headers:
+            headers[name] = request.headers[name]
+    # Сжатие согласует сервис с клиентом; без заголовка httpx подставил бы свой gzip,
+    # и клиент получил бы сжатое тело, которого не просил
+    headers["Accept-Encoding"] = request.headers.get("Accept-Encoding", "identity")
     
-    target_url = f"{service_url}{path}"
+    target_url = f"{upstream.url}{path}"
     query_params = dict(request.query_params)
     
+    client = upstream.client()
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            if "multipart/form-data" in content_type:
-                form_data = await request.form()
-                files = {}
-                data = {}
-                for key, value in form_data.items():
-                    if hasattr(value, "file"):
-                        files[key] = (value.filename, value.file, value.content_type)
-                    else:
-                        data[key] = value
-                response = await client.request(method=request.method, url=target_url, headers=headers, files=files if files else None, data=data if data else None, params=query_params)
-            else:
-                body = None
-                if request.method in ["POST", "PUT", "PATCH"]:
-                    try:
-                        body = await request.body()
-                    except:
-                        pass
-                response = await client.request(method=request.method, url=target_url, headers=headers, content=body, params=query_params)
-            
-            response_content_type = response.headers.get("content-type", "").lower()
-            if "application/json" in response_content_type:
+        if "multipart/form-data" in content_type:
+            form_data = await request.form()
+            files = {}
+            data = {}
+            for key, value in form_data.items():
+                if hasattr(value, "file"):
+                    files[key] = (value.filename, value.file, value.content_type)
+                else:
+                    data[key] = value
+            # Content-Type с boundary httpx выставит сам
+            headers.pop("Content-Type", None)
+            upstream_request = client.build_request(method=request.method, url=target_url, headers=headers, files=files if files else None, data=data if data else None, params=query_params)
+        else:
+            body = None
+            if request.method in ["POST", "PUT", "PATCH"]:
                 try:
-                    content = response.json()
+                    body = await request.body()
                 except:
-                    content = {"data": response.text}
-                return JSONResponse(content=content, status_code=response.status_code, headers=dict(response.headers))
-            elif "application/vnd.openxmlformats" in response_content_type or "text/csv" in response_content_type:
-                return Response(content=response.content, status_code=response.status_code, headers=dict(response.headers), media_type=response_content_type)
-            else:
-                return Response(content=response.content, status_code=response.status_code, headers=dict(response.headers))
+                    pass
+            upstream_request = client.build_request(method=request.method, url=target_url, headers=headers, content=body, params=query_params)
+        # Ответ читаем потоком: файлы и выгрузки не буферизуются в шлюзе целиком.
+        # Загрузки файлов не повторяем: тело уже прочитано из потока.
+        retryable = request.method in resilience.IDEMPOTENT_METHODS and "multipart/form-data" not in content_type
+        response = await resilience.send(upstream, client, upstream_request, retryable)
+    except CircuitOpenError as e:
+        lease.release()
+        return error_response(status.HTTP_503_SERVICE_UNAVAILABLE, "CIRCUIT_OPEN", str(e), {"Retry-After": str(max(1, math.ceil(e.retry_after)))})
+    except httpx.TimeoutException as e:
+        lease.release()
+        return error_response(status.HTTP_504_GATEWAY_TIMEOUT, "UPSTREAM_TIMEOUT", f"{upstream.name}: {type(e).__name__}")
     except httpx.RequestError as e:
-        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"success": False, "error": {"code": "SERVICE_UNAVAILABLE", "message": str(e)}})
+        lease.release()
+        return error_response(status.HTTP_503_SERVICE_UNAVAILABLE, "SERVICE_UNAVAILABLE", str(e))
+    
+    # Тело отдаётся клиенту байт в байт (aiter_raw — без распаковки): JSON не
+    # разбирается и не кодируется заново, уже сжатый сервисом ответ не пережимается,
+    # content-length/content-encoding сервиса остаются верными.
+    content_length = response.headers.get("content-length")
+    if content_length is not None and content_length.isdigit() and int(content_length) <= BUFFERED_RESPONSE_LIMIT:
+        # Небольшие ответы читаем целиком и сразу освобождаем слот сервиса
+        try:
+            content = b"".join([chunk async for chunk in response.aiter_raw()])
+        finally:
+            await response.aclose()
+            lease.release()
+        return Response(content=content, status_code=response.status_code, headers=response_headers(response))
+    
+    async def close_upstream():
+        lease.release()
+        await response.aclose()
+    
+    async def body():
+        # finally срабатывает и при обрыве соединения клиентом, когда фоновая задача не запускается
+        try:
+            async for chunk in response.aiter_raw():
+                yield chunk
+        finally:
+            lease.release()
+    
+    return StreamingResponse(body(), status_code=response.status_code, headers=response_headers(response), background=BackgroundTask(close_upstream))
 
 @app.get("/", include_in_schema=False)
 async def root():
     return {"message": "API Gateway", "version": "1.0.0"}
 
-@app.api_route("/auth/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"], include_in_schema=False)
-async def auth_proxy(request: Request, path: str = ""):
-    public_auth_paths = ["register", "token"]
-    require_auth = path not in public_auth_paths
-    target_path = f"/auth/{path}" if path else "/auth/"
-    return await proxy_request(request, AUTH_SERVICE_URL, target_path, require_auth=require_auth)
+@app.get("/health", include_in_schema=False)
+async def health():
+    return {"status": "healthy"}
+
+@app.get("/gateway/status", include_in_schema=False)
+async def gateway_status():
+    """Состояние предохранителей, бюджетов повторов и очередей по каждому сервису"""
+    status_by_upstream = {upstream.name: upstream.snapshot() for upstream in upstreams.values()}
+    return {**status_by_upstream, "token_cache": token_cache.snapshot()}
 
-@app.api_route("/projects/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"], include_in_schema=False)
-async def projects_proxy(request: Request, path: str = ""):
-    target_path = f"/projects/{path}" if path else "/projects/"
-    return await proxy_request(request, PROJECTS_SERVICE_URL, target_path, require_auth=True)
+# Страницы документации не меняются — собираем один раз
+SWAGGER_UI_HTML = get_swagger_ui_html(openapi_url="/openapi.json", title=f"{app.title} - Swagger UI", oauth2_redirect_url="/docs/oauth2-redirect").body
+SWAGGER_UI_OAUTH2_REDIRECT_HTML = get_swagger_ui_oauth2_redirect_html().body
+REDOC_HTML = get_redoc_html(openapi_url="/openapi.json", title=f"{app.title} - ReDoc").body
 
-@app.api_route("/defects/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"], include_in_schema=False)
-async def defects_proxy(request: Request, path: str = ""):
-    target_path = f"/defects/{path}" if path else "/defects/"
-    return await proxy_request(request, DEFECTS_SERVICE_URL, target_path, require_auth=True)
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    return any(tag.strip().removeprefix("W/") == etag or tag.strip() == "*" for tag in if_none_match.split(","))
 
-@app.api_route("/reports/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"], include_in_schema=False)
-async def reports_proxy(request: Request, path: str = ""):
-    target_path = f"/reports/{path}" if path else "/reports/"
-    return await proxy_request(request, REPORTS_SERVICE_URL, target_path, require_auth=True)
+@app.get("/openapi.json", include_in_schema=False)
+async def openapi_json(request: Request):
+    """Готовое тело схемы; сжатый вариант выбирается по Accept-Encoding"""
+    version = openapi_document.get()
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""), list(version.encoded))
+    headers = {"ETag": version.etag(encoding), "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("if-none-match", ""), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    if encoding is None:
+        return Response(version.body, media_type="application/json", headers=headers)
+    return Response(version.encoded[encoding], media_type="application/json", headers={**headers, "Content-Encoding": encoding})
 
-@app.get("/health", include_in_schema=False)
-async def health():
-    return {"status": "healthy"}
+@app.get("/docs", include_in_schema=False)
+async def swagger_ui():
+    return HTMLResponse(SWAGGER_UI_HTML)
+
+@app.get("/docs/oauth2-redirect", include_in_schema=False)
+async def swagger_ui_redirect():
+    return HTMLResponse(SWAGGER_UI_OAUTH2_REDIRECT_HTML)
+
+@app.get("/redoc", include_in_schema=False)
+async def redoc():
+    return HTMLResponse(REDOC_HTML)
 
 @app.get("/debug-openapi", include_in_schema=False)
 async def debug_openapi():
-    """Отладочный эндпоинт для проверки загрузки openapi.yaml"""
-    if os.path.exists("/app/docs/openapi.yaml"):
-        openapi_file = "/app/docs/openapi.yaml"
-    else:
-        openapi_file = os.path.join(os.path.dirname(__file__), "..", "..", "docs", "openapi.yaml")
-    
-    return {
-        "openapi_file_path": openapi_file,
-        "file_exists": os.path.exists(openapi_file),
-        "schema_loaded": app.openapi_schema is not None,
-        "paths_count": len(app.openapi_schema.get("paths", {})) if app.openapi_schema else 0,
-        "paths": list(app.openapi_schema.get("paths", {}).keys()) if app.openapi_schema else []
-    }
+    """Какой openapi.yaml загружен, его версия и размеры готовых вариантов"""
+    version = openapi_document.get()
+    return {**openapi_document.snapshot(), "paths": list(version.schema.get("paths", {}).keys())}
+
+@app.on_event("startup")
+async def start_openapi_document():
+    await openapi_document.start()
+
+@app.on_event("shutdown")
+async def stop_openapi_document():
+    await openapi_document.stop()
+
+# ==================== Лента изменений (feed.py) ====================
+
+FEED_ENABLED = os.getenv("FEED_ENABLED", "true").lower() == "true"
+FEED_CONNECT_COST = 5.0
+
+change_feed = ChangeFeed({"defects": DEFECTS_SERVICE_URL, "projects": PROJECTS_SERVICE_URL})
+
+async def authorize_feed(connection, token: str):
+    """
+    (проверенный токен, момент истечения) или ответ с ошибкой.
+    Проверка один раз на подключение: подпись — кешем, отзыв (logout) — в auth-сервисе.
+    """
+    limit_result = await rate_limiter.check_ip(client_ip(connection), FEED_CONNECT_COST)
+    if limit_result is not None and not limit_result.allowed:
+        return rate_limited_response(limit_result)
+    if not token:
+        return error_response(status.HTTP_401_UNAUTHORIZED, "UNAUTHORIZED", "Authorization header or access_token missing")
+    try:
+        verified = token_cache.verify(token)
+    except JWTError:
+        verified = None
+    if verified is None:
+        return error_response(status.HTTP_401_UNAUTHORIZED, "UNAUTHORIZED", "Could not validate credentials")
+    user_result = await rate_limiter.check_user(verified.subject, FEED_CONNECT_COST)
+    if user_result is not None and not user_result.allowed:
+        return rate_limited_response(user_result)
+    if change_feed.full():
+        return error_response(status.HTTP_503_SERVICE_UNAVAILABLE, "FEED_FULL", "Too many change feed connections", {"Retry-After": "5"})
+    try:
+        response = await upstreams["auth"].client().get(f"{AUTH_SERVICE_URL}/auth/users/me", headers={**verified.headers, "Authorization": f"Bearer {token}"})
+    except httpx.RequestError as e:
+        return error_response(status.HTTP_503_SERVICE_UNAVAILABLE, "SERVICE_UNAVAILABLE", str(e))
+    if response.status_code != 200:
+        return error_response(status.HTTP_401_UNAUTHORIZED, "UNAUTHORIZED", "Token revoked or user inactive")
+    return verified, float(verified.claims.get("exp", verified.expires))
+
+def feed_token(connection) -> str:
+    # EventSource и WebSocket в браузере не умеют задавать заголовки — токен можно передать в query
+    scheme, _, token = connection.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        return token
+    return connection.query_params.get("access_token", "")
+
+async def feed_stream(request: Request):
+    """Server-Sent Events: ?project_id=1,2&types=defect.,project.deleted"""
+    if not FEED_ENABLED:
+        return error_response(status.HTTP_404_NOT_FOUND, "NOT_FOUND", "Change feed is disabled")
+    try:
+        projects = parse_projects(request.query_params.get("project_id"))
+    except ValueError:
+        return error_response(status.HTTP_400_BAD_REQUEST, "BAD_REQUEST", "project_id must be a comma-separated list of integers")
+    result = await authorize_feed(request, feed_token(request))
+    if isinstance(result, Response):
+        return result
+    _, expires_at = result
+    types = [t for t in request.query_params.get("types", "").split(",") if t]
+    last_event_id = request.headers.get("Last-Event-ID") or request.query_params.get("last_event_id")
+    return StreamingResponse(
+        sse_stream(change_feed, projects, types, last_event_id, expires_at),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: nginx перед шлюзом не копит поток
+        headers={"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"},
+    )
+
+async def feed_websocket(websocket: WebSocket):
+    """WebSocket: те же параметры в query; {"projects": [...]} меняет фильтр"""
+    if not FEED_ENABLED:
+        await websocket.close(code=1008)
+        return
+    try:
+        projects = parse_projects(websocket.query_params.get("project_id"))
+    except ValueError:
+        await websocket.close(code=1008)
+        return
+    result = await authorize_feed(websocket, feed_token(websocket))
+    if isinstance(result, Response):
+        # До accept закрытие превращается в HTTP 403
+        await websocket.close(code=1008)
+        return
+    _, expires_at = result
+    types = [t for t in websocket.query_params.get("types", "").split(",") if t]
+    await websocket.accept()
+    await websocket_session(change_feed, websocket, projects, types, websocket.query_params.get("last_event_id"), expires_at)
+    # Сессия кончилась на нашей стороне (истёк токен, overflow) — закрываем сами
+    if websocket.client_state == WebSocketState.CONNECTED and websocket.application_state == WebSocketState.CONNECTED:
+        await websocket.close()
+
+for version in ("",) + API_VERSION_PREFIXES:
+    app.add_api_route(f"{version}/feed/stream", feed_stream, methods=["GET"], include_in_schema=False)
+    app.add_api_websocket_route(f"{version}/feed/ws", feed_websocket)
+
+@app.get("/gateway/feed", include_in_schema=False)
+async def feed_status():
+    return change_feed.snapshot()
+
+@app.on_event("startup")
+async def start_change_feed():
+    if FEED_ENABLED:
+        await change_feed.start()
+
+@app.on_event("shutdown")
+async def close_upstream_clients():
+    await change_feed.stop()
+    for upstream in upstreams.values():
+        await upstream.aclose()
 
-# ==================== API v1 (версионирование) ====================
-
-@app.api_route("/v1/auth/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"], include_in_schema=False)
-async def auth_proxy_v1(request: Request, path: str = ""):
-    """API v1: Auth endpoints"""
-    public_auth_paths = ["register", "token"]
-    require_auth = path not in public_auth_paths
-    target_path = f"/auth/{path}" if path else "/auth/"
-    return await proxy_request(request, AUTH_SERVICE_URL, target_path, require_auth=require_auth)
-
-@app.api_route("/v1/projects/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"], include_in_schema=False)
-async def projects_proxy_v1(request: Request, path: str = ""):
-    """API v1: Projects endpoints"""
-    target_path = f"/projects/{path}" if path else "/projects/"
-    return await proxy_request(request, PROJECTS_SERVICE_URL, target_path, require_auth=True)
-
-@app.api_route("/v1/defects/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"], include_in_schema=False)
-async def defects_proxy_v1(request: Request, path: str = ""):
-    """API v1: Defects endpoints"""
-    target_path = f"/defects/{path}" if path else "/defects/"
-    return await proxy_request(request, DEFECTS_SERVICE_URL, target_path, require_auth=True)
-
-@app.api_route("/v1/reports/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"], include_in_schema=False)
-async def reports_proxy_v1(request: Request, path: str = ""):
-    """API v1: Reports endpoints"""
-    target_path = f"/reports/{path}" if path else "/reports/"
-    return await proxy_request(request, REPORTS_SERVICE_URL, target_path, require_auth=True)
+async def gateway_proxy(request: Request):
+    route = route_table.match(request.url.path)
+    if route is None:
+        return error_response(status.HTTP_404_NOT_FOUND, "NOT_FOUND", f"No route for {request.url.path}")
+    return await proxy_request(request, route)
 
+# Один обработчик на все сервисы и версии API (/defects/... и /v1/defects/...)
+for section in route_table.sections():
+    for version in ("",) + API_VERSION_PREFIXES:
+        app.add_api_route(f"{version}/{section}/{{path:path}}", gateway_proxy, methods=PROXY_METHODS, include_in_schema=False)
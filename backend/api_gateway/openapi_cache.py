@@ -0,0 +1,148 @@
+"""
+OpenAPI шлюза из docs/openapi.yaml: разобран, закодирован и сжат заранее.
+
+YAML разбирается при старте и затем только при изменении файла (mtime
+или размер). Проверку раз в OPENAPI_RELOAD_INTERVAL секунд делает
+фоновая задача, разбор идёт в потоке. Запросы /openapi.json получают
+готовые байты: JSON и его gzip/br/zstd-варианты (сжатие на максимальных
+уровнях — один раз на версию файла), с ETag для условных запросов.
+Битый YAML в запросах не виден: остаётся предыдущая версия, ошибка
+пишется в лог. Если файла нет, схема генерируется из маршрутов шлюза.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+import yaml
+
+from shared.responses import BrotliEncoder, FastJSONResponse, GzipEncoder, ZstdEncoder, supported_encodings
+
+logger = logging.getLogger(__name__)
+
+OPENAPI_RELOAD_INTERVAL = float(os.getenv("OPENAPI_RELOAD_INTERVAL", "2.0"))
+
+# Загрузчик на libyaml в разы быстрее чистого Python, если PyYAML собран с ним
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Сжатие один раз на версию файла — уровни выше, чем в CompressionMiddleware
+ENCODERS = {
+    "zstd": lambda: ZstdEncoder(19),
+    "br": lambda: BrotliEncoder(11),
+    "gzip": lambda: GzipEncoder(9),
+}
+
+
+def default_openapi_path() -> str:
+    """В Docker: /app/docs/openapi.yaml, локально: ../../docs/openapi.yaml"""
+    if os.path.exists("/app/docs/openapi.yaml"):
+        return "/app/docs/openapi.yaml"
+    return os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "..", "docs", "openapi.yaml"))
+
+
+@dataclass(frozen=True)
+class OpenAPIVersion:
+    """Одна версия схемы: словарь, тело JSON и его сжатые варианты"""
+    schema: dict
+    body: bytes
+    encoded: Dict[str, bytes]
+    digest: str
+    source: str  # "file" или "generated"
+    stamp: Optional[Tuple[int, int]]  # (mtime_ns, size) файла
+
+    def etag(self, encoding: Optional[str] = None) -> str:
+        """Сжатые варианты — другие байты, поэтому у каждого свой сильный ETag"""
+        return f'"{self.digest}-{encoding}"' if encoding else f'"{self.digest}"'
+
+
+class OpenAPIDocument:
+    def __init__(self, path: str, fallback: Callable[[], dict], reload_interval: float = OPENAPI_RELOAD_INTERVAL):
+        self.path = path
+        self.fallback = fallback
+        self.reload_interval = reload_interval
+        self.current: Optional[OpenAPIVersion] = None
+        self.reloads = 0
+        self.last_error: Optional[str] = None
+        self._failed_stamp: Optional[Tuple[int, int]] = None  # битая версия файла, повторно не разбираем
+        self._task: Optional[asyncio.Task] = None
+
+    def _stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _build(self, schema: dict, source: str, stamp: Optional[Tuple[int, int]]) -> OpenAPIVersion:
+        body = FastJSONResponse(schema).body
+        encoded = {name: ENCODERS[name]().finish(body) for name in supported_encodings()}
+        return OpenAPIVersion(schema=schema, body=body, encoded=encoded, digest=hashlib.sha256(body).hexdigest()[:32], source=source, stamp=stamp)
+
+    def changed(self) -> bool:
+        stamp = self._stamp()
+        return self.current is None or (stamp != self.current.stamp and (stamp is None or stamp != self._failed_stamp))
+
+    def load(self) -> OpenAPIVersion:
+        """Разбирает файл, если он изменился (или схема ещё не загружена); блокирующий вызов"""
+        if not self.changed():
+            return self.current
+        stamp = self._stamp()
+        if stamp is None:
+            if self.current is None or self.current.source != "generated":
+                logger.warning("OpenAPI file %s not found, using generated schema", self.path)
+                self.current = self._build(self.fallback(), "generated", None)
+            return self.current
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                schema = yaml.load(f, Loader=YAML_LOADER)
+            if not isinstance(schema, dict):
+                raise ValueError("top level of openapi.yaml is not a mapping")
+        except Exception as e:
+            self.last_error = str(e)
+            self._failed_stamp = stamp
+            logger.error("Failed to load %s: %s", self.path, e)
+            if self.current is None:
+                self.current = self._build(self.fallback(), "generated", None)
+            return self.current
+        self.current = self._build(schema, "file", stamp)
+        self.last_error = None
+        self.reloads += 1
+        logger.info("Loaded OpenAPI from %s: %s paths, %s bytes", self.path, len(schema.get("paths", {})), len(self.current.body))
+        return self.current
+
+    async def start(self) -> None:
+        await asyncio.to_thread(self.load)
+        if self.reload_interval > 0:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            # stat дешёвый — в event loop; разбор и сжатие — в потоке
+            if self.changed():
+                await asyncio.to_thread(self.load)
+
+    def get(self) -> OpenAPIVersion:
+        return self.current if self.current is not None else self.load()
+
+    def snapshot(self) -> dict:
+        version = self.current
+        return {
+            "path": self.path,
+            "file_exists": self._stamp() is not None,
+            "source": version.source if version else None,
+            "etag": version.etag() if version else None,
+            "bytes": {"identity": len(version.body), **{name: len(data) for name, data in version.encoded.items()}} if version else {},
+            "paths_count": len(version.schema.get("paths", {})) if version else 0,
+            "reloads": self.reloads,
+            "last_error": self.last_error,
+        }
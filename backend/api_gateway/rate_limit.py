@@ -0,0 +1,229 @@
+"""
+Ограничение нагрузки в шлюзе.
+
+1. Token bucket на пользователя (sub из JWT) и на IP-адрес клиента.
+   Запрос списывает из корзины "стоимость" маршрута (Route.cost):
+   аналитика и выгрузки дороже чтения списка. Пустая корзина — 429
+   с Retry-After.
+2. Ограничение одновременных запросов к каждому сервису (UpstreamLimiter).
+   Сверх лимита запрос ждёт в очереди ограниченной длины; если очередь
+   полна или ожидание затянулось — сразу 503, сервис не перегружается.
+
+Состояние корзин хранится в сменном хранилище: MemoryBucketStore (в памяти
+процесса) или SQLiteBucketStore (файл на общем томе), чтобы несколько
+реплик шлюза считали лимиты вместе. Лимит одновременных запросов —
+свой у каждой реплики.
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class BucketLimit:
+    rate: float   # токенов в секунду
+    burst: float  # ёмкость корзины
+
+    @classmethod
+    def per_minute(cls, per_minute: float, burst: float) -> "BucketLimit":
+        return cls(rate=per_minute / 60.0, burst=burst)
+
+
+@dataclass
+class BucketResult:
+    allowed: bool
+    remaining: float
+    retry_after: float
+    limit: BucketLimit
+
+
+def take_tokens(tokens: float, updated: float, now: float, cost: float, limit: BucketLimit) -> Tuple[bool, float, float]:
+    """Пополняет корзину за прошедшее время и списывает cost: (allowed, tokens, retry_after)"""
+    tokens = min(limit.burst, tokens + max(0.0, now - updated) * limit.rate)
+    cost = min(cost, limit.burst)
+    if tokens >= cost:
+        return True, tokens - cost, 0.0
+    return False, tokens, (cost - tokens) / limit.rate
+
+
+class MemoryBucketStore:
+    """Корзины в памяти процесса; при переполнении вытесняются давно не использованные ключи"""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, cost: float, limit: BucketLimit) -> BucketResult:
+        # Без await внутри — в одном event loop атомарно и без блокировок
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (limit.burst, now))
+        allowed, tokens, retry_after = take_tokens(tokens, updated, now, cost, limit)
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return BucketResult(allowed, tokens, retry_after, limit)
+
+
+class SQLiteBucketStore:
+    """
+    Корзины в SQLite-файле, общем для реплик шлюза (локальная замена
+    Redis и т.п.). Чтение и запись корзины — одна транзакция BEGIN IMMEDIATE,
+    поэтому реплики не списывают токены поверх друг друга.
+    """
+
+    CLEANUP_EVERY = 10_000
+    STALE_AFTER = 3600.0
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=1.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS rate_buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+        self._lock = threading.Lock()
+        self._calls = 0
+
+    async def take(self, key: str, cost: float, limit: BucketLimit) -> BucketResult:
+        return await asyncio.to_thread(self._take, key, cost, limit)
+
+    def _take(self, key: str, cost: float, limit: BucketLimit) -> BucketResult:
+        # Время стенное, а не monotonic: корзину читают разные процессы
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+                tokens, updated = row if row else (limit.burst, now)
+                allowed, tokens, retry_after = take_tokens(tokens, updated, now, cost, limit)
+                self._conn.execute(
+                    "INSERT INTO rate_buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                    (key, tokens, now),
+                )
+                self._calls += 1
+                if self._calls % self.CLEANUP_EVERY == 0:
+                    self._conn.execute("DELETE FROM rate_buckets WHERE updated < ?", (now - self.STALE_AFTER,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return BucketResult(allowed, tokens, retry_after, limit)
+
+
+def create_bucket_store(url: str):
+    """RATE_LIMIT_STORE: "memory" или "sqlite:///путь/к/файлу.db" """
+    if url.startswith("sqlite:///"):
+        return SQLiteBucketStore(url[len("sqlite:///"):])
+    if url != "memory":
+        raise ValueError(f"Unknown rate limit store: {url}")
+    return MemoryBucketStore()
+
+
+class RateLimiter:
+    def __init__(self, store, user_limit: BucketLimit, ip_limit: BucketLimit, enabled: bool = True):
+        self.store = store
+        self.user_limit = user_limit
+        self.ip_limit = ip_limit
+        self.enabled = enabled
+
+    async def _take(self, key: str, cost: float, limit: BucketLimit) -> Optional[BucketResult]:
+        if not self.enabled:
+            return None
+        try:
+            return await self.store.take(key, cost, limit)
+        except Exception as e:
+            # Недоступное хранилище лимитов не должно останавливать весь трафик
+            logger.warning(f"Rate limit store error, request allowed: {e}")
+            return None
+
+    async def check_ip(self, ip: str, cost: float) -> Optional[BucketResult]:
+        return await self._take(f"ip:{ip}", cost, self.ip_limit)
+
+    async def check_user(self, user: str, cost: float) -> Optional[BucketResult]:
+        return await self._take(f"user:{user}", cost, self.user_limit)
+
+
+class UpstreamOverloaded(Exception):
+    pass
+
+
+class Lease:
+    """Занятый слот сервиса; release() можно вызывать несколько раз"""
+
+    def __init__(self, limiter: "UpstreamLimiter"):
+        self._limiter = limiter
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._limiter._release()
+
+
+class UpstreamLimiter:
+    """Не более max_in_flight запросов к сервису, до max_queue ждущих (FIFO)"""
+
+    def __init__(self, name: str, max_in_flight: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.rejected = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    async def acquire(self) -> Lease:
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            return Lease(self)
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise UpstreamOverloaded(f"{self.name}: too many requests in flight")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # Слот уже передан нам, но запрос уходит — отдаём слот следующему
+                self._release()
+            else:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected += 1
+                raise UpstreamOverloaded(f"{self.name}: queue wait timed out") from None
+            raise
+        return Lease(self)
+
+    def _release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # Слот переходит ожидающему, in_flight не меняется
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def snapshot(self) -> Dict[str, int]:
+        return {
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+        }
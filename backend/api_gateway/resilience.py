@@ -0,0 +1,267 @@
+"""
+Устойчивость шлюза к медленным и падающим сервисам.
+
+- CircuitBreaker: после серии ошибок сервиса запросы к нему сразу
+  отклоняются (503), не дожидаясь таймаута. Через reset_timeout пропускается
+  пробный запрос (half-open): успех закрывает цепь, ошибка снова открывает.
+- Повторы только для идемпотентных методов и только в пределах
+  RetryBudget: повторов не больше заданной доли от обычного трафика,
+  чтобы повторы не добивали и так перегруженный сервис.
+- Hedging для GET: если ответа нет дольше hedge_delay, отправляется
+  второй такой же запрос, берётся первый успешный ответ.
+
+Ошибкой сервиса считаются сетевые ошибки, таймауты и ответы 5xx.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+import httpx
+
+from rate_limit import UpstreamLimiter
+from shared.metrics import InstrumentedTransport
+
+logger = logging.getLogger(__name__)
+
+# RFC 9110, 9.2.2: повтор такого запроса не меняет результат
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRY_STATUSES = {502, 503, 504}
+RETRY_BACKOFF = 0.05
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name}: circuit breaker is open")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 10.0, half_open_probes: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self.rejected = 0
+        self.times_opened = 0
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if self.retry_after() > 0:
+                self.rejected += 1
+                return False
+            self.state = self.HALF_OPEN
+            self.probes_in_flight = 0
+            logger.info(f"Circuit {self.name}: half-open, probing")
+        if self.state == self.HALF_OPEN:
+            if self.probes_in_flight >= self.half_open_probes:
+                self.rejected += 1
+                return False
+            self.probes_in_flight += 1
+        return True
+
+    def record_success(self) -> None:
+        if self.state == self.HALF_OPEN:
+            logger.info(f"Circuit {self.name}: closed")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold):
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.times_opened += 1
+            logger.warning(f"Circuit {self.name}: open after {self.consecutive_failures} failures")
+
+    def record_cancel(self) -> None:
+        # Пробный запрос отменён (проигравший hedge, обрыв клиента) — слот пробы свободен
+        if self.state == self.HALF_OPEN and self.probes_in_flight > 0:
+            self.probes_in_flight -= 1
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_after": round(self.retry_after(), 2) if self.state == self.OPEN else 0.0,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+class RetryBudget:
+    """
+    Каждый запрос пополняет бюджет на ratio повтора, плюс min_per_second
+    повторов в секунду пополняются всегда (для редкого трафика).
+    Повтор или hedge расходует одну единицу бюджета.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 1.0, max_balance: float = 20.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_balance = max_balance
+        self.balance = max_balance
+        self.updated = time.monotonic()
+        self.spent = 0
+        self.exhausted = 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.balance = min(self.max_balance, self.balance + (now - self.updated) * self.min_per_second)
+        self.updated = now
+
+    def deposit(self) -> None:
+        self._refill()
+        self.balance = min(self.max_balance, self.balance + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        self._refill()
+        if self.balance >= 1.0:
+            self.balance -= 1.0
+            self.spent += 1
+            return True
+        self.exhausted += 1
+        return False
+
+    def snapshot(self) -> dict:
+        self._refill()
+        return {"balance": round(self.balance, 2), "spent": self.spent, "exhausted": self.exhausted}
+
+
+@dataclass
+class Upstream:
+    """Сервис за шлюзом и все его политики"""
+    name: str
+    url: str
+    limiter: UpstreamLimiter
+    breaker: CircuitBreaker
+    retry_budget: RetryBudget
+    timeout: httpx.Timeout
+    max_retries: int = 1
+    hedge_delay: Optional[float] = None
+    _client: Optional[httpx.AsyncClient] = field(default=None, repr=False)
+
+    def client(self) -> httpx.AsyncClient:
+        # Один клиент на сервис: соединения переиспользуются между запросами (keep-alive).
+        # Общее число соединений и так ограничено UpstreamLimiter.
+        if self._client is None:
+            limits = httpx.Limits(max_connections=None, max_keepalive_connections=self.limiter.max_in_flight)
+            transport = InstrumentedTransport(self.name, httpx.AsyncHTTPTransport(limits=limits))
+            self._client = httpx.AsyncClient(timeout=self.timeout, transport=transport)
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def snapshot(self) -> dict:
+        return {
+            "url": self.url,
+            "circuit": self.breaker.snapshot(),
+            "retry_budget": self.retry_budget.snapshot(),
+            "concurrency": self.limiter.snapshot(),
+            "hedge_delay": self.hedge_delay,
+        }
+
+
+def is_failure(response: httpx.Response) -> bool:
+    return response.status_code >= 500
+
+
+async def _attempt(upstream: Upstream, client: httpx.AsyncClient, request: httpx.Request) -> httpx.Response:
+    try:
+        response = await client.send(request, stream=True)
+    except httpx.RequestError:
+        upstream.breaker.record_failure()
+        raise
+    except asyncio.CancelledError:
+        upstream.breaker.record_cancel()
+        raise
+    if is_failure(response):
+        upstream.breaker.record_failure()
+    else:
+        upstream.breaker.record_success()
+    return response
+
+
+async def _discard(task: asyncio.Task) -> None:
+    if not task.done():
+        task.cancel()
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
+    elif not task.cancelled() and task.exception() is None:
+        await task.result().aclose()
+
+
+async def _hedged(upstream: Upstream, client: httpx.AsyncClient, request: httpx.Request) -> httpx.Response:
+    tasks = [asyncio.create_task(_attempt(upstream, client, request))]
+    winner = None
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=upstream.hedge_delay)
+        if not done and upstream.breaker.state == CircuitBreaker.CLOSED and upstream.retry_budget.try_withdraw():
+            tasks.append(asyncio.create_task(_attempt(upstream, client, request)))
+        pending = set(tasks)
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None and not is_failure(task.result()):
+                    winner = task
+                    break
+        if winner is None:
+            # Все попытки неудачны — отдаём результат основного запроса (5xx или исключение)
+            winner = tasks[0]
+        return winner.result()
+    finally:
+        # Проигравшие запросы отменяются, уже полученные ответы закрываются
+        for task in tasks:
+            if task is not winner:
+                await _discard(task)
+
+
+async def send(upstream: Upstream, client: httpx.AsyncClient, request: httpx.Request, retryable: bool) -> httpx.Response:
+    """
+    Отправляет запрос с учётом предохранителя, повторов и hedging.
+    Возвращает потоковый ответ (возможно, 5xx после исчерпания повторов)
+    или поднимает httpx.RequestError / CircuitOpenError.
+    """
+    upstream.retry_budget.deposit()
+    hedge = retryable and upstream.hedge_delay is not None and request.method == "GET"
+    attempt = 0
+    while True:
+        if not upstream.breaker.allow():
+            raise CircuitOpenError(upstream.name, upstream.breaker.retry_after())
+        error = None
+        response = None
+        try:
+            response = await (_hedged(upstream, client, request) if hedge else _attempt(upstream, client, request))
+        except httpx.RequestError as e:
+            error = e
+        if response is not None and response.status_code not in RETRY_STATUSES:
+            return response
+
+        attempt += 1
+        if not retryable or attempt > upstream.max_retries or not upstream.retry_budget.try_withdraw():
+            if response is not None:
+                return response
+            raise error
+        if response is not None:
+            await response.aclose()
+        # Полный jitter, чтобы повторы разных запросов не приходили пачкой
+        await asyncio.sleep(random.uniform(0, RETRY_BACKOFF * 2 ** attempt))
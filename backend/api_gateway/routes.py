@@ -0,0 +1,63 @@
+"""
+Таблица маршрутов шлюза: путь → сервис, нужна ли авторизация, стоимость
+запроса для rate limiter.
+
+Таблица собирается один раз при старте. Путь без "/" на конце — точное
+совпадение, с "/" — префикс (выигрывает самый длинный). Версионный
+префикс (/v1) отрезается до поиска: /v1/defects/ и /defects/ — один маршрут.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+from resilience import Upstream
+
+API_VERSION_PREFIXES = ("/v1",)
+
+
+@dataclass(frozen=True)
+class Route:
+    path: str
+    upstream: Upstream
+    public: bool = False
+    cost: float = 1.0
+
+
+def strip_version(path: str) -> str:
+    for prefix in API_VERSION_PREFIXES:
+        if path.startswith(prefix + "/"):
+            return path[len(prefix):]
+    return path
+
+
+def first_segment(path: str) -> str:
+    return path.split("/", 2)[1] if path.count("/") >= 1 else ""
+
+
+class RouteTable:
+    def __init__(self, routes: Iterable[Route]):
+        self.routes = list(routes)
+        self._exact: Dict[str, Route] = {}
+        self._prefixes: Dict[str, List[Route]] = {}
+        for route in self.routes:
+            if route.path.endswith("/"):
+                self._prefixes.setdefault(first_segment(route.path), []).append(route)
+            else:
+                self._exact[route.path] = route
+        for group in self._prefixes.values():
+            group.sort(key=lambda route: -len(route.path))
+
+    def match(self, path: str) -> Optional[Route]:
+        """Маршрут для пути запроса (с версией или без); путь к сервису — strip_version(path)"""
+        path = strip_version(path)
+        route = self._exact.get(path)
+        if route is not None:
+            return route
+        for route in self._prefixes.get(first_segment(path), ()):
+            if path.startswith(route.path):
+                return route
+        return None
+
+    def sections(self) -> List[str]:
+        """Первые сегменты путей, для которых шлюз регистрирует обработчики"""
+        return sorted({first_segment(route.path) for route in self.routes})
@@ -0,0 +1,71 @@
+"""
+LRU-кеш проверенных JWT.
+
+Один и тот же токен приходит в шлюз с каждым запросом клиента, а разбор
+и проверка подписи (jwt.decode) — самая дорогая часть обработки запроса
+в шлюзе. Результат проверки кешируется по SHA-256 токена до его exp
+(но не дольше max_ttl), вместе с готовыми заголовками личности для
+сервисов (shared/identity.py).
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from jose import jwt
+
+from shared.identity import identity_headers
+
+
+@dataclass(frozen=True)
+class VerifiedToken:
+    claims: dict
+    subject: str
+    expires: float
+    headers: dict
+
+
+class TokenCache:
+    def __init__(self, secret: str, algorithm: str, max_size: int = 10_000, max_ttl: float = 300.0):
+        self.secret = secret
+        self.algorithm = algorithm
+        self.max_size = max_size
+        self.max_ttl = max_ttl
+        self._entries: "OrderedDict[bytes, VerifiedToken]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def verify(self, token: str) -> Optional[VerifiedToken]:
+        """
+        Проверенный токен или None, если в нём нет sub.
+        Неверная подпись или истёкший токен — JWTError (в кеш не попадают).
+        """
+        key = hashlib.sha256(token.encode()).digest()
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.expires > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            del self._entries[key]
+
+        self.misses += 1
+        claims = jwt.decode(token, self.secret, algorithms=[self.algorithm])
+        subject = claims.get("sub")
+        if subject is None:
+            return None
+        subject = str(subject)
+        exp = claims.get("exp")
+        expires = min(float(exp), now + self.max_ttl) if exp is not None else now + self.max_ttl
+        # Сервисы проверяют подпись до настоящего exp токена, а не до истечения записи в кеше
+        entry = VerifiedToken(claims, subject, expires, identity_headers(subject, int(exp if exp is not None else expires), token, self.secret))
+        self._entries[key] = entry
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return entry
+
+    def snapshot(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
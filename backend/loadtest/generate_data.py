@@ -0,0 +1,364 @@
+"""
+Генератор синтетических данных большого объёма прямо в БД сервисов.
+
+Пишет в <out>/auth.db, projects.db и defects.db (те же имена, что у
+стенда loadtest/stack.py) пачками executemany в одной транзакции на
+сервис, минуя API. Схема берётся из моделей самих сервисов, поэтому
+не расходится с тем, что создают сервисы при старте.
+
+Распределения:
+- пользователи: 1% admin, 10% manager, 50% engineer, остальные observer;
+  пароль у всех один (PASSWORD), хеш считается один раз;
+- проекты: размер по Ципфу — несколько крупных проектов и длинный хвост;
+- дефекты: поток создания растёт к концу периода; чем старше дефект,
+  тем вероятнее он закрыт; приоритеты 25/45/22/8%; срок у 60%, у
+  критических короче; исполнитель у большинства взятых в работу;
+- история статусов: переходы от "Новая" до текущего статуса с
+  длительностями, как их пишет crud.update_defect;
+- комментарии: экспоненциальное число на дефект (среднее
+  --comments-per-defect), после создания дефекта;
+- вложения: только метаданные и записи blob-ов (файлов на диске нет),
+  часть вложений ссылается на общий blob.
+
+Результат детерминирован: одинаковые --seed, --end-date и размеры дают
+байт в байт те же строки. После вставки строится FTS-индекс поиска, так
+что сервис дефектов стартует без перестройки; read model отчётов
+загружается из /events/snapshot при первом запуске.
+
+    cd backend
+    python -m loadtest.generate_data --out /tmp/scale-1m --defects 1000000 --seed 42
+    python -m loadtest.run_loadtest --data /tmp/scale-1m --concurrency 32 --duration 60
+"""
+
+import argparse
+import importlib
+import json
+import math
+import os
+import random
+import sys
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import accumulate
+from typing import Dict, List, Sequence
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PASSWORD = "datagen-password"
+
+
+def cumulative(choices: Sequence[tuple]) -> tuple:
+    return [name for name, _ in choices], list(accumulate(weight for _, weight in choices))
+
+
+def weighted(rng: random.Random, table: tuple) -> str:
+    names, cum_weights = table
+    return names[bisect_left(cum_weights, rng.random() * cum_weights[-1])]
+
+
+# Распределения: (значения, накопленные веса)
+ROLES = cumulative([("admin", 1), ("manager", 10), ("engineer", 50), ("observer", 39)])
+PRIORITIES = cumulative([("Низкий", 25), ("Средний", 45), ("Высокий", 22), ("Критический", 8)])
+OPEN_STATUSES = cumulative([("Новая", 35), ("В работе", 45), ("На проверке", 20)])
+# Путь дефекта по статусам до текущего
+STATUS_PATHS = {
+    "Новая": ["Новая"],
+    "В работе": ["Новая", "В работе"],
+    "На проверке": ["Новая", "В работе", "На проверке"],
+    "Закрыта": ["Новая", "В работе", "На проверке", "Закрыта"],
+    "Отменена": ["Новая", "Отменена"],
+}
+# Срок исправления в днях по приоритету
+DUE_DAYS = {"Низкий": (14, 90), "Средний": (7, 45), "Высокий": (3, 21), "Критический": (1, 5)}
+
+COMPONENTS = ["Авторизация", "Личный кабинет", "Отчёты", "Экспорт", "Платежи", "Поиск", "Уведомления", "Загрузка файлов", "API", "Мобильная версия", "Дашборд", "Интеграция 1С"]
+SYMPTOMS = ["падает с ошибкой 500", "не сохраняет изменения", "долго загружается", "неверно считает итог", "пустой экран", "дублирует записи", "ломается вёрстка", "не приходит письмо", "таймаут запроса", "неверная кодировка"]
+ACTIONS = ["после входа", "при сохранении формы", "при выгрузке в Excel", "на больших проектах", "в Safari", "после обновления", "при смене роли", "при повторной отправке", "на медленном соединении", "с пустым фильтром"]
+SENTENCES = [
+    "Воспроизводится стабильно на стенде.",
+    "В логах сервиса ошибка соединения с базой.",
+    "Ожидалось, что данные сохранятся без перезагрузки страницы.",
+    "Проблема появилась после последнего релиза.",
+    "Затронуты только пользователи с ролью наблюдателя.",
+    "Шаги: открыть проект, перейти к дефектам, применить фильтр.",
+    "Приложен скриншот и HAR-файл.",
+    "На проде не проверялось.",
+    "Клиент жалуется уже вторую неделю.",
+    "Обходной путь: обновить страницу.",
+]
+COMMENTS = [
+    "Взял в работу.", "Не воспроизводится, нужны подробности.", "Исправлено, проверьте на стенде.",
+    "Проверил — ошибка осталась.", "Дубликат, закрываю.", "Добавил логи.", "Нужна консультация аналитика.",
+    "Поднял приоритет по просьбе заказчика.", "Исправление в следующем релизе.", "Подтверждаю, воспроизводится.",
+]
+FILES = [("screenshot.png", "image/png", 250_000), ("log.txt", "text/plain", 40_000), ("report.pdf", "application/pdf", 600_000), ("har.json", "application/json", 1_200_000), ("video.mp4", "video/mp4", 8_000_000)]
+
+
+def fmt(value: datetime) -> str:
+    """DateTime в том виде, в каком его хранит SQLAlchemy в SQLite"""
+    return value.isoformat(" ", "microseconds")
+
+
+@contextmanager
+def service_modules(directory: str, database_url: str):
+    """Импорт модулей сервиса (database, models, ...) с заданным DATABASE_URL; после выхода они выгружаются"""
+    path = os.path.join(BACKEND_DIR, directory)
+    os.environ["DATABASE_URL"] = database_url
+    sys.path.insert(0, path)
+    try:
+        yield importlib.import_module
+    finally:
+        sys.path.remove(path)
+        for name, module in list(sys.modules.items()):
+            if (getattr(module, "__file__", None) or "").startswith(path + os.sep):
+                del sys.modules[name]
+
+
+class BulkWriter:
+    """Копит строки по таблицам и сбрасывает их executemany пачками по batch_size"""
+
+    def __init__(self, engine, tables: Dict[str, tuple], batch_size: int):
+        self.connection = engine.raw_connection()
+        cursor = self.connection.cursor()
+        # Загрузка одноразовая: без журнала и fsync, при сбое файл просто генерируется заново
+        cursor.execute("PRAGMA journal_mode = OFF")
+        cursor.execute("PRAGMA synchronous = OFF")
+        cursor.execute("PRAGMA cache_size = -262144")
+        self.sql = {}
+        for name, (table, columns) in tables.items():
+            unknown = set(columns) - set(table.c.keys())
+            if unknown:
+                raise RuntimeError(f"{table.name}: no columns {sorted(unknown)} in the service model")
+            self.sql[name] = f"INSERT INTO {table.name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        self.rows: Dict[str, list] = {name: [] for name in tables}
+        self.counts: Dict[str, int] = {name: 0 for name in tables}
+        self.batch_size = batch_size
+
+    def add(self, name: str, row: tuple) -> None:
+        rows = self.rows[name]
+        rows.append(row)
+        if len(rows) >= self.batch_size:
+            self.flush(name)
+
+    def flush(self, name: str) -> None:
+        rows = self.rows[name]
+        if rows:
+            self.connection.cursor().executemany(self.sql[name], rows)
+            self.counts[name] += len(rows)
+            rows.clear()
+
+    def close(self) -> Dict[str, int]:
+        for name in self.rows:
+            self.flush(name)
+        self.connection.commit()
+        self.connection.close()
+        return self.counts
+
+
+class Generator:
+    def __init__(self, args):
+        self.args = args
+        self.end = datetime.strptime(args.end_date, "%Y-%m-%d")
+        self.start = self.end - timedelta(days=args.days)
+        self.users = args.users or max(200, args.defects // 200)
+        self.projects = args.projects or max(10, args.defects // 2000)
+        self.roles: List[str] = []
+
+    def url(self, name: str) -> str:
+        return f"sqlite:///{os.path.join(self.args.out, name + '.db')}"
+
+    def rng(self, name: str) -> random.Random:
+        # Свой генератор на таблицу: изменение одной не сдвигает остальные
+        return random.Random(f"{self.args.seed}:{name}")
+
+    def users_of(self, role: str) -> List[int]:
+        return [i + 1 for i, r in enumerate(self.roles) if r == role]
+
+    def generate_auth(self) -> Dict[str, int]:
+        rng = self.rng("users")
+        self.roles = [weighted(rng, ROLES) for _ in range(self.users)]
+        # Менеджеров хватает на нагрузочный тест с --login-users одновременных пользователей
+        for i in range(min(self.args.login_users, self.users)):
+            self.roles[i] = "manager"
+        with service_modules("service_auth", self.url("auth")) as load:
+            database, models, crud = load("database"), load("models"), load("crud")
+            database.Base.metadata.create_all(bind=database.engine)
+            hashed = crud.get_password_hash(PASSWORD)
+            writer = BulkWriter(database.engine, {"users": (models.User.__table__, ("id", "username", "email", "hashed_password", "role", "is_active", "created_at"))}, self.args.batch_size)
+            span = (self.end - self.start).total_seconds()
+            for i, role in enumerate(self.roles):
+                username = f"user{i + 1}"
+                created = self.start + timedelta(seconds=span * 0.5 * i / self.users)
+                writer.add("users", (i + 1, username, f"{username}@example.com", hashed, role, 1, fmt(created)))
+            return writer.close()
+
+    def generate_projects(self) -> Dict[str, int]:
+        rng = self.rng("projects")
+        owners = self.users_of("manager") + self.users_of("admin")
+        with service_modules("service_projects", self.url("projects")) as load:
+            database, models = load("database"), load("models")
+            database.Base.metadata.create_all(bind=database.engine)
+            writer = BulkWriter(database.engine, {"projects": (models.Project.__table__, ("id", "title", "description", "owner_id", "created_at"))}, self.args.batch_size)
+            span = (self.end - self.start).total_seconds()
+            for i in range(self.projects):
+                created = self.start + timedelta(seconds=rng.random() * span * 0.3)
+                title = f"{rng.choice(COMPONENTS)} — проект {i + 1}"
+                writer.add("projects", (i + 1, title, " ".join(rng.sample(SENTENCES, 2)), rng.choice(owners), fmt(created)))
+            return writer.close()
+
+    def generate_defects(self) -> Dict[str, int]:
+        args = self.args
+        rng = self.rng("defects")
+        comment_rng = self.rng("comments")
+        attachment_rng = self.rng("attachments")
+        engineers = self.users_of("engineer") or list(range(1, self.users + 1))
+        all_users = self.users
+        # Размер проектов по Ципфу (s = 1.1); порядок проектов перемешан, чтобы крупные не шли подряд
+        project_order = list(range(1, self.projects + 1))
+        rng.shuffle(project_order)
+        project_cum = list(accumulate(1 / (k + 1) ** 1.1 for k in range(self.projects)))
+        span = (self.end - self.start).total_seconds()
+
+        with service_modules("service_defects", self.url("defects")) as load:
+            database, models, search, storage = load("database"), load("models"), load("search"), load("storage")
+            models.upgrade_schema()
+            writer = BulkWriter(database.engine, {
+                "defects": (models.Defect.__table__, ("id", "title", "description", "priority", "status", "project_id", "reporter_id", "assignee_id", "due_date", "created_at", "updated_at")),
+                "history": (models.DefectStatusHistory.__table__, ("defect_id", "project_id", "from_status", "to_status", "changed_by", "changed_at", "duration_seconds")),
+                "comments": (models.Comment.__table__, ("id", "content", "defect_id", "author_id", "created_at")),
+                "attachments": (models.Attachment.__table__, ("id", "filename", "file_path", "defect_id", "uploader_id", "uploaded_at", "content_hash", "size", "mime_type", "storage_key", "project_id")),
+                "blobs": (models.Blob.__table__, ("content_hash", "size", "ref_count", "created_at")),
+            }, args.batch_size)
+
+            comment_id = 0
+            attachment_id = 0
+            blobs: List[list] = []  # [hash, size, ref_count, created_at]
+            started = time.perf_counter()
+            for defect_id in range(1, args.defects + 1):
+                # Поток создания растёт к концу периода
+                created = self.start + timedelta(seconds=span * (defect_id / args.defects) ** 0.8 + rng.random() * 3600)
+                if created > self.end:
+                    created = self.end - timedelta(seconds=rng.random() * 3600)
+                age_days = (self.end - created).total_seconds() / 86400
+                project_id = project_order[bisect_left(project_cum, rng.random() * project_cum[-1])]
+                priority = weighted(rng, PRIORITIES)
+                if rng.random() < min(0.85, age_days / 120):
+                    status = "Закрыта" if rng.random() < 0.9 else "Отменена"
+                else:
+                    status = weighted(rng, OPEN_STATUSES)
+                reporter_id = rng.randint(1, all_users)
+                assignee_id = rng.choice(engineers) if status != "Новая" or rng.random() < 0.4 else None
+                due_date = None
+                if rng.random() < 0.6:
+                    low, high = DUE_DAYS[priority]
+                    due_date = fmt(created + timedelta(days=rng.uniform(low, high)))
+                title = f"{rng.choice(COMPONENTS)}: {rng.choice(SYMPTOMS)} {rng.choice(ACTIONS)}"
+                description = " ".join(rng.sample(SENTENCES, rng.randint(2, 4)))
+
+                # История статусов: переходы равномерно между созданием и "сейчас" (но не дальше 60 дней)
+                path = STATUS_PATHS[status]
+                horizon = min((self.end - created).total_seconds(), 60 * 86400)
+                moments = sorted(rng.random() * horizon for _ in range(len(path) - 1))
+                changed_at = created
+                writer.add("history", (defect_id, project_id, None, path[0], reporter_id, fmt(created), None))
+                for previous, current, offset in zip(path, path[1:], moments):
+                    moment = created + timedelta(seconds=offset)
+                    writer.add("history", (defect_id, project_id, previous, current, assignee_id or reporter_id, fmt(moment), (moment - changed_at).total_seconds()))
+                    changed_at = moment
+                updated_at = fmt(changed_at) if len(path) > 1 else None
+                writer.add("defects", (defect_id, title, description, priority, status, project_id, reporter_id, assignee_id, due_date, fmt(created), updated_at))
+
+                comments = int(comment_rng.expovariate(1 / args.comments_per_defect)) if args.comments_per_defect else 0
+                for _ in range(comments):
+                    comment_id += 1
+                    author_id = comment_rng.choice((reporter_id, assignee_id or reporter_id, comment_rng.randint(1, all_users)))
+                    moment = created + timedelta(seconds=comment_rng.random() * max(horizon, 60))
+                    writer.add("comments", (comment_id, comment_rng.choice(COMMENTS), defect_id, author_id, fmt(moment)))
+
+                if attachment_rng.random() < args.attachment_rate:
+                    for _ in range(attachment_rng.randint(1, 3)):
+                        attachment_id += 1
+                        filename, mime_type, typical_size = attachment_rng.choice(FILES)
+                        if blobs and attachment_rng.random() < 0.1:
+                            # Тот же файл приложен к другому дефекту
+                            blob = blobs[attachment_rng.randrange(len(blobs))]
+                        else:
+                            content_hash = f"{attachment_rng.getrandbits(256):064x}"
+                            size = max(1, int(attachment_rng.lognormvariate(math.log(typical_size), 0.8)))
+                            blob = [content_hash, size, 0, fmt(created)]
+                            blobs.append(blob)
+                        blob[2] += 1
+                        key = storage.storage_key(blob[0])
+                        writer.add("attachments", (attachment_id, filename, os.path.join(database.ATTACHMENTS_DIR, key), defect_id, reporter_id, fmt(created), blob[0], blob[1], mime_type, key, project_id))
+
+                if defect_id % 100_000 == 0:
+                    print(f"  defects: {defect_id:,} ({defect_id / (time.perf_counter() - started):,.0f}/s)")
+
+            for blob in blobs:
+                writer.add("blobs", tuple(blob))
+            counts = writer.close()
+
+            if not args.no_search_index:
+                print("  building search index...")
+                search.init_search_index(database.engine)
+            return counts
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Bulk synthetic data for auth, projects and defects databases")
+    parser.add_argument("--out", required=True, help="directory for auth.db, projects.db, defects.db")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--defects", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=0, help="default: defects / 200, at least 200")
+    parser.add_argument("--projects", type=int, default=0, help="default: defects / 2000, at least 10")
+    parser.add_argument("--comments-per-defect", type=float, default=3.0)
+    parser.add_argument("--attachment-rate", type=float, default=0.15, help="share of defects with attachments")
+    parser.add_argument("--days", type=int, default=730, help="history length")
+    parser.add_argument("--end-date", default=datetime.utcnow().strftime("%Y-%m-%d"), help="last day of history (pin it for reproducible data)")
+    parser.add_argument("--login-users", type=int, default=100, help="first N users are managers, for load tests")
+    parser.add_argument("--batch-size", type=int, default=20_000)
+    parser.add_argument("--no-search-index", action="store_true", help="skip FTS build (the service builds it on first start)")
+    parser.add_argument("--force", action="store_true", help="overwrite existing databases in --out")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    targets = [os.path.join(args.out, f"{name}.db") for name in ("auth", "projects", "defects")]
+    existing = [path for path in targets if os.path.exists(path)]
+    if existing and not args.force:
+        print(f"Refusing to overwrite {', '.join(existing)} (use --force)", file=sys.stderr)
+        return 1
+    for path in existing:
+        os.remove(path)
+
+    generator = Generator(args)
+    counts = {}
+    started = time.perf_counter()
+    for name, step in (("auth", generator.generate_auth), ("projects", generator.generate_projects), ("defects", generator.generate_defects)):
+        step_started = time.perf_counter()
+        print(f"{name}...")
+        counts.update(step())
+        print(f"  done in {time.perf_counter() - step_started:.1f}s")
+
+    manifest = {
+        "seed": args.seed,
+        "end_date": args.end_date,
+        "days": args.days,
+        "password": PASSWORD,
+        "login_users": [f"user{i + 1}" for i in range(min(args.login_users, generator.users))],
+        "counts": {"projects": generator.projects, **counts},
+    }
+    with open(os.path.join(args.out, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    total = sum(counts.values())
+    elapsed = time.perf_counter() - started
+    print(f"\n{total:,} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s)")
+    for name, count in counts.items():
+        print(f"  {name:12} {count:>12,}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""
+Нагрузочный тест цепочки шлюз → сервис → auth.
+
+Поднимает шлюз и четыре сервиса локально на SQLite (loadtest/stack.py),
+наполняет данными выбранного масштаба и гоняет смешанную нагрузку
+с заданным числом одновременных пользователей. Печатает RPS и
+p50/p95/p99 по операциям, сохраняет результат в JSON и сравнивает
+с сохранённым baseline.
+
+    cd backend
+    python -m loadtest.run_loadtest --scale small --concurrency 16 --duration 30 --save loadtest/baselines/small.json
+    python -m loadtest.run_loadtest --scale small --concurrency 16 --duration 30 --compare loadtest/baselines/small.json
+
+На данных loadtest/generate_data.py (миллионы строк, без наполнения через API):
+
+    python -m loadtest.run_loadtest --data /tmp/scale-1m --concurrency 32 --duration 60
+
+Против уже запущенного стенда (docker compose):
+
+    python -m loadtest.run_loadtest --no-boot --gateway-url http://localhost:8000
+
+Код выхода 1, если p95 какой-либо операции хуже baseline больше чем на
+--threshold или выросла доля ошибок.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List
+
+import httpx
+
+from loadtest.stack import Stack
+from loadtest.workload import MIXES, SCALES, Sample, from_manifest, run_workload, seed
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples: List[Sample], elapsed: float) -> Dict[str, dict]:
+    groups = defaultdict(list)
+    for sample in samples:
+        groups[sample.operation].append(sample)
+    groups["TOTAL"] = samples
+
+    result = {}
+    for name, items in sorted(groups.items()):
+        latencies = sorted(item.seconds * 1000 for item in items)
+        errors = sum(1 for item in items if item.status == 0 or item.status >= 400)
+        result[name] = {
+            "count": len(items),
+            "errors": errors,
+            "error_rate": round(errors / len(items), 4) if items else 0.0,
+            "rps": round(len(items) / elapsed, 2) if elapsed else 0.0,
+            "mean_ms": round(statistics.fmean(latencies), 2) if latencies else 0.0,
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+            "statuses": {str(code): sum(1 for item in items if item.status == code) for code in sorted({item.status for item in items})},
+        }
+    return result
+
+
+def print_report(routes: Dict[str, dict]) -> None:
+    print(f"{'operation':16} {'count':>7} {'err':>5} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, stats in routes.items():
+        print(f"{name:16} {stats['count']:7d} {stats['errors']:5d} {stats['rps']:8.1f} {stats['p50_ms']:8.1f} {stats['p95_ms']:8.1f} {stats['p99_ms']:8.1f}")
+
+
+def compare(routes: Dict[str, dict], baseline_path: str, threshold: float) -> bool:
+    """Печатает изменения относительно baseline; True, если есть регрессия"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["routes"]
+    regressed = False
+    print(f"\nvs {baseline_path} (threshold {threshold:.0%}):")
+    for name, stats in routes.items():
+        old = baseline.get(name)
+        if old is None:
+            print(f"  {name:16} new")
+            continue
+        p95_delta = stats["p95_ms"] / old["p95_ms"] - 1 if old["p95_ms"] else 0.0
+        rps_delta = stats["rps"] / old["rps"] - 1 if old["rps"] else 0.0
+        marks = []
+        if p95_delta > threshold:
+            marks.append("p95 REGRESSION")
+        if stats["error_rate"] > old["error_rate"] + 0.001:
+            marks.append("ERRORS")
+        regressed = regressed or bool(marks)
+        print(f"  {name:16} p95 {old['p95_ms']:8.1f} -> {stats['p95_ms']:8.1f} ({p95_delta:+.0%})   rps {rps_delta:+.0%}   {' '.join(marks)}")
+    return regressed
+
+
+async def run(args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=args.gateway_url, timeout=60.0, limits=limits) as client:
+        started = time.perf_counter()
+        if args.data:
+            with open(os.path.join(args.data, "manifest.json"), encoding="utf-8") as f:
+                manifest = json.load(f)
+            data = await from_manifest(client, manifest, args.concurrency)
+            args.scale = f"generated:{manifest['counts']['defects']}"
+        else:
+            data = await seed(client, args.scale, args.concurrency, args.seed)
+        print(f"Seeded {len(data.project_ids)} projects, {len(data.defect_ids)} defects in {time.perf_counter() - started:.1f}s")
+
+        if args.warmup:
+            await run_workload(client, data, args.mix, args.warmup, 0, args.seed + 1)
+        print(f"Running '{args.mix}' mix: concurrency {args.concurrency}, " + (f"{args.requests} requests" if args.requests else f"{args.duration:.0f}s"))
+        started = time.perf_counter()
+        samples = await run_workload(client, data, args.mix, 0 if args.requests else args.duration, args.requests, args.seed)
+        elapsed = time.perf_counter() - started
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "scale": args.scale,
+            "mix": args.mix,
+            "concurrency": args.concurrency,
+            "elapsed_s": round(elapsed, 2),
+            "seed": args.seed,
+            "rate_limit": args.rate_limit,
+            "gateway_url": args.gateway_url if args.no_boot else "local",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "routes": summarize(samples, elapsed),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="End-to-end load test: gateway -> services -> auth")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--data", help="directory made by loadtest.generate_data instead of --scale seeding")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="mixed")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of measured load")
+    parser.add_argument("--requests", type=int, default=0, help="fixed number of requests instead of --duration")
+    parser.add_argument("--warmup", type=float, default=5.0, help="seconds of unmeasured load before the run")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--rate-limit", action="store_true", help="keep gateway rate limiting enabled")
+    parser.add_argument("--base-port", type=int, default=18100)
+    parser.add_argument("--keep-data", action="store_true", help="keep databases and service logs after the run")
+    parser.add_argument("--no-boot", action="store_true", help="use an already running stack at --gateway-url")
+    parser.add_argument("--gateway-url", default="http://localhost:8000")
+    parser.add_argument("--save", help="write results as JSON baseline")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p95 slowdown vs baseline")
+    args = parser.parse_args()
+
+    if args.no_boot:
+        result = asyncio.run(run(args))
+    else:
+        data_dir = None
+        if args.data:
+            # Прогон меняет данные (правки, комментарии) — работаем на копии, чтобы прогоны были сравнимы
+            data_dir = tempfile.mkdtemp(prefix="loadtest-")
+            for name in ("auth.db", "projects.db", "defects.db"):
+                shutil.copyfile(os.path.join(args.data, name), os.path.join(data_dir, name))
+        stack = Stack(base_port=args.base_port, data_dir=data_dir, keep_data=args.keep_data, gateway_env={"RATE_LIMIT_ENABLED": "true" if args.rate_limit else "false"})
+        print("Starting gateway and services...")
+        with stack:
+            args.gateway_url = stack.gateway_url
+            result = asyncio.run(run(args))
+        if args.keep_data:
+            print(f"Data and service logs: {stack.data_dir}")
+
+    print()
+    print_report(result["routes"])
+
+    if args.save:
+        directory = os.path.dirname(args.save)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\nSaved {args.save}")
+
+    if args.compare and compare(result["routes"], args.compare, args.threshold):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
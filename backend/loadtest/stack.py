@@ -0,0 +1,121 @@
+"""
+Локальный стенд для нагрузочного теста: шлюз и четыре сервиса как
+отдельные процессы uvicorn на 127.0.0.1, у каждого свой SQLite во
+временном каталоге.
+
+Настройки сервисов задаются переменными окружения так же, как в
+docker-compose.yml; логи и трассировка приглушены, чтобы стенд мерил
+сервисы, а не запись в stdout.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Порядок запуска: auth нужен остальным, шлюз — последним
+SERVICES = [
+    ("auth", "service_auth", 0),
+    ("projects", "service_projects", 1),
+    ("defects", "service_defects", 2),
+    ("reports", "service_reports", 3),
+    ("gateway", "api_gateway", 4),
+]
+
+
+@dataclass
+class Stack:
+    base_port: int = 18100
+    data_dir: Optional[str] = None
+    gateway_env: Dict[str, str] = field(default_factory=dict)
+    keep_data: bool = False
+    processes: List[subprocess.Popen] = field(default_factory=list)
+
+    def url(self, name: str) -> str:
+        port = self.base_port + dict((n, offset) for n, _, offset in SERVICES)[name]
+        return f"http://127.0.0.1:{port}"
+
+    @property
+    def gateway_url(self) -> str:
+        return self.url("gateway")
+
+    def _env(self, name: str) -> Dict[str, str]:
+        env = dict(os.environ)
+        env.update({
+            "PYTHONPATH": BACKEND_DIR,
+            "SECRET_KEY": env.get("SECRET_KEY", "loadtest-secret"),
+            "JWT_ALG": env.get("JWT_ALG", "HS256"),
+            "ACCESS_TOKEN_EXPIRE_MINUTES": "600",
+            "AUTH_SERVICE_URL": self.url("auth"),
+            "PROJECTS_SERVICE_URL": self.url("projects"),
+            "DEFECTS_SERVICE_URL": self.url("defects"),
+            "REPORTS_SERVICE_URL": self.url("reports"),
+            "DATABASE_URL": f"sqlite:///{os.path.join(self.data_dir, name + '.db')}",
+            "READ_MODEL_PATH": os.path.join(self.data_dir, "reports-read-model.db"),
+            "LOG_LEVEL": env.get("LOG_LEVEL", "WARNING"),
+            "LOG_FILE": "false",
+            "TRACE_EXPORTER": env.get("TRACE_EXPORTER", "none"),
+        })
+        if name == "gateway":
+            env.update(self.gateway_env)
+        return env
+
+    def start(self, timeout: float = 60.0) -> None:
+        if self.data_dir is None:
+            self.data_dir = tempfile.mkdtemp(prefix="loadtest-")
+        os.makedirs(self.data_dir, exist_ok=True)
+        try:
+            for name, directory, offset in SERVICES:
+                log = open(os.path.join(self.data_dir, f"{name}.log"), "wb")
+                process = subprocess.Popen(
+                    [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(self.base_port + offset), "--no-access-log"],
+                    cwd=os.path.join(BACKEND_DIR, directory),
+                    env=self._env(name),
+                    stdout=log,
+                    stderr=subprocess.STDOUT,
+                )
+                self.processes.append(process)
+                self._wait_healthy(name, process, timeout)
+        except BaseException:
+            self.stop()
+            raise
+
+    def _wait_healthy(self, name: str, process: subprocess.Popen, timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{name} exited with code {process.returncode}, see {self.data_dir}/{name}.log")
+            try:
+                if httpx.get(f"{self.url(name)}/health", timeout=1.0).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"{name} did not become healthy in {timeout:.0f}s, see {self.data_dir}/{name}.log")
+
+    def stop(self) -> None:
+        for process in reversed(self.processes):
+            process.terminate()
+        for process in reversed(self.processes):
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self.processes.clear()
+        if self.data_dir and not self.keep_data:
+            shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def __enter__(self) -> "Stack":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
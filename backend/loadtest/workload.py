@@ -0,0 +1,240 @@
+"""
+Наполнение стенда и смешанная нагрузка через шлюз (/v1/...).
+
+Данные создаются обычными запросами API, поэтому события проектов и
+дефектов доходят до read model отчётов так же, как в работе. Каждому
+виртуальному пользователю — свой аккаунт: вход выдаёт новый токен и
+отзывает прежние, общий аккаунт ломал бы соседние потоки. Регистрация
+всегда даёт роль observer, а править дефект может только его автор,
+поэтому дефекты распределены между пользователями и каждый обновляет свои.
+"""
+
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Sequence
+
+import httpx
+
+STATUSES = ["Новая", "В работе", "На проверке", "Закрыта", "Отменена"]
+PRIORITIES = ["Низкий", "Средний", "Высокий", "Критический"]
+WORDS = ["login", "timeout", "crash", "report", "export", "layout", "button", "payment", "search", "upload", "cache", "session"]
+
+# Масштаб наполнения: проекты, дефекты, комментарии на дефект
+SCALES = {
+    "small": {"projects": 5, "defects": 200, "comments": 2},
+    "medium": {"projects": 20, "defects": 2000, "comments": 3},
+    "large": {"projects": 50, "defects": 10000, "comments": 3},
+}
+
+PASSWORD = "loadtest-password"
+
+
+@dataclass
+class Dataset:
+    users: List[str] = field(default_factory=list)
+    tokens: Dict[str, str] = field(default_factory=dict)
+    project_ids: Sequence[int] = field(default_factory=list)
+    defect_ids: Sequence[int] = field(default_factory=list)
+    # Дефекты, созданные пользователем (их он может обновлять)
+    owned: Dict[str, List[int]] = field(default_factory=dict)
+    password: str = PASSWORD
+
+
+def headers(token: str) -> Dict[str, str]:
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def login(client: httpx.AsyncClient, username: str) -> str:
+    response = await client.post("/v1/auth/token", data={"username": username, "password": PASSWORD})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def defect_payload(rng: random.Random, project_id: int, index: int) -> dict:
+    words = rng.sample(WORDS, 3)
+    return {
+        "title": f"{words[0].capitalize()} {words[1]} #{index}",
+        "description": f"Steps: {' '.join(rng.choices(WORDS, k=12))}",
+        "priority": rng.choice(PRIORITIES),
+        "status": rng.choice(STATUSES),
+        "project_id": project_id,
+    }
+
+
+async def seed(client: httpx.AsyncClient, scale: str, users: int, seed_value: int = 42, concurrency: int = 16) -> Dataset:
+    """Пользователи, проекты, дефекты и комментарии; детерминировано по seed_value"""
+    sizes = SCALES[scale]
+    rng = random.Random(seed_value)
+    data = Dataset()
+    run_id = f"{seed_value}-{int(time.time())}"
+
+    for i in range(users):
+        username = f"load-{run_id}-{i}"
+        response = await client.post("/v1/auth/register", json={"username": username, "email": f"{username}@example.com", "password": PASSWORD})
+        response.raise_for_status()
+        data.users.append(username)
+        data.tokens[username] = await login(client, username)
+        data.owned[username] = []
+    owner = headers(data.tokens[data.users[0]])
+
+    for i in range(sizes["projects"]):
+        response = await client.post("/v1/projects/", json={"title": f"Load project {i}", "description": "loadtest"}, headers=owner)
+        response.raise_for_status()
+        data.project_ids.append(response.json()["id"])
+
+    payloads = [defect_payload(rng, rng.choice(data.project_ids), i) for i in range(sizes["defects"])]
+    comments = [[f"Comment {j}: {' '.join(rng.choices(WORDS, k=8))}" for j in range(sizes["comments"])] for _ in payloads]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def create(index: int, payload: dict, texts: List[str]) -> int:
+        reporter = data.users[index % users]
+        async with semaphore:
+            response = await client.post("/v1/defects/", json=payload, headers=headers(data.tokens[reporter]))
+            response.raise_for_status()
+            defect_id = response.json()["id"]
+            for text in texts:
+                (await client.post(f"/v1/defects/{defect_id}/comments/", json={"content": text}, headers=headers(data.tokens[reporter]))).raise_for_status()
+            data.owned[reporter].append(defect_id)
+            return defect_id
+
+    data.defect_ids = list(await asyncio.gather(*(create(i, p, c) for i, (p, c) in enumerate(zip(payloads, comments)))))
+    return data
+
+
+async def from_manifest(client: httpx.AsyncClient, manifest: dict, users: int) -> Dataset:
+    """
+    Данные, сгенерированные loadtest/generate_data.py: идентификаторы идут
+    подряд с 1, первые пользователи — менеджеры, им можно править любой дефект
+    """
+    logins = manifest["login_users"]
+    if users > len(logins):
+        raise ValueError(f"dataset has {len(logins)} login users, concurrency {users} requested (regenerate with --login-users)")
+    data = Dataset(project_ids=range(1, manifest["counts"]["projects"] + 1), defect_ids=range(1, manifest["counts"]["defects"] + 1), password=manifest["password"])
+    for username in logins[:users]:
+        response = await client.post("/v1/auth/token", data={"username": username, "password": manifest["password"]})
+        response.raise_for_status()
+        data.users.append(username)
+        data.tokens[username] = response.json()["access_token"]
+    return data
+
+
+# ==================== Операции ====================
+
+Operation = Callable[[httpx.AsyncClient, random.Random, Dataset, str], Awaitable[httpx.Response]]
+
+
+async def op_login(client, rng, data, username):
+    response = await client.post("/v1/auth/token", data={"username": username, "password": data.password})
+    if response.status_code == 200:
+        data.tokens[username] = response.json()["access_token"]
+    return response
+
+
+async def op_list_defects(client, rng, data, username):
+    return await client.get("/v1/defects/", params={"skip": rng.randrange(0, max(1, len(data.defect_ids) - 100)), "limit": 100}, headers=headers(data.tokens[username]))
+
+
+async def op_get_defect(client, rng, data, username):
+    return await client.get(f"/v1/defects/{rng.choice(data.defect_ids)}", headers=headers(data.tokens[username]))
+
+
+async def op_update_defect(client, rng, data, username):
+    defect_id = rng.choice(data.owned.get(username) or data.defect_ids)
+    payload = defect_payload(rng, rng.choice(data.project_ids), defect_id)
+    return await client.patch(f"/v1/defects/{defect_id}", json=payload, headers=headers(data.tokens[username]))
+
+
+async def op_list_comments(client, rng, data, username):
+    return await client.get(f"/v1/defects/{rng.choice(data.defect_ids)}/comments/", headers=headers(data.tokens[username]))
+
+
+async def op_add_comment(client, rng, data, username):
+    return await client.post(f"/v1/defects/{rng.choice(data.defect_ids)}/comments/", json={"content": " ".join(rng.choices(WORDS, k=10))}, headers=headers(data.tokens[username]))
+
+
+async def op_list_projects(client, rng, data, username):
+    return await client.get("/v1/projects/", headers=headers(data.tokens[username]))
+
+
+async def op_search(client, rng, data, username):
+    return await client.get("/v1/defects/search", params={"q": rng.choice(WORDS)}, headers=headers(data.tokens[username]))
+
+
+async def op_analytics(client, rng, data, username):
+    return await client.get("/v1/reports/analytics/summary", headers=headers(data.tokens[username]))
+
+
+async def op_export(client, rng, data, username):
+    return await client.get("/v1/reports/defects/export", params={"format": "csv"}, headers=headers(data.tokens[username]))
+
+
+# Имя операции -> (функция, вес в смеси)
+MIXES: Dict[str, Dict[str, tuple]] = {
+    "mixed": {
+        "login": (op_login, 2),
+        "list_defects": (op_list_defects, 25),
+        "get_defect": (op_get_defect, 25),
+        "update_defect": (op_update_defect, 8),
+        "list_comments": (op_list_comments, 10),
+        "add_comment": (op_add_comment, 8),
+        "list_projects": (op_list_projects, 8),
+        "search": (op_search, 6),
+        "analytics": (op_analytics, 6),
+        "export": (op_export, 2),
+    },
+    "read": {
+        "list_defects": (op_list_defects, 35),
+        "get_defect": (op_get_defect, 35),
+        "list_comments": (op_list_comments, 15),
+        "list_projects": (op_list_projects, 15),
+    },
+    "write": {
+        "update_defect": (op_update_defect, 50),
+        "add_comment": (op_add_comment, 50),
+    },
+    "reports": {
+        "analytics": (op_analytics, 70),
+        "export": (op_export, 30),
+    },
+}
+
+
+@dataclass
+class Sample:
+    operation: str
+    status: int
+    seconds: float
+
+
+async def run_workload(client: httpx.AsyncClient, data: Dataset, mix: str, duration: float, max_requests: int, seed_value: int = 42) -> List[Sample]:
+    """Замкнутый цикл: по воркеру на пользователя, каждый ждёт ответа перед следующим запросом"""
+    operations = MIXES[mix]
+    names = list(operations)
+    weights = [operations[name][1] for name in names]
+    samples: List[Sample] = []
+    deadline = time.perf_counter() + duration if duration else None
+    remaining = max_requests or None
+
+    async def worker(index: int, username: str) -> None:
+        nonlocal remaining
+        rng = random.Random(seed_value * 1000 + index)
+        while True:
+            if deadline is not None and time.perf_counter() >= deadline:
+                return
+            if remaining is not None:
+                if remaining <= 0:
+                    return
+                remaining -= 1
+            name = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                response = await operations[name][0](client, rng, data, username)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 0
+            samples.append(Sample(name, status, time.perf_counter() - started))
+
+    await asyncio.gather(*(worker(i, username) for i, username in enumerate(data.users)))
+    return samples
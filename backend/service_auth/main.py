@@ -1,42 +1,24 @@
 import logging
 import os
-import uuid
 from datetime import datetime, timedelta
 from typing import Optional
 
-from fastapi import FastAPI, Depends, HTTPException, status, Query, Request
+from fastapi import FastAPI, Depends, HTTPException, status, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
 from sqlalchemy import inspect, text
 from sqlalchemy.orm import Session
-from starlette.middleware.base import BaseHTTPMiddleware
 
 import crud, models, schemas
 from database import engine, SessionLocal
-from logging_config import setup_logging
+from shared.logging_config import setup_logging
+from shared.observability import setup_observability
 
-# Логирование в файл backend/logs/auth-service.log
+# Логирование через очередь: файл logs/auth-service.log и stdout (shared/logging_config.py)
 setup_logging("auth-service")
 logger = logging.getLogger(__name__)
 
-# Middleware для X-Request-ID
-class RequestIDMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        request_id = request.headers.get("X-Request-ID", str(uuid.uuid4()))
-        request.state.request_id = request_id
-        
-        # Логируем начало запроса
-        logger.info(f"[{request_id}] {request.method} {request.url.path}")
-        
-        response = await call_next(request)
-        response.headers["X-Request-ID"] = request_id
-        
-        # Логируем завершение запроса
-        logger.info(f"[{request_id}] Response: {response.status_code}")
-        
-        return response
-
 # Создаём таблицы, если их ещё нет
 print("[AUTH] Creating database tables...")
 models.Base.metadata.create_all(bind=engine)
@@ -85,9 +67,6 @@ except Exception:
 
 app = FastAPI(title="Auth Service", version="1.0.0")
 
-# Добавляем middleware для трассировки
-app.add_middleware(RequestIDMiddleware)
-
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -95,6 +74,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Request ID, trace, метрики и access-лог за один проход (shared/observability.py)
+setup_observability(app, "auth", engine)
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
 ALGORITHM = os.getenv("JWT_ALG", "HS256")
@@ -102,6 +83,8 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
+# Работа с БД синхронная: зависимости и эндпоинты с БД — обычные def,
+# FastAPI выполняет их в threadpool, а не в event loop
 def get_db():
     db = SessionLocal()
     try:
@@ -115,7 +98,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -140,7 +123,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     return user
 
 @app.post("/auth/token", response_model=schemas.Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     user = crud.get_user_by_username(db, username=form_data.username)
     if not user or not crud.verify_password(form_data.password, user.hashed_password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect username or password", headers={"WWW-Authenticate": "Bearer"})
@@ -155,31 +138,31 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.post("/auth/register", response_model=schemas.User)
-async def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
+def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     if crud.get_user_by_email(db, email=user.email) or crud.get_user_by_username(db, username=user.username):
         raise HTTPException(status_code=400, detail="Username or email already taken")
     return crud.create_user(db=db, user=user)
 
 @app.get("/auth/users/me", response_model=schemas.User)
-async def read_users_me(current_user: models.User = Depends(get_current_user)):
+def read_users_me(current_user: models.User = Depends(get_current_user)):
     return current_user
 
 @app.get("/auth/users", response_model=list[schemas.User])
-async def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     # Все авторизованные пользователи могут видеть список пользователей
     return crud.get_users(db, skip=skip, limit=limit)
 
 from fastapi import Query
 
 @app.put("/auth/users/{user_id}/role", response_model=schemas.User)
-async def update_user_role(user_id: int, new_role: str = Query(...), db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def update_user_role(user_id: int, new_role: str = Query(...), db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     if current_user.role not in ["manager", "admin"]:
         raise HTTPException(status_code=403, detail="Not authorized")
     # update_user_role автоматически инвалидирует все токены пользователя
     return crud.update_user_role(db, user_id, new_role)
 
 @app.post("/auth/logout")
-async def logout(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def logout(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     """Выход из системы - инвалидирует текущий токен"""
     crud.revoke_token(db, token)
     return {"message": "Successfully logged out"}
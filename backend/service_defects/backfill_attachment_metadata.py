@@ -0,0 +1,118 @@
+"""
+Backfill метаданных вложений: хеш, размер, MIME-тип, storage key и project_id.
+
+Файлы старой схемы хранения (attachments/<defect_id>/<filename>) переносятся
+в контентно-адресуемое хранилище с учётом ссылок. Чтение и хеширование
+файлов идёт параллельно в пуле потоков (hashlib и файловый ввод-вывод
+отпускают GIL), запись в БД — пачками в основном потоке.
+
+    python backfill_attachment_metadata.py --workers 8 --batch-size 500
+"""
+
+import argparse
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import or_, text
+
+import models
+import storage
+from database import BASE_DIR, SessionLocal, engine
+
+
+def resolve_path(file_path: str) -> str:
+    # Старые записи хранят путь относительно рабочей папки сервиса ("./attachments/...")
+    return file_path if os.path.isabs(file_path) else os.path.normpath(os.path.join(BASE_DIR, file_path))
+
+
+def scan(row):
+    """Выполняется в пуле потоков: (hash, size, mime, path) или None, если файла нет"""
+    path = storage.blob_path(row.content_hash) if row.content_hash else resolve_path(row.file_path)
+    if not os.path.exists(path):
+        return None
+    if row.content_hash:
+        # Blob уже в хранилище: хеш известен, MIME-тип определяем по первым байтам
+        with open(path, "rb") as source:
+            head = source.read(4096)
+        return row.content_hash, os.path.getsize(path), storage.detect_mime_type(head, row.filename), path
+    return (*storage.scan_file(path, row.filename), path)
+
+
+def import_legacy_file(path: str, content_hash: str) -> str:
+    """Кладёт копию старого файла в хранилище blob-ов (исходник удаляется в конце backfill)"""
+    target = storage.blob_path(content_hash)
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.link(path, target)
+        except OSError:
+            shutil.copyfile(path, target)
+    return target
+
+
+def backfill(workers: int, batch_size: int) -> None:
+    models.upgrade_schema()
+
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(text(
+            "UPDATE attachments SET project_id = (SELECT project_id FROM defects WHERE defects.id = attachments.defect_id) "
+            "WHERE project_id IS NULL"
+        ))
+
+    A = models.Attachment
+    last_id = 0
+    processed = missing = migrated = 0
+    legacy_paths = set()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            db = SessionLocal()
+            try:
+                rows = db.query(A.id, A.file_path, A.filename, A.content_hash).filter(
+                    A.id > last_id,
+                    or_(A.content_hash.is_(None), A.size.is_(None), A.mime_type.is_(None), A.storage_key.is_(None)),
+                ).order_by(A.id).limit(batch_size).all()
+                if not rows:
+                    break
+                last_id = rows[-1].id
+                for row, info in zip(rows, pool.map(scan, rows)):
+                    if info is None:
+                        missing += 1
+                        continue
+                    content_hash, size, mime_type, path = info
+                    values = {"content_hash": content_hash, "size": size, "mime_type": mime_type, "storage_key": storage.storage_key(content_hash)}
+                    if row.content_hash is None:
+                        # Сначала ссылка (UPDATE блокирует строку blob-а), потом файл —
+                        # как в storage.acquire, поэтому сервис может работать параллельно
+                        storage.add_reference(db, content_hash, size)
+                        values["file_path"] = import_legacy_file(path, content_hash)
+                        legacy_paths.add(path)
+                        migrated += 1
+                    db.query(A).filter(A.id == row.id).update(values, synchronize_session=False)
+                db.commit()
+                processed += len(rows)
+                print(f"... {processed} attachments processed")
+            finally:
+                db.close()
+
+    # Исходные файлы удаляем только после того, как все ссылки переключены на blob-ы
+    for path in legacy_paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+    elapsed = time.perf_counter() - started
+    print(f"Backfill done in {elapsed:.1f}s: {processed} processed, {migrated} migrated to blob storage, {missing} files missing")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Backfill attachment size, mime type, checksum and storage key")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    backfill(args.workers, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
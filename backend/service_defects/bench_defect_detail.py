@@ -0,0 +1,139 @@
+"""
+Бенчмарк открытия карточки дефекта: три запроса (/defects/{id},
+/comments/, /attachments/) против одного
+/defects/{id}?include=comments,attachments.
+
+Маршруты и проверка пользователя — настоящие из main.py: каждый запрос
+декодирует JWT и ходит в auth-сервис. Auth подменён локальным
+сервером с задержкой --auth-latency-ms (сетевой hop до auth в docker).
+БД — временный SQLite с одним дефектом, --comments комментариями и
+--attachments вложениями. Запросы идут in-process через
+httpx.ASGITransport: три последовательно (как сейчас в UI), три
+параллельно и один составной.
+
+    cd backend/service_defects
+    PYTHONPATH=.. python bench_defect_detail.py --requests 500 --auth-latency-ms 2
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+FAKE_AUTH_PORT = int(os.getenv("FAKE_AUTH_PORT", "18021"))
+
+# Временная БД и адрес auth задаются до импорта main
+DATA_DIR = tempfile.mkdtemp(prefix="bench-detail-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(DATA_DIR, 'defects.db')}")
+os.environ.setdefault("LOG_FILE", "false")
+os.environ.setdefault("TRACE_SAMPLE_RATE", "0.01")
+os.environ["AUTH_SERVICE_URL"] = f"http://127.0.0.1:{FAKE_AUTH_PORT}"
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+from jose import jwt  # noqa: E402
+
+import main  # noqa: E402
+import models  # noqa: E402
+from database import SessionLocal  # noqa: E402
+
+USER = b'{"id": 1, "username": "bench", "email": "bench@example.com", "role": "admin"}'
+
+
+def fake_auth(latency: float):
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        if latency:
+            await asyncio.sleep(latency)
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(USER)).encode())]})
+        await send({"type": "http.response.body", "body": USER})
+    return app
+
+
+def seed(comments: int, attachments: int) -> int:
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        defect = models.Defect(title="Bench defect", description="bench " * 50, project_id=1, reporter_id=1, created_at=now)
+        db.add(defect)
+        db.flush()
+        db.add_all(models.Comment(content=f"Comment {i}: " + "text " * 30, defect_id=defect.id, author_id=1, created_at=now + timedelta(seconds=i)) for i in range(comments))
+        db.add_all(models.Attachment(filename=f"photo-{i}.jpg", file_path=f"attachments/bench/{i}.jpg", defect_id=defect.id, uploader_id=1, uploaded_at=now + timedelta(seconds=i), size=100_000, mime_type="image/jpeg", project_id=1) for i in range(attachments))
+        db.commit()
+        return defect.id
+    finally:
+        db.close()
+
+
+async def three_sequential(client: httpx.AsyncClient, defect_id: int) -> int:
+    size = 0
+    for path in (f"/defects/{defect_id}", f"/defects/{defect_id}/comments/", f"/defects/{defect_id}/attachments/"):
+        response = await client.get(path)
+        response.raise_for_status()
+        size += len(response.content)
+    return size
+
+
+async def three_parallel(client: httpx.AsyncClient, defect_id: int) -> int:
+    responses = await asyncio.gather(*(client.get(path) for path in (f"/defects/{defect_id}", f"/defects/{defect_id}/comments/", f"/defects/{defect_id}/attachments/")))
+    for response in responses:
+        response.raise_for_status()
+    return sum(len(response.content) for response in responses)
+
+
+async def composite(client: httpx.AsyncClient, defect_id: int) -> int:
+    response = await client.get(f"/defects/{defect_id}", params={"include": "comments,attachments"})
+    response.raise_for_status()
+    return len(response.content)
+
+
+async def measure(client: httpx.AsyncClient, variant, defect_id: int, requests: int):
+    for _ in range(20):
+        await variant(client, defect_id)
+    latencies = []
+    size = 0
+    for _ in range(requests):
+        started = time.perf_counter()
+        size = await variant(client, defect_id)
+        latencies.append((time.perf_counter() - started) * 1000)
+    q = statistics.quantiles(latencies, n=100)
+    return q[49], q[98], size
+
+
+async def run(args) -> None:
+    defect_id = seed(args.comments, args.attachments)
+    token = jwt.encode({"sub": "bench", "exp": datetime.now(timezone.utc) + timedelta(hours=1)}, main.SECRET_KEY, algorithm=main.ALGORITHM)
+
+    server = uvicorn.Server(uvicorn.Config(fake_auth(args.auth_latency_ms / 1000), host="127.0.0.1", port=FAKE_AUTH_PORT, log_level="warning", lifespan="off"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", headers={"Authorization": f"Bearer {token}"}) as client:
+            print(f"Defect card: {args.comments} comments, {args.attachments} attachments, auth latency {args.auth_latency_ms} ms, {args.requests} opens")
+            results = {}
+            for name, variant in (("3 requests, sequential", three_sequential), ("3 requests, parallel", three_parallel), ("include=...", composite)):
+                results[name] = await measure(client, variant, defect_id, args.requests)
+                p50, p99, size = results[name]
+                print(f"  {name:24} p50 {p50:7.2f} ms   p99 {p99:7.2f} ms   {size:7d} bytes")
+    finally:
+        server.should_exit = True
+        await server_task
+
+    before = results["3 requests, sequential"][0]
+    after = results["include=..."][0]
+    print(f"\np50 vs sequential: {before:.2f} -> {after:.2f} ms ({after / before - 1:+.0%})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Defect card: three requests vs one include= request")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--comments", type=int, default=20)
+    parser.add_argument("--attachments", type=int, default=5)
+    parser.add_argument("--auth-latency-ms", type=float, default=2.0)
+    args = parser.parse_args()
+    asyncio.run(run(args))
@@ -0,0 +1,126 @@
+"""
+Бенчмарк middleware запросов: прежний RequestIDMiddleware на
+BaseHTTPMiddleware против чистого ASGI RequestMiddleware
+(shared/observability.py) на GET /health и GET /defects/{id}.
+
+Маршруты и обработчики — настоящие из main.py, БД — временный SQLite
+с одним дефектом, проверка пользователя подменена (без auth-сервиса).
+Запросы идут in-process через httpx.ASGITransport, --concurrency
+одновременно; печатается пропускная способность и p50/p99.
+
+    cd backend/service_defects
+    PYTHONPATH=.. python bench_middleware.py --requests 5000 --concurrency 32
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+# Временная БД и настройки задаются до импорта main
+DATA_DIR = tempfile.mkdtemp(prefix="bench-middleware-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(DATA_DIR, 'defects.db')}")
+os.environ.setdefault("LOG_FILE", "false")
+os.environ.setdefault("TRACE_SAMPLE_RATE", "0.01")
+
+import httpx  # noqa: E402
+from fastapi import FastAPI, Request  # noqa: E402
+from starlette.middleware.base import BaseHTTPMiddleware  # noqa: E402
+
+import main  # noqa: E402
+import models  # noqa: E402
+from database import SessionLocal  # noqa: E402
+from shared.observability import RequestMiddleware  # noqa: E402
+
+logger = logging.getLogger("access")
+
+
+class LegacyRequestIDMiddleware(BaseHTTPMiddleware):
+    """RequestIDMiddleware в том виде, в каком он был в сервисах"""
+
+    async def dispatch(self, request: Request, call_next):
+        request_id = request.headers.get("X-Request-ID", str(uuid.uuid4()))
+        request.state.request_id = request_id
+        logger.info(f"[{request_id}] {request.method} {request.url.path}")
+        response = await call_next(request)
+        response.headers["X-Request-ID"] = request_id
+        logger.info(f"[{request_id}] Response: {response.status_code}")
+        return response
+
+
+def build_app(middleware) -> FastAPI:
+    # Те же маршруты, без остальных middleware сервиса: сравнивается только обёртка запроса
+    app = FastAPI()
+    app.router.routes = main.app.router.routes
+    if middleware is not None:
+        app.add_middleware(middleware)
+    return app
+
+
+def seed_defect() -> int:
+    db = SessionLocal()
+    try:
+        defect = models.Defect(title="Bench defect", description="bench", project_id=1, reporter_id=1, created_at=datetime.utcnow())
+        db.add(defect)
+        db.commit()
+        return defect.id
+    finally:
+        db.close()
+
+
+async def run_load(app, path: str, requests: int, concurrency: int):
+    latencies = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(50):
+            (await client.get(path)).raise_for_status()
+
+        remaining = requests
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                started = time.perf_counter()
+                response = await client.get(path)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    q = statistics.quantiles(latencies, n=100)
+    return len(latencies) / elapsed, q[49] * 1000, q[98] * 1000
+
+
+async def run(requests: int, concurrency: int) -> None:
+    main.app.dependency_overrides[main.get_current_user] = lambda: {"id": 1, "username": "bench", "role": "admin"}
+    defect_id = seed_defect()
+    variants = [
+        ("no middleware", build_app(None)),
+        ("BaseHTTPMiddleware", build_app(LegacyRequestIDMiddleware)),
+        ("pure ASGI", build_app(RequestMiddleware)),
+    ]
+    for path in ("/health", f"/defects/{defect_id}"):
+        print(f"GET {path}, {requests} requests, concurrency {concurrency}:")
+        baseline = None
+        for name, app in variants:
+            rps, p50, p99 = await run_load(app, path, requests, concurrency)
+            if name == "BaseHTTPMiddleware":
+                baseline = rps
+            gain = f"  ({rps / baseline - 1:+.0%} vs BaseHTTPMiddleware)" if name == "pure ASGI" and baseline else ""
+            print(f"  {name:20} {rps:8.0f} req/s   p50 {p50:6.2f} ms   p99 {p99:6.2f} ms{gain}")
+        print()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="BaseHTTPMiddleware vs pure ASGI request middleware")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.concurrency))
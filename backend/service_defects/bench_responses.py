@@ -0,0 +1,93 @@
+"""
+Бенчмарк слоя ответов (shared/responses.py) на типичном ответе
+GET /defects/?limit=1000: размер в байтах и CPU на один ответ.
+
+- кодирование JSON: json.dumps (как JSONResponse Starlette) против orjson;
+- сжатие: без сжатия, gzip, br, zstd (те же уровни, что в CompressionMiddleware);
+- шлюз: разбор и повторное кодирование JSON (как было в proxy_request)
+  против передачи тела без изменений.
+
+    cd backend/service_defects
+    PYTHONPATH=.. python bench_responses.py --defects 1000
+"""
+
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from shared.responses import CompressionMiddleware, orjson
+
+STATUSES = ["Новая", "В работе", "На проверке", "Закрыта"]
+PRIORITIES = ["Низкий", "Средний", "Высокий", "Критический"]
+WORDS = "трещина фасад бетон арматура протечка кровля монтаж перекрытие отделка штукатурка проверка акт этаж секция".split()
+
+
+def make_defects(count: int, seed: int = 42) -> list:
+    rng = random.Random(seed)
+    created = datetime(2025, 1, 1)
+    return [
+        {
+            "id": i,
+            "title": " ".join(rng.choices(WORDS, k=5)).capitalize(),
+            "description": " ".join(rng.choices(WORDS, k=60)),
+            "priority": rng.choice(PRIORITIES),
+            "status": rng.choice(STATUSES),
+            "project_id": rng.randint(1, 20),
+            "assignee_id": rng.randint(1, 50),
+            "due_date": (created + timedelta(days=rng.randint(1, 90))).isoformat(),
+            "reporter_id": rng.randint(1, 50),
+            "created_at": (created + timedelta(minutes=i)).isoformat(),
+            "updated_at": None,
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+def cpu_ms(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(3):
+        started = time.process_time()
+        for _ in range(repeat):
+            func()
+        best = min(best, (time.process_time() - started) / repeat)
+    return best * 1000
+
+
+def stdlib_dumps(content) -> bytes:
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="JSON encoding and compression cost per response")
+    parser.add_argument("--defects", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    content = make_defects(args.defects)
+    body = stdlib_dumps(content)
+    print(f"Payload: {args.defects} defects, {len(body)} bytes of JSON\n")
+
+    print("JSON encoding (CPU per response):")
+    print(f"  json.dumps: {cpu_ms(lambda: stdlib_dumps(content), args.repeat):7.2f} ms")
+    if orjson is not None:
+        print(f"  orjson:     {cpu_ms(lambda: orjson.dumps(content), args.repeat):7.2f} ms")
+    else:
+        print("  orjson:     not installed")
+
+    print("\nCompression (bytes on the wire, CPU per response):")
+    print(f"  {'identity':8} {len(body):9d} B  100.0%     0.00 ms")
+    middleware = CompressionMiddleware(app=None)
+    for encoding in middleware.encodings:
+        compressed = middleware.create_encoder(encoding).finish(body)
+        ms = cpu_ms(lambda: middleware.create_encoder(encoding).finish(body), args.repeat)
+        print(f"  {encoding:8} {len(compressed):9d} B  {len(compressed) / len(body) * 100:5.1f}%  {ms:7.2f} ms")
+
+    print("\nGateway (CPU per response):")
+    print(f"  parse + re-encode (before): {cpu_ms(lambda: stdlib_dumps(json.loads(body)), args.repeat):7.2f} ms")
+    print("  pass-through (after):          0.00 ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""
+Фоновая каскадная очистка после удаления проекта или дефекта.
+
+Удаление дефекта в API удаляет только строку defects и в той же
+транзакции ставит задачу в cleanup_jobs. Событие project.deleted из
+журнала сервиса проектов (project_registry.py) тоже ставит задачу.
+Воркер разбирает задачи небольшими пачками: в одной транзакции не
+больше CLEANUP_BATCH_SIZE строк. Между пачками есть пауза, чтобы
+запись SQLite не блокировалась надолго. Счётчики задачи обновляются
+вместе с пачкой, поэтому прогресс точен, а после рестарта задача
+продолжается с того места, где остановилась.
+
+Каскад проекта удаляет дефекты пачками вместе с комментариями,
+историей статусов и вложениями, а по каждому дефекту публикует
+defect.deleted. Файлы blob-ов удаляются после коммита, когда на них
+не остаётся ссылок.
+
+Сверка (sweep) ищет сироты, которые остались от удалений до появления
+каскада или от событий, пропущенных, пока сервис был остановлен. Это
+дочерние записи без дефекта и дефекты проектов, которых нет в реестре.
+Проект-кандидат ставится в очередь, только если его нет и в реестре,
+синхронизированном уже после чтения дефектов: проект, созданный между
+копией реестра и запросом, к этому моменту в журнале уже есть. Перед
+каждой пачкой задача проекта ещё раз сверяется с реестром и отменяется,
+если проект существует.
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+import models
+import search
+import storage
+from database import SessionLocal
+import events
+
+logger = logging.getLogger(__name__)
+
+CLEANUP_BATCH_SIZE = int(os.getenv("CLEANUP_BATCH_SIZE", "500"))
+# Дефектов проекта за один шаг: их дочерние записи удаляются прежде самих дефектов
+CLEANUP_DEFECT_BATCH_SIZE = int(os.getenv("CLEANUP_DEFECT_BATCH_SIZE", "100"))
+CLEANUP_BATCH_PAUSE = float(os.getenv("CLEANUP_BATCH_PAUSE", "0.02"))
+CLEANUP_POLL_INTERVAL = float(os.getenv("CLEANUP_POLL_INTERVAL", "5"))
+# 0 — только по запросу POST /cleanup/sweep
+CLEANUP_SWEEP_INTERVAL = float(os.getenv("CLEANUP_SWEEP_INTERVAL", "3600"))
+
+
+def enqueue(db: Session, kind: str, target_id: int, requested_by: Optional[int] = None) -> models.CleanupJob:
+    """Ставит задачу (без коммита); незавершённая задача на ту же цель переиспользуется"""
+    job = db.query(models.CleanupJob).filter(
+        models.CleanupJob.kind == kind,
+        models.CleanupJob.target_id == target_id,
+        models.CleanupJob.status.in_(["pending", "running"]),
+    ).first()
+    if job is None:
+        job = models.CleanupJob(kind=kind, target_id=target_id, requested_by=requested_by, created_at=datetime.utcnow())
+        db.add(job)
+    return job
+
+
+def _purge_children_batch(db: Session, job: models.CleanupJob, defect_ids: List[int], cutoff: Optional[datetime], batch_size: int) -> Tuple[int, List[str], List[str]]:
+    """
+    Одна пачка комментариев, истории или вложений дефектов defect_ids.
+    cutoff отсекает записи, созданные после удаления дефекта: SQLite может
+    выдать тот же id новому дефекту, и его записи трогать нельзя.
+    Возвращает (удалено строк, blob-ы без ссылок и старые файлы к удалению после коммита).
+    """
+    for model, created, counter in (
+        (models.Comment, models.Comment.created_at, "comments_removed"),
+        (models.DefectStatusHistory, models.DefectStatusHistory.changed_at, "history_removed"),
+    ):
+        query = db.query(model.id).filter(model.defect_id.in_(defect_ids))
+        if cutoff is not None:
+            query = query.filter(or_(created <= cutoff, created.is_(None)))
+        ids = [row[0] for row in query.limit(batch_size)]
+        if ids:
+            if model is models.Comment:
+                search.unindex_comments(db, ids)
+            db.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+            setattr(job, counter, getattr(job, counter) + len(ids))
+            return len(ids), [], []
+
+    query = db.query(models.Attachment).filter(models.Attachment.defect_id.in_(defect_ids))
+    if cutoff is not None:
+        query = query.filter(or_(models.Attachment.uploaded_at <= cutoff, models.Attachment.uploaded_at.is_(None)))
+    attachments = query.limit(batch_size).all()
+    blobs: List[str] = []
+    legacy_files: List[str] = []
+    for attachment in attachments:
+        if attachment.content_hash is None:
+            legacy_files.append(attachment.file_path)
+        elif storage.release(db, attachment.content_hash):
+            blobs.append(attachment.content_hash)
+        db.delete(attachment)
+    job.attachments_removed += len(attachments)
+    return len(attachments), blobs, legacy_files
+
+
+def run_step(db: Session, job: models.CleanupJob, batch_size: int = CLEANUP_BATCH_SIZE) -> bool:
+    """
+    Одна ограниченная пачка задачи в одной транзакции.
+    Возвращает True, если работа ещё осталась.
+    """
+    if job.kind == "defect":
+        removed, blobs, legacy_files = _purge_children_batch(db, job, [job.target_id], job.created_at, batch_size)
+        more = removed > 0
+    else:
+        # Дефекты проекта, созданные до его удаления; их дочерние записи удаляются целиком
+        defects = db.query(models.Defect.id).filter(
+            models.Defect.project_id == job.target_id,
+            or_(models.Defect.created_at <= job.created_at, models.Defect.created_at.is_(None)),
+        ).order_by(models.Defect.id).limit(CLEANUP_DEFECT_BATCH_SIZE).all()
+        defect_ids = [row[0] for row in defects]
+        blobs, legacy_files = [], []
+        more = bool(defect_ids)
+        if defect_ids:
+            removed, blobs, legacy_files = _purge_children_batch(db, job, defect_ids, None, batch_size)
+            if removed == 0:
+                for defect_id in defect_ids:
+                    search.unindex_defect(db, defect_id)
+                db.query(models.Defect).filter(models.Defect.id.in_(defect_ids)).delete(synchronize_session=False)
+                job.defects_removed += len(defect_ids)
+                # defect.deleted — в транзакции пачки: событие есть ровно у удалённых дефектов
+                for defect_id in defect_ids:
+                    events.publish_defect_deleted(db, defect_id=defect_id, deleted_by=job.requested_by, project_id=job.target_id)
+    if not more:
+        job.status = "done"
+        job.finished_at = datetime.utcnow()
+    db.commit()
+
+    # Файлы — только после коммита: при откате ссылки на них остались бы
+    removed_files = sum(1 for content_hash in blobs if storage.collect(db, content_hash))
+    for path in legacy_files:
+        if os.path.exists(path):
+            os.remove(path)
+            removed_files += 1
+    if removed_files:
+        job.files_removed += removed_files
+        db.commit()
+    return more
+
+
+def find_orphans(db: Session, known_projects=None) -> Dict[str, List[int]]:
+    """
+    Цели сверки: дефекты, от которых остались дочерние записи, и (если
+    передан реестр известных проектов) проекты, которых уже нет.
+    Все запросы читают только индексы по defect_id / project_id.
+    """
+    defect_ids = set()
+    for model in (models.Comment, models.Attachment, models.DefectStatusHistory):
+        existing = db.query(models.Defect.id).filter(models.Defect.id == model.defect_id).exists()
+        defect_ids.update(row[0] for row in db.query(model.defect_id).filter(~existing).distinct())
+    project_ids = []
+    if known_projects is not None:
+        project_ids = [row[0] for row in db.query(models.Defect.project_id).distinct() if row[0] not in known_projects]
+    return {"defect": sorted(defect_ids), "project": project_ids}
+
+
+class CleanupWorker:
+    """Один фоновый воркер: задачи по очереди, пачки — в потоке, вне event loop"""
+
+    def __init__(self, batch_size: int = CLEANUP_BATCH_SIZE, pause: float = CLEANUP_BATCH_PAUSE, poll_interval: float = CLEANUP_POLL_INTERVAL, sweep_interval: float = CLEANUP_SWEEP_INTERVAL):
+        self.batch_size = batch_size
+        self.pause = pause
+        self.poll_interval = poll_interval
+        self.sweep_interval = sweep_interval
+        self.registry = None  # project_registry.ProjectRegistry для сверки проектов
+        self.current_job: Optional[int] = None
+        self.last_sweep: Optional[dict] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+
+    async def start(self, registry=None) -> None:
+        self.registry = registry
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        # Задачи, прерванные рестартом, продолжаются: шаги идемпотентны
+        await asyncio.to_thread(self._requeue_running)
+        self._tasks = [asyncio.create_task(self._run())]
+        if self.sweep_interval > 0:
+            self._tasks.append(asyncio.create_task(self._sweep_loop()))
+
+    async def stop(self) -> None:
+        self._stopping = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def wake(self) -> None:
+        """Можно вызывать из любого потока"""
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def enqueue_project(self, project_id: int, deleted_by: Optional[int] = None) -> None:
+        """Обработчик project.deleted из реестра проектов (вызывается в потоке)"""
+        db = SessionLocal()
+        try:
+            enqueue(db, "project", project_id, deleted_by)
+            db.commit()
+        finally:
+            db.close()
+        self.wake()
+
+    def _requeue_running(self) -> None:
+        db = SessionLocal()
+        try:
+            db.query(models.CleanupJob).filter(models.CleanupJob.status == "running").update({"status": "pending"}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _claim(self) -> Optional[int]:
+        db = SessionLocal()
+        try:
+            job = db.query(models.CleanupJob).filter(models.CleanupJob.status == "pending").order_by(models.CleanupJob.id).first()
+            if job is None:
+                return None
+            job.status = "running"
+            job.started_at = job.started_at or datetime.utcnow()
+            db.commit()
+            return job.id
+        finally:
+            db.close()
+
+    def _step(self, job_id: int) -> bool:
+        db = SessionLocal()
+        try:
+            job = db.query(models.CleanupJob).filter(models.CleanupJob.id == job_id).first()
+            if job is None or job.status != "running":
+                return False
+            if job.kind == "project" and self.registry is not None and self.registry.knows(job.target_id):
+                # Проект существует: задачу поставила сверка по устаревшим данным
+                logger.warning("Cleanup job %s cancelled: project %s exists", job.id, job.target_id)
+                job.status = "cancelled"
+                job.error = "project exists"
+                job.finished_at = datetime.utcnow()
+                db.commit()
+                return False
+            try:
+                return run_step(db, job, self.batch_size)
+            except Exception as e:
+                db.rollback()
+                logger.error("Cleanup job %s (%s %s) failed: %s", job.id, job.kind, job.target_id, e, exc_info=True)
+                job.status = "failed"
+                job.error = str(e)
+                job.finished_at = datetime.utcnow()
+                db.commit()
+                return False
+        finally:
+            db.close()
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            job_id = await asyncio.to_thread(self._claim)
+            if job_id is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self.current_job = job_id
+            while not self._stopping and await asyncio.to_thread(self._step, job_id):
+                # Пауза между пачками: запросы API успевают взять блокировку записи
+                await asyncio.sleep(self.pause)
+            self.current_job = None
+
+    async def _sync_registry(self) -> bool:
+        """True — реестр проектов только что синхронизирован и ему можно верить"""
+        try:
+            await self.registry.sync()
+        except Exception as e:
+            logger.warning("Cleanup sweep: project registry unavailable, skipping project check: %s", e)
+            return False
+        return self.registry.ready and self.registry.fresh
+
+    async def sweep(self) -> dict:
+        """Ставит задачи на найденные сироты; проекты — только по свежему реестру"""
+        known_projects = None
+        if self.registry is not None and await self._sync_registry():
+            known_projects = self.registry.project_ids()
+
+        orphans = await asyncio.to_thread(self._find_orphans, known_projects)
+        if orphans["project"]:
+            # Дефекты прочитаны после копии реестра: их проект мог появиться в промежутке.
+            # Всё, что успело попасть в БД дефектов, уже есть в журнале проектов
+            if await self._sync_registry():
+                orphans["project"] = [project_id for project_id in orphans["project"] if not self.registry.knows(project_id)]
+            else:
+                orphans["project"] = []
+        await asyncio.to_thread(self._enqueue_orphans, orphans)
+
+        found = {kind: len(targets) for kind, targets in orphans.items()}
+        self.last_sweep = {"at": datetime.utcnow().isoformat(), "defects": found["defect"], "projects": found["project"], "projects_checked": known_projects is not None}
+        if found["defect"] or found["project"]:
+            logger.info("Cleanup sweep queued %s orphaned defects and %s deleted projects", found["defect"], found["project"])
+            self.wake()
+        return self.last_sweep
+
+    def _find_orphans(self, known_projects) -> Dict[str, List[int]]:
+        db = SessionLocal()
+        try:
+            return find_orphans(db, known_projects)
+        finally:
+            db.close()
+
+    def _enqueue_orphans(self, orphans: Dict[str, List[int]]) -> None:
+        db = SessionLocal()
+        try:
+            for kind, targets in orphans.items():
+                for target_id in targets:
+                    enqueue(db, kind, target_id)
+            db.commit()
+        finally:
+            db.close()
+
+    async def _sweep_loop(self) -> None:
+        while not self._stopping:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error("Cleanup sweep failed: %s", e, exc_info=True)
+            await asyncio.sleep(self.sweep_interval)
+
+    def snapshot(self) -> dict:
+        db = SessionLocal()
+        try:
+            counts = dict(db.query(models.CleanupJob.status, func.count()).group_by(models.CleanupJob.status).all())
+        finally:
+            db.close()
+        return {"jobs": counts, "current_job": self.current_job, "last_sweep": self.last_sweep, "batch_size": self.batch_size}
+
+
+cleanup_worker = CleanupWorker()
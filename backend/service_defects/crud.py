@@ -1,44 +1,196 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import DateTime, bindparam, case, func, text
 from sqlalchemy.orm import Session
+import os
+import cleanup
+import due_dates
+import events
 import models
 import schemas
+import search
+import storage
 
 def get_defect(db: Session, defect_id: int):
     return db.query(models.Defect).filter(models.Defect.id == defect_id).first()
 
-def get_defects(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Defect).offset(skip).limit(limit).all()
+def get_defects(db: Session, skip: int = 0, limit: int = 100, columns: Optional[tuple] = None):
+    """columns — только эти колонки в SELECT (строки Row вместо объектов модели)"""
+    if columns is None:
+        return db.query(models.Defect).offset(skip).limit(limit).all()
+    return db.query(*(getattr(models.Defect, name) for name in columns)).offset(skip).limit(limit).all()
+
+def attach_activity(db: Session, defects: list):
+    """
+    Число комментариев, вложений и время последней активности для страницы
+    дефектов — один запрос с двумя сгруппированными подзапросами по индексам
+    ix_comments_defect_created и ix_attachments_defect_uploaded
+    """
+    ids = [d.id for d in defects]
+    if not ids:
+        return defects
+    comments = db.query(
+        models.Comment.defect_id.label("defect_id"),
+        func.count().label("count"),
+        func.max(models.Comment.created_at).label("last_at"),
+    ).filter(models.Comment.defect_id.in_(ids)).group_by(models.Comment.defect_id).subquery()
+    attachments = db.query(
+        models.Attachment.defect_id.label("defect_id"),
+        func.count().label("count"),
+        func.max(models.Attachment.uploaded_at).label("last_at"),
+    ).filter(models.Attachment.defect_id.in_(ids)).group_by(models.Attachment.defect_id).subquery()
+    rows = db.query(models.Defect.id, comments.c.count, comments.c.last_at, attachments.c.count, attachments.c.last_at) \
+        .outerjoin(comments, comments.c.defect_id == models.Defect.id) \
+        .outerjoin(attachments, attachments.c.defect_id == models.Defect.id) \
+        .filter(models.Defect.id.in_(ids)).all()
+    activity = {row[0]: row[1:] for row in rows}
+    for defect in defects:
+        comment_count, last_comment_at, attachment_count, last_attachment_at = activity.get(defect.id, (None, None, None, None))
+        defect.comment_count = comment_count or 0
+        defect.attachment_count = attachment_count or 0
+        moments = [t for t in (defect.created_at, defect.updated_at, last_comment_at, last_attachment_at) if t is not None]
+        defect.last_activity_at = max(moments) if moments else None
+    return defects
+
+def get_defect_detail(db: Session, defect_id: int, includes: set, comments_skip: int = 0, comments_limit: int = 100, attachments_skip: int = 0, attachments_limit: int = 100):
+    """
+    Дефект и страницы дочерних записей в одной сессии. Вместо жадной
+    загрузки связей — ограниченные запросы по индексам defect_id: связь
+    загрузила бы все комментарии сразу, а нужна одна страница
+    """
+    db_defect = get_defect(db, defect_id)
+    if db_defect is None or not includes:
+        return db_defect
+    # Итоги для пагинации и last_activity_at — тем же запросом, что и счётчики списка
+    attach_activity(db, [db_defect])
+    if "comments" in includes:
+        db_defect.comments = {
+            "total": db_defect.comment_count,
+            "skip": comments_skip,
+            "limit": comments_limit,
+            "items": get_comments_by_defect(db, defect_id, skip=comments_skip, limit=comments_limit),
+        }
+    if "attachments" in includes:
+        db_defect.attachments = {
+            "total": db_defect.attachment_count,
+            "skip": attachments_skip,
+            "limit": attachments_limit,
+            "items": get_attachments_by_defect(db, defect_id, skip=attachments_skip, limit=attachments_limit),
+        }
+    return db_defect
 
 def create_defect(db: Session, defect: schemas.DefectCreate, reporter_id: int):
-    db_defect = models.Defect(**defect.model_dump(), reporter_id=reporter_id)
+    db_defect = models.Defect(**defect.model_dump(), reporter_id=reporter_id, created_at=datetime.utcnow())
     db.add(db_defect)
+    db.flush()
+    # Начальный статус — первая запись истории
+    db.add(models.DefectStatusHistory(
+        defect_id=db_defect.id,
+        project_id=db_defect.project_id,
+        from_status=None,
+        to_status=db_defect.status,
+        changed_by=reporter_id,
+        changed_at=db_defect.created_at,
+    ))
+    search.index_defect(db, db_defect)
+    # Событие — в той же транзакции, что и дефект
+    events.publish_defect_created(db, defect_id=db_defect.id, title=db_defect.title, status=db_defect.status, priority=db_defect.priority, project_id=db_defect.project_id, reporter_id=reporter_id)
     db.commit()
     db.refresh(db_defect)
     return db_defect
 
-def update_defect(db: Session, defect_id: int, defect: schemas.DefectCreate):
+def _record_status_change(db: Session, db_defect: models.Defect, from_status: str, changed_by: int, changed_at: datetime):
+    # Время входа в текущий статус — последняя запись истории (индекс defect_id, changed_at);
+    # для дефектов, созданных до появления истории, — дата создания
+    entered_at = db.query(func.max(models.DefectStatusHistory.changed_at)).filter(
+        models.DefectStatusHistory.defect_id == db_defect.id
+    ).scalar() or db_defect.created_at
+    db.add(models.DefectStatusHistory(
+        defect_id=db_defect.id,
+        project_id=db_defect.project_id,
+        from_status=from_status,
+        to_status=db_defect.status,
+        changed_by=changed_by,
+        changed_at=changed_at,
+        duration_seconds=(changed_at - entered_at).total_seconds() if entered_at else None,
+    ))
+
+def update_defect(db: Session, defect_id: int, defect: schemas.DefectCreate, changed_by: Optional[int] = None):
     db_defect = db.query(models.Defect).filter(models.Defect.id == defect_id).first()
     if db_defect:
+        old_status = db_defect.status
+        old_project_id = db_defect.project_id
+        old_due_date = db_defect.due_date
         for key, value in defect.model_dump().items():
             setattr(db_defect, key, value)
-        from datetime import datetime
         db_defect.updated_at = datetime.utcnow()
+        # Новый срок или переоткрытие — планировщик снова пометит дефект, когда срок истечёт
+        reopened = old_status in due_dates.CLOSED_STATUSES and db_defect.status not in due_dates.CLOSED_STATUSES
+        if due_dates.naive_utc(db_defect.due_date) != old_due_date or reopened:
+            db_defect.overdue_at = None
+        if db_defect.project_id != old_project_id:
+            db.query(models.Attachment).filter(models.Attachment.defect_id == defect_id).update({"project_id": db_defect.project_id}, synchronize_session=False)
+            # История переходов считается в time-in-status нового проекта
+            db.query(models.DefectStatusHistory).filter(models.DefectStatusHistory.defect_id == defect_id).update({"project_id": db_defect.project_id}, synchronize_session=False)
+        changed_by = changed_by if changed_by is not None else db_defect.reporter_id
+        if db_defect.status != old_status:
+            _record_status_change(db, db_defect, old_status, changed_by, db_defect.updated_at)
+            events.publish_defect_status_changed(db, defect_id=defect_id, old_status=old_status, new_status=db_defect.status, changed_by=changed_by, project_id=db_defect.project_id)
+        events.publish_defect_updated(db, defect_id=defect_id, title=db_defect.title, updated_by=changed_by, project_id=db_defect.project_id, priority=db_defect.priority)
+        search.index_defect(db, db_defect)
         db.commit()
         db.refresh(db_defect)
     return db_defect
 
-def delete_defect(db: Session, defect_id: int):
+def delete_defect(db: Session, defect_id: int, deleted_by: Optional[int] = None):
     db_defect = db.query(models.Defect).filter(models.Defect.id == defect_id).first()
     if db_defect:
         db.delete(db_defect)
+        search.unindex_defect(db, defect_id)
+        # Комментарии, история и вложения удаляются фоном пачками (cleanup.py)
+        cleanup.enqueue(db, "defect", defect_id, deleted_by)
+        events.publish_defect_deleted(db, defect_id=defect_id, deleted_by=deleted_by, project_id=db_defect.project_id)
         db.commit()
     return db_defect
 
+def get_overdue_defects(db: Session, project_id: Optional[int] = None, skip: int = 0, limit: int = 100):
+    return due_dates.overdue_query(db, datetime.utcnow(), project_id).order_by(models.Defect.due_date).offset(skip).limit(limit).all()
+
+def count_overdue_defects(db: Session, project_id: Optional[int] = None) -> int:
+    return due_dates.overdue_query(db, datetime.utcnow(), project_id).with_entities(func.count()).scalar()
+
+def get_defect_summary(db: Session, project_id: Optional[int] = None) -> dict:
+    """
+    Все цифры сводки одним SELECT — из одного снимка таблицы, просрочка не
+    может превысить total. Правила прежнего отчёта: закрыт — статус из
+    CLOSED_STATUSES, открыт — любой другой, в том числе пустой; просрочен —
+    срок строго раньше now
+    """
+    now = datetime.utcnow()
+    is_closed = models.Defect.status.in_(due_dates.CLOSED_STATUSES)
+    is_open = models.Defect.status.is_(None) | models.Defect.status.notin_(due_dates.CLOSED_STATUSES)
+    query = db.query(
+        func.count(models.Defect.id),
+        func.count(case((is_closed, models.Defect.id))),
+        func.count(case((is_open & (models.Defect.due_date < now), models.Defect.id))),
+        func.count(func.distinct(case((is_open, models.Defect.project_id)))),
+    )
+    if project_id is not None:
+        query = query.filter(models.Defect.project_id == project_id)
+    total, completed, overdue, active_projects = query.one()
+    return {"total": total, "completed": completed, "overdue": overdue, "active_projects": active_projects, "as_of": now, "project_id": project_id}
+
+def search_defects(db: Session, query: str, project_id: Optional[int] = None, skip: int = 0, limit: int = 20):
+    return search.search_defects(db, query=query, project_id=project_id, skip=skip, limit=limit)
+
 def get_comments_by_defect(db: Session, defect_id: int, skip: int = 0, limit: int = 100):
     return db.query(models.Comment).filter(models.Comment.defect_id == defect_id).offset(skip).limit(limit).all()
 
 def create_comment(db: Session, comment: schemas.CommentCreate, defect_id: int, author_id: int):
     db_comment = models.Comment(content=comment.content, defect_id=defect_id, author_id=author_id)
     db.add(db_comment)
+    db.flush()
+    search.index_comment(db, db_comment)
     db.commit()
     db.refresh(db_comment)
     return db_comment
@@ -50,10 +202,122 @@ def get_attachments_by_defect(db: Session, defect_id: int, skip: int = 0, limit:
 def get_attachment(db: Session, attachment_id: int):
     return db.query(models.Attachment).filter(models.Attachment.id == attachment_id).first()
 
+def create_attachment(db: Session, defect_id: int, filename: str, uploader_id: int, staged: storage.StagedBlob):
+    created = False
+    try:
+        file_path, created = storage.acquire(db, staged)
+        db_attachment = models.Attachment(
+            filename=filename,
+            file_path=file_path,
+            defect_id=defect_id,
+            uploader_id=uploader_id,
+            content_hash=staged.content_hash,
+            size=staged.size,
+            mime_type=staged.mime_type,
+            storage_key=staged.storage_key,
+            project_id=db.query(models.Defect.project_id).filter(models.Defect.id == defect_id).scalar(),
+        )
+        db.add(db_attachment)
+        db.commit()
+    except Exception:
+        storage.discard(staged)
+        if created:
+            # Файл положила эта загрузка, а ссылка на него не зафиксирована;
+            # убираем до отката, пока строка blob-а ещё заблокирована
+            storage.remove_blob(staged.content_hash)
+        db.rollback()
+        raise
+    db.refresh(db_attachment)
+    return db_attachment
+
 def delete_attachment(db: Session, attachment_id: int):
     db_attachment = db.query(models.Attachment).filter(models.Attachment.id == attachment_id).first()
     if db_attachment:
+        content_hash = db_attachment.content_hash
+        unreferenced = storage.release(db, content_hash) if content_hash else False
         db.delete(db_attachment)
         db.commit()
+        # Файл удаляем только после коммита: при откате ссылка на него останется
+        if unreferenced:
+            storage.collect(db, content_hash)
+        elif content_hash is None and os.path.exists(db_attachment.file_path):
+            # Вложение из старой схемы хранения (attachments/<defect_id>/<filename>)
+            os.remove(db_attachment.file_path)
     return db_attachment
 
+
+def get_cleanup_jobs(db: Session, status: Optional[str] = None, skip: int = 0, limit: int = 100):
+    query = db.query(models.CleanupJob)
+    if status is not None:
+        query = query.filter(models.CleanupJob.status == status)
+    return query.order_by(models.CleanupJob.id.desc()).offset(skip).limit(limit).all()
+
+def get_cleanup_job(db: Session, job_id: int):
+    return db.query(models.CleanupJob).filter(models.CleanupJob.id == job_id).first()
+
+
+def iter_defects_snapshot(db: Session, batch_size: int = 5000):
+    """Текущее состояние дефектов для /events/snapshot, построчно и без загрузки всей таблицы"""
+    query = db.query(
+        models.Defect.id, models.Defect.project_id, models.Defect.status,
+        models.Defect.priority, models.Defect.reporter_id, models.Defect.created_at,
+    ).order_by(models.Defect.id)
+    return query.yield_per(batch_size)
+
+def get_status_history(db: Session, defect_id: int, skip: int = 0, limit: int = 100):
+    return db.query(models.DefectStatusHistory).filter(
+        models.DefectStatusHistory.defect_id == defect_id
+    ).order_by(models.DefectStatusHistory.changed_at, models.DefectStatusHistory.id).offset(skip).limit(limit).all()
+
+# Перцентили по методу nearest-rank: минимальная длительность, ранг которой >= p * n.
+# Читает только покрывающий индекс (project_id, from_status, duration_seconds, changed_at):
+# фильтр since проверяется по нему же, без обращения к строкам таблицы.
+TIME_IN_STATUS_SQL = text("""
+    WITH ranked AS (
+        SELECT from_status AS status,
+               duration_seconds AS d,
+               ROW_NUMBER() OVER (PARTITION BY from_status ORDER BY duration_seconds) AS rn,
+               COUNT(*) OVER (PARTITION BY from_status) AS n
+        FROM defect_status_history
+        WHERE project_id = :project_id
+          AND from_status IS NOT NULL
+          AND duration_seconds IS NOT NULL
+          AND (:since IS NULL OR changed_at >= :since)
+    )
+    SELECT status,
+           MAX(n) AS transitions,
+           AVG(d) AS mean_seconds,
+           MIN(CASE WHEN rn >= 0.50 * n THEN d END) AS p50_seconds,
+           MIN(CASE WHEN rn >= 0.90 * n THEN d END) AS p90_seconds,
+           MIN(CASE WHEN rn >= 0.95 * n THEN d END) AS p95_seconds,
+           MAX(d) AS max_seconds
+    FROM ranked
+    GROUP BY status
+    ORDER BY status
+""").bindparams(bindparam("since", type_=DateTime))
+
+def get_time_in_status(db: Session, project_id: int, since: Optional[datetime] = None):
+    """Среднее и перцентили времени в каждом статусе по завершённым переходам проекта"""
+    return db.execute(TIME_IN_STATUS_SQL, {"project_id": project_id, "since": since}).mappings().all()
+
+def get_storage_usage(db: Session, project_id: Optional[int] = None):
+    """Занятое вложениями место по проектам; оба запроса покрываются ix_attachments_project_usage"""
+    logical = db.query(
+        models.Attachment.project_id,
+        func.count(models.Attachment.id),
+        func.coalesce(func.sum(models.Attachment.size), 0),
+    ).filter(models.Attachment.project_id.isnot(None))
+    unique_blobs = db.query(
+        models.Attachment.project_id, models.Attachment.content_hash, models.Attachment.size
+    ).filter(models.Attachment.project_id.isnot(None), models.Attachment.content_hash.isnot(None))
+    if project_id is not None:
+        logical = logical.filter(models.Attachment.project_id == project_id)
+        unique_blobs = unique_blobs.filter(models.Attachment.project_id == project_id)
+    unique_blobs = unique_blobs.distinct().subquery()
+    stored = dict(
+        db.query(unique_blobs.c.project_id, func.sum(unique_blobs.c.size)).group_by(unique_blobs.c.project_id).all()
+    )
+    return [
+        {"project_id": pid, "attachments": count, "logical_bytes": total, "stored_bytes": stored.get(pid) or 0}
+        for pid, count, total in logical.group_by(models.Attachment.project_id).order_by(models.Attachment.project_id).all()
+    ]
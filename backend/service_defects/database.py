@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -24,5 +24,33 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
-
-
+def add_missing_columns(table: str, columns: dict) -> None:
+    """
+    Грубая "миграция" для dev: create_all не меняет существующие таблицы,
+    поэтому недостающие колонки добавляем через ALTER TABLE.
+    columns: {имя: SQL-определение}
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table(table):
+        return
+    existing = {col["name"] for col in inspector.get_columns(table)}
+    with engine.begin() as conn:
+        for name, ddl in columns.items():
+            if name not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+
+def ensure_indexes(table) -> None:
+    """Создаёт индексы модели, появившиеся после создания таблицы"""
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+
+def drop_index(table: str, name: str) -> bool:
+    """Удаляет индекс, заменённый в модели другим; True — индекс был"""
+    inspector = inspect(engine)
+    if not inspector.has_table(table) or name not in {index["name"] for index in inspector.get_indexes(table)}:
+        return False
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP INDEX {name}"))
+    return True
@@ -0,0 +1,155 @@
+"""
+Отдача файлов вложений с поддержкой Range, ETag и Last-Modified.
+
+FileResponse из нашей версии Starlette не умеет Range, поэтому ответ
+собран вручную. Если ASGI-сервер поддерживает расширение
+http.response.zerocopysend, тело отдаётся через sendfile без копирования
+в userspace; иначе файл читается кусками через os.pread в threadpool.
+"""
+
+import mimetypes
+import os
+import stat
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+CHUNK_SIZE = 256 * 1024
+
+
+def make_etag(content_hash: Optional[str], st: os.stat_result) -> str:
+    # Для blob-ов хеш содержимого — сильный ETag; для старых файлов — слабый по mtime/размеру
+    if content_hash:
+        return f'"{content_hash}"'
+    return f'W/"{int(st.st_mtime)}-{st.st_size}"'
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Разбирает "bytes=a-b" / "bytes=a-" / "bytes=-n" в (start, end) включительно.
+    Несколько диапазонов не поддерживаются — тогда отдаётся весь файл (None).
+    Неудовлетворимый диапазон — ValueError.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_s, _, end_s = spec.strip().partition("-")
+    if start_s == "":
+        if not end_s.isdigit():
+            raise ValueError("invalid range")
+        length = int(end_s)
+        if length == 0:
+            raise ValueError("unsatisfiable range")
+        return max(size - length, 0), size - 1
+    if not start_s.isdigit() or (end_s and not end_s.isdigit()):
+        raise ValueError("invalid range")
+    start = int(start_s)
+    end = min(int(end_s), size - 1) if end_s else size - 1
+    if start >= size or start > end:
+        raise ValueError("unsatisfiable range")
+    return start, end
+
+
+class RangeFileResponse(Response):
+    def __init__(self, path: str, request_headers: Headers, method: str = "GET", filename: Optional[str] = None, media_type: Optional[str] = None, content_hash: Optional[str] = None, cache_control: str = "private, max-age=3600"):
+        self.path = path
+        self.send_body = method != "HEAD"
+        self.background = None
+        st = os.stat(path)
+        if not stat.S_ISREG(st.st_mode):
+            raise FileNotFoundError(path)
+        size = st.st_size
+        etag = make_etag(content_hash, st)
+        last_modified = formatdate(st.st_mtime, usegmt=True)
+        if media_type is None:
+            media_type = mimetypes.guess_type(filename or path)[0] or "application/octet-stream"
+        self.media_type = media_type
+
+        headers = {
+            "accept-ranges": "bytes",
+            "etag": etag,
+            "last-modified": last_modified,
+            "cache-control": cache_control,
+        }
+        if filename:
+            headers["content-disposition"] = f"attachment; filename*=UTF-8''{quote(filename)}"
+
+        self.start, self.length = 0, size
+        if self._not_modified(request_headers, etag, st.st_mtime):
+            self.status_code = 304
+            self.length = 0
+        else:
+            self.status_code = 200
+            range_header = request_headers.get("range")
+            if range_header and self._if_range_matches(request_headers.get("if-range"), etag, last_modified):
+                try:
+                    byte_range = parse_range(range_header, size)
+                except ValueError:
+                    byte_range = None
+                    self.status_code = 416
+                    self.length = 0
+                    headers["content-range"] = f"bytes */{size}"
+                if byte_range is not None:
+                    start, end = byte_range
+                    self.status_code = 206
+                    self.start, self.length = start, end - start + 1
+                    headers["content-range"] = f"bytes {start}-{end}/{size}"
+            headers["content-length"] = str(self.length)
+
+        self.init_headers(headers)
+        if self.status_code == 304:
+            # У 304 нет тела, content-type от init_headers ему не нужен
+            self.raw_headers = [(k, v) for k, v in self.raw_headers if k != b"content-type"]
+
+    @staticmethod
+    def _not_modified(request_headers: Headers, etag: str, mtime: float) -> bool:
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            weak = etag[2:] if etag.startswith("W/") else etag
+            return "*" in tags or any(tag.removeprefix("W/") == weak for tag in tags)
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    @staticmethod
+    def _if_range_matches(if_range: Optional[str], etag: str, last_modified: str) -> bool:
+        if if_range is None:
+            return True
+        # If-Range допускает только сильное сравнение
+        return if_range == last_modified or (if_range == etag and not etag.startswith("W/"))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not self.send_body or self.length == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        file = await run_in_threadpool(open, self.path, "rb")
+        try:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({"type": "http.response.zerocopysend", "file": file, "offset": self.start, "count": self.length, "more_body": False})
+                return
+            fd = file.fileno()
+            offset, remaining = self.start, self.length
+            while remaining > 0:
+                chunk = await run_in_threadpool(os.pread, fd, min(CHUNK_SIZE, remaining), offset)
+                if not chunk:
+                    break
+                offset += len(chunk)
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # Файл укоротился во время отдачи — закрываем тело, клиент увидит недостачу
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            file.close()
@@ -0,0 +1,215 @@
+"""
+Планировщик сроков: помечает дефект просроченным в момент истечения
+due_date и публикует defect.overdue.
+
+Сроки ближайшего окна (DUE_SCHEDULER_HORIZON секунд) лежат в куче
+(heapq) по due_date. Окно читается диапазонным запросом по индексу
+ix_defects_due_status. Следующее окно подгружается заранее, когда до
+конца текущего остаётся половина. Планировщик спит до ближайшего срока.
+Создание или изменение дефекта кладёт новый срок в кучу (schedule) и
+будит планировщик, если этот срок стал ближайшим. Полных сканов таблицы
+по расписанию нет.
+
+Запись в куче перед срабатыванием перепроверяется в БД: срок мог
+сдвинуться, дефект мог закрыться или уже быть помечен. Поэтому
+устаревшие и повторные записи из кучи не удаляются, а просто
+пропускаются.
+
+При старте сроки, истёкшие, пока сервис был остановлен, помечаются
+пачками. Событие публикуется, только если срок истёк не раньше чем
+DUE_CATCHUP_WINDOW секунд назад: о давно просроченных дефектах
+напоминание уже не нужно.
+
+due_date хранится без часового пояса, время сервиса — UTC
+(datetime.utcnow), сравниваем так же.
+"""
+
+import asyncio
+import heapq
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal
+import events
+
+logger = logging.getLogger(__name__)
+
+DUE_SCHEDULER_ENABLED = os.getenv("DUE_SCHEDULER_ENABLED", "true").lower() == "true"
+DUE_SCHEDULER_HORIZON = float(os.getenv("DUE_SCHEDULER_HORIZON", "3600"))
+DUE_CATCHUP_WINDOW = float(os.getenv("DUE_CATCHUP_WINDOW", "86400"))
+DUE_BATCH_SIZE = int(os.getenv("DUE_BATCH_SIZE", "500"))
+
+# Закрытый дефект не может быть просрочен
+CLOSED_STATUSES = ("Закрыта", "Отменена")
+
+
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Срок в том виде, в каком он лежит в БД (SQLite отбрасывает tzinfo)"""
+    if value is not None and value.tzinfo is not None:
+        return value.replace(tzinfo=None)
+    return value
+
+
+def overdue_query(db: Session, now: datetime, project_id: Optional[int] = None):
+    """Просроченные на момент now: диапазон due_date <= now по индексу (due_date, status)"""
+    query = db.query(models.Defect).filter(models.Defect.due_date <= now, models.Defect.status.notin_(CLOSED_STATUSES))
+    if project_id is not None:
+        query = query.filter(models.Defect.project_id == project_id)
+    return query
+
+
+class DueDateScheduler:
+    """Куча (due_date, defect_id) ближайших сроков и один таймер на ближайший"""
+
+    def __init__(self, horizon: float = DUE_SCHEDULER_HORIZON, catchup_window: float = DUE_CATCHUP_WINDOW, batch_size: int = DUE_BATCH_SIZE):
+        self.horizon = timedelta(seconds=horizon)
+        self.catchup_window = timedelta(seconds=catchup_window)
+        self.batch_size = batch_size
+        self.flagged = 0
+        self.published = 0
+        self.caught_up: Optional[int] = None
+        self.last_lag_ms: Optional[float] = None  # задержка последней пометки относительно срока
+        self._heap: List[Tuple[datetime, int]] = []
+        # Сроки не позже этого момента уже в куче; None — планировщик не запущен
+        self._loaded_until: Optional[datetime] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    async def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        now = datetime.utcnow()
+        # До загрузки первого окна новые сроки в кучу не кладутся: их прочитает запрос окна
+        self._loaded_until = now
+        self.caught_up = await asyncio.to_thread(self._catch_up, now)
+        if self.caught_up:
+            logger.info("Due date scheduler flagged %s defects overdue while the service was down", self.caught_up)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self._stopping = True
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._loaded_until = None
+
+    def schedule(self, defect_id: int, due_date: Optional[datetime], status: Optional[str]) -> None:
+        """Новый или изменённый срок дефекта; вызывается из event loop после коммита"""
+        due = naive_utc(due_date)
+        if self._loaded_until is None or due is None or status in CLOSED_STATUSES:
+            return
+        if due > self._loaded_until:
+            return  # попадёт в кучу с окном, в которое входит
+        heapq.heappush(self._heap, (due, defect_id))
+        if self._heap[0] == (due, defect_id):
+            self._wakeup.set()
+
+    # ---- работа с БД (в потоке) ----
+
+    def _load_window(self, after: datetime, until: datetime) -> List[Tuple[datetime, int]]:
+        db = SessionLocal()
+        try:
+            rows = db.query(models.Defect.due_date, models.Defect.id).filter(
+                models.Defect.due_date > after,
+                models.Defect.due_date <= until,
+                models.Defect.status.notin_(CLOSED_STATUSES),
+                models.Defect.overdue_at.is_(None),
+            ).all()
+            return [(row[0], row[1]) for row in rows]
+        finally:
+            db.close()
+
+    def _flag(self, db: Session, defects: List[models.Defect], now: datetime, notify_after: Optional[datetime] = None) -> int:
+        """Помечает дефекты и публикует события в той же транзакции"""
+        published = 0
+        for defect in defects:
+            defect.overdue_at = now
+            if notify_after is not None and defect.due_date < notify_after:
+                continue
+            events.publish_defect_overdue(db, defect.id, defect.project_id, defect.due_date.isoformat(), assignee_id=defect.assignee_id, reporter_id=defect.reporter_id)
+            published += 1
+        db.commit()
+        self.published += published
+        self.flagged += len(defects)
+        return len(defects)
+
+    def _fire(self, defect_ids: List[int], now: datetime) -> int:
+        db = SessionLocal()
+        try:
+            defects = overdue_query(db, now).filter(models.Defect.id.in_(defect_ids), models.Defect.overdue_at.is_(None)).all()
+            if defects:
+                self.last_lag_ms = round(max((now - d.due_date).total_seconds() for d in defects) * 1000, 1)
+            return self._flag(db, defects, now)
+        finally:
+            db.close()
+
+    def _catch_up(self, now: datetime) -> int:
+        total = 0
+        db = SessionLocal()
+        try:
+            while True:
+                defects = overdue_query(db, now).filter(models.Defect.overdue_at.is_(None)).order_by(models.Defect.due_date).limit(self.batch_size).all()
+                if not defects:
+                    return total
+                total += self._flag(db, defects, now, notify_after=now - self.catchup_window)
+        finally:
+            db.close()
+
+    # ---- таймер ----
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            now = datetime.utcnow()
+            if now + self.horizon / 2 >= self._loaded_until:
+                after, self._loaded_until = self._loaded_until, now + self.horizon
+                try:
+                    for entry in await asyncio.to_thread(self._load_window, after, self._loaded_until):
+                        heapq.heappush(self._heap, entry)
+                except Exception as e:
+                    # Окно перечитаем на следующем шаге
+                    self._loaded_until = after
+                    logger.error("Due date scheduler failed to load deadlines: %s", e, exc_info=True)
+                    await asyncio.sleep(1.0)
+                    continue
+            due: List[int] = []
+            while self._heap and self._heap[0][0] <= now:
+                due.append(heapq.heappop(self._heap)[1])
+            if due:
+                try:
+                    await asyncio.to_thread(self._fire, due, now)
+                except Exception as e:
+                    # Не помеченные дефекты вернутся в кучу с повторной попыткой через секунду
+                    logger.error("Due date scheduler failed to flag %s defects: %s", len(due), e, exc_info=True)
+                    for defect_id in due:
+                        heapq.heappush(self._heap, (now + timedelta(seconds=1), defect_id))
+                continue
+            self._wakeup.clear()
+            next_at = self._loaded_until - self.horizon / 2
+            if self._heap:
+                next_at = min(next_at, self._heap[0][0])
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max((next_at - datetime.utcnow()).total_seconds(), 0))
+            except asyncio.TimeoutError:
+                pass
+
+    def snapshot(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "scheduled": len(self._heap),
+            "next_due": self._heap[0][0].isoformat() if self._heap else None,
+            "loaded_until": self._loaded_until.isoformat() if self._loaded_until else None,
+            "flagged": self.flagged,
+            "published": self.published,
+            "caught_up_at_start": self.caught_up,
+            "last_lag_ms": self.last_lag_ms,
+        }
+
+
+due_scheduler: Optional[DueDateScheduler] = DueDateScheduler() if DUE_SCHEDULER_ENABLED else None
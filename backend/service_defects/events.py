@@ -2,17 +2,29 @@
 Доменные события для сервиса дефектов.
 
 В продакшне здесь будет интеграция с брокером сообщений (RabbitMQ, Kafka, Redis Pub/Sub).
-Сейчас это заглушка, которая логирует события.
+Сейчас события сохраняются в журнал event_log (shared/event_log.py),
+из которого их читают потребители, и дублируются в лог.
+
+Событие пишется в той же транзакции, что и изменение, которое его
+породило (outbox): publish_* вызываются до db.commit(), а ошибка
+записи откатывает изменение целиком.
 """
 
 import logging
-import json
 from datetime import datetime
 from typing import Dict, Any, Optional
 from uuid import uuid4
 
+from sqlalchemy.orm import Session
+
+from database import engine
+from shared.event_log import EventStore, on_commit
+from shared.metrics import record_event_published
+
 logger = logging.getLogger(__name__)
 
+event_store = EventStore(engine)
+
 
 class Event:
     """Доменное событие"""
@@ -35,31 +47,39 @@ class Event:
         }
 
 
-def publish_event(event: Event) -> bool:
+def publish_event(db: Session, event: Event) -> int:
     """
-    Публикует событие.
+    Публикует событие в транзакции db и возвращает позицию в журнале.
     
-    В продакшне здесь будет отправка в RabbitMQ/Kafka/Redis:
-    - await rabbitmq_client.publish(exchange="events", routing_key=event.event_type, message=event.to_json())
+    В продакшне здесь будет отправка в RabbitMQ/Kafka/Redis — из журнала,
+    отдельным релеем, а не из запроса.
     
-    Сейчас просто логируем.
+    Сейчас сохраняем в журнал событий и после коммита логируем.
+    Ошибку записи не глотаем: изменение без события не должно зафиксироваться.
     """
     try:
-        logger.info(
-            f"[EVENT] {event.event_type} | "
-            f"ID: {event.event_id} | "
-            f"User: {event.user_id} | "
-            f"Data: {json.dumps(event.data, ensure_ascii=False)}"
-        )
-        return True
-    except Exception as e:
-        logger.error(f"Failed to publish event: {e}", exc_info=True)
-        return False
+        position = event_store.append(event.to_dict(), session=db)
+    except Exception:
+        record_event_published(event.event_type, False)
+        raise
+    on_commit(db, lambda: _log_published(event, position))
+    return position
+
+
+def _log_published(event: Event, position: int) -> None:
+    # Ленивое форматирование: при отфильтрованном уровне строка не собирается,
+    # data уходит в JSON-лог отдельным полем
+    logger.info(
+        "[EVENT] %s | ID: %s | Position: %s | User: %s",
+        event.event_type, event.event_id, position, event.user_id,
+        extra={"event_data": event.data},
+    )
+    record_event_published(event.event_type, True)
 
 
 # Вспомогательные функции для быстрой публикации событий
 
-def publish_defect_created(defect_id: int, title: str, status: str, priority: str, project_id: int, reporter_id: int) -> bool:
+def publish_defect_created(db: Session, defect_id: int, title: str, status: str, priority: str, project_id: int, reporter_id: int) -> int:
     """Публикует событие 'создан заказ' (дефект)"""
     event = Event(
         event_type="defect.created",
@@ -73,47 +93,66 @@ def publish_defect_created(defect_id: int, title: str, status: str, priority: st
         },
         user_id=reporter_id
     )
-    return publish_event(event)
+    return publish_event(db, event)
 
 
-def publish_defect_status_changed(defect_id: int, old_status: str, new_status: str, changed_by: int) -> bool:
+def publish_defect_status_changed(db: Session, defect_id: int, old_status: str, new_status: str, changed_by: int, project_id: Optional[int] = None) -> int:
     """Публикует событие 'обновлён статус'"""
     event = Event(
         event_type="defect.status_changed",
         data={
             "defect_id": defect_id,
+            "project_id": project_id,
             "old_status": old_status,
             "new_status": new_status,
             "changed_by": changed_by
         },
         user_id=changed_by
     )
-    return publish_event(event)
+    return publish_event(db, event)
 
 
-def publish_defect_updated(defect_id: int, title: str, updated_by: int) -> bool:
-    """Публикует событие 'обновлён заказ' (дефект)"""
+def publish_defect_updated(db: Session, defect_id: int, title: str, updated_by: int, project_id: Optional[int] = None, priority: Optional[str] = None) -> int:
+    """Публикует событие 'обновлён заказ' (дефект); project_id и priority — уже новые значения"""
     event = Event(
         event_type="defect.updated",
         data={
             "defect_id": defect_id,
+            "project_id": project_id,
             "title": title,
+            "priority": priority,
             "updated_by": updated_by
         },
         user_id=updated_by
     )
-    return publish_event(event)
+    return publish_event(db, event)
 
 
-def publish_defect_deleted(defect_id: int, deleted_by: int) -> bool:
+def publish_defect_deleted(db: Session, defect_id: int, deleted_by: int, project_id: Optional[int] = None) -> int:
     """Публикует событие 'удалён заказ' (дефект)"""
     event = Event(
         event_type="defect.deleted",
         data={
             "defect_id": defect_id,
+            "project_id": project_id,
             "deleted_by": deleted_by
         },
         user_id=deleted_by
     )
-    return publish_event(event)
+    return publish_event(db, event)
 
+
+
+def publish_defect_overdue(db: Session, defect_id: int, project_id: int, due_date: str, assignee_id: Optional[int] = None, reporter_id: Optional[int] = None) -> int:
+    """Публикует событие 'просрочен срок' (планировщик сроков, due_dates.py)"""
+    event = Event(
+        event_type="defect.overdue",
+        data={
+            "defect_id": defect_id,
+            "project_id": project_id,
+            "due_date": due_date,
+            "assignee_id": assignee_id,
+            "reporter_id": reporter_id
+        }
+    )
+    return publish_event(db, event)
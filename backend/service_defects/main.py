@@ -1,41 +1,46 @@
 import os
+import asyncio
 import httpx
-import shutil
-import uuid
 import logging
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Request
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Optional
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer
-from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from jose import JWTError, jwt
-from starlette.middleware.base import BaseHTTPMiddleware
 
-import crud, models, schemas
+import crud, models, schemas, search, storage
+from cleanup import cleanup_worker
+from downloads import RangeFileResponse
+from due_dates import due_scheduler
+from thumbnails import thumbnail_service
 from database import engine, SessionLocal
-from events import publish_defect_created, publish_defect_status_changed, publish_defect_updated, publish_defect_deleted
+from project_registry import ProjectRegistryUnavailable, project_registry
+from events import event_store
+from shared.event_log import create_events_router
+from shared.fieldsets import parse_fields, sparse_response
+from shared.identity import verified_subject
+from shared.logging_config import setup_logging
+from shared.metrics import InstrumentedTransport
+from shared.observability import setup_observability
+from shared.responses import CompressionMiddleware, FastJSONResponse
 
+# Логирование через очередь: файл logs/defects-service.log и stdout (shared/logging_config.py)
+setup_logging("defects-service")
 logger = logging.getLogger(__name__)
 
-# Middleware для X-Request-ID
-class RequestIDMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        request_id = request.headers.get("X-Request-ID", str(uuid.uuid4()))
-        request.state.request_id = request_id
-        logger.info(f"[{request_id}] {request.method} {request.url.path}")
-        response = await call_next(request)
-        response.headers["X-Request-ID"] = request_id
-        logger.info(f"[{request_id}] Response: {response.status_code}")
-        return response
+models.upgrade_schema()
+search.init_search_index(engine)
 
-models.Base.metadata.create_all(bind=engine)
-
-app = FastAPI(title="Defects Service", version="1.0.0")
-
-# Добавляем middleware для трассировки
-app.add_middleware(RequestIDMiddleware)
+app = FastAPI(title="Defects Service", version="1.0.0", default_response_class=FastJSONResponse)
 
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", "1024")))
+# Request ID, trace, метрики и access-лог за один проход (shared/observability.py)
+setup_observability(app, "defects", engine)
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
 ALGORITHM = os.getenv("JWT_ALG", "HS256")
@@ -43,6 +48,9 @@ AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://localhost:8001")
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Работа с БД синхронная, поэтому в event loop её нет: эндпоинты только с БД —
+# обычные def (FastAPI выполняет их в threadpool), а async-эндпоинты, которым
+# нужен await, вызывают crud через run_in_threadpool
 def get_db():
     db = SessionLocal()
     try:
@@ -50,141 +58,302 @@ def get_db():
     finally:
         db.close()
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
+def defects_snapshot():
+    db = SessionLocal()
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+        for row in crud.iter_defects_snapshot(db):
+            yield {"defect_id": row.id, "project_id": row.project_id, "status": row.status, "priority": row.priority, "reporter_id": row.reporter_id, "created_at": row.created_at}
+    finally:
+        db.close()
+
+# Журнал доменных событий для потребителей (отчёты, кеши, индексы)
+app.include_router(create_events_router(event_store, snapshot_source=defects_snapshot))
+
+async def get_current_user(request: Request, token: str = Depends(oauth2_scheme)):
+    credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
+    # Запрос через шлюз: токен уже проверен, личность подписана (shared/identity.py)
+    if verified_subject(request.headers, token, SECRET_KEY) is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            username: str = payload.get("sub")
+            if username is None:
+                raise credentials_exception
+        except JWTError:
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
     
-    async with httpx.AsyncClient() as client:
+    async with httpx.AsyncClient(transport=InstrumentedTransport("auth")) as client:
         response = await client.get(f"{AUTH_SERVICE_URL}/auth/users/me", headers={"Authorization": f"Bearer {token}"})
         if response.status_code != 200:
             raise credentials_exception
         return response.json()
 
-@app.get("/defects/", response_model=list[schemas.Defect])
-async def read_defects(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
-    return crud.get_defects(db, skip=skip, limit=limit)
+async def require_project(project_id: int):
+    """project_id должен существовать в сервисе проектов (проверка по локальному реестру)"""
+    if project_registry is None:
+        return
+    try:
+        found = await project_registry.exists(project_id)
+    except ProjectRegistryUnavailable:
+        raise HTTPException(status_code=503, detail="Projects registry unavailable")
+    if not found:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+def is_project_owner(project_id: int, user_id: int) -> bool:
+    return project_registry is not None and project_registry.owner_of(project_id) == user_id
 
-@app.get("/defects/{defect_id}", response_model=schemas.Defect)
-async def read_defect(defect_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
-    db_defect = crud.get_defect(db, defect_id=defect_id)
+LIST_INCLUDES = {"counts"}
+DETAIL_INCLUDES = {"comments", "attachments"}
+# fields= в списке: колонки дефекта; счётчики добавляются через include=counts
+LIST_FIELDS = tuple(schemas.Defect.model_fields)
+COUNT_FIELDS = ("comment_count", "attachment_count", "last_activity_at")
+
+def parse_include(include: Optional[str], allowed: set) -> set:
+    """include=a,b -> {"a", "b"}; неизвестное значение — 400"""
+    includes = {part.strip() for part in include.split(",") if part.strip()} if include else set()
+    unknown = includes - allowed
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown include: {', '.join(sorted(unknown))}")
+    return includes
+
+# exclude_unset: без include=counts ответ остаётся прежним, без пустых полей счётчиков
+@app.get("/defects/", response_model=list[schemas.DefectListItem], response_model_exclude_unset=True)
+def read_defects(skip: int = 0, limit: int = 100, include: Optional[str] = Query(None, description="counts — число комментариев, вложений и последняя активность"), fields: Optional[str] = Query(None, description=f"Только эти поля (id всегда): {', '.join(LIST_FIELDS)}"), db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    includes = parse_include(include, LIST_INCLUDES)
+    selected = parse_fields(fields, LIST_FIELDS)
+    if selected is None:
+        defects = crud.get_defects(db, skip=skip, limit=limit)
+        if "counts" in includes:
+            crud.attach_activity(db, defects)
+        return defects
+    if "counts" not in includes:
+        return sparse_response(schemas.DefectListItem, selected, crud.get_defects(db, skip=skip, limit=limit, columns=selected))
+    # Последней активности нужны created_at и updated_at, даже если их не просили
+    columns = selected + tuple(name for name in ("created_at", "updated_at") if name not in selected)
+    defects = [SimpleNamespace(**row._mapping) for row in crud.get_defects(db, skip=skip, limit=limit, columns=columns)]
+    crud.attach_activity(db, defects)
+    return sparse_response(schemas.DefectListItem, selected + COUNT_FIELDS, defects)
+
+@app.get("/defects/search", response_model=schemas.DefectSearchResult)
+def search_defects(q: str = Query(..., min_length=1, max_length=200), project_id: Optional[int] = None, skip: int = 0, limit: int = Query(20, ge=1, le=100), db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    total, items = crud.search_defects(db, query=q, project_id=project_id, skip=skip, limit=limit)
+    return {"total": total, "items": items}
+
+@app.get("/defects/metrics/time-in-status", response_model=list[schemas.TimeInStatus])
+def read_time_in_status(project_id: int, since: Optional[datetime] = None, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    return crud.get_time_in_status(db, project_id=project_id, since=since)
+
+# Просроченные — диапазон по индексу (due_date, status), без разбора сроков в Python
+@app.get("/defects/overdue", response_model=list[schemas.Defect])
+def read_overdue_defects(project_id: Optional[int] = None, skip: int = 0, limit: int = Query(100, ge=1, le=1000), db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    return crud.get_overdue_defects(db, project_id=project_id, skip=skip, limit=limit)
+
+@app.get("/defects/metrics/overdue", response_model=schemas.OverdueCount)
+def read_overdue_count(project_id: Optional[int] = None, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    return {"overdue": crud.count_overdue_defects(db, project_id=project_id), "as_of": datetime.utcnow(), "project_id": project_id}
+
+# Сводка для отчётов: total, completed, overdue и active_projects из одного запроса
+@app.get("/defects/metrics/summary", response_model=schemas.DefectSummary)
+def read_defect_summary(project_id: Optional[int] = None, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    return crud.get_defect_summary(db, project_id=project_id)
+
+@app.get("/defects/metrics/storage-usage", response_model=list[schemas.ProjectStorageUsage])
+def read_storage_usage(project_id: Optional[int] = None, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    return crud.get_storage_usage(db, project_id=project_id)
+
+# include=comments,attachments — карточка дефекта за один запрос вместо трёх
+@app.get("/defects/{defect_id}", response_model=schemas.DefectDetail, response_model_exclude_unset=True)
+def read_defect(defect_id: int, include: Optional[str] = Query(None, description="comments, attachments — дочерние записи в том же ответе"), comments_skip: int = Query(0, ge=0), comments_limit: int = Query(100, ge=1, le=1000), attachments_skip: int = Query(0, ge=0), attachments_limit: int = Query(100, ge=1, le=1000), db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    includes = parse_include(include, DETAIL_INCLUDES)
+    db_defect = crud.get_defect_detail(db, defect_id, includes, comments_skip=comments_skip, comments_limit=comments_limit, attachments_skip=attachments_skip, attachments_limit=attachments_limit)
     if db_defect is None:
         raise HTTPException(status_code=404, detail="Defect not found")
     return db_defect
 
 @app.post("/defects/", response_model=schemas.Defect)
 async def create_defect(defect: schemas.DefectCreate, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
-    # Создаём дефект
-    new_defect = crud.create_defect(db=db, defect=defect, reporter_id=current_user["id"])
-    
-    # Публикуем событие "создан заказ"
-    publish_defect_created(
-        defect_id=new_defect.id,
-        title=new_defect.title,
-        status=new_defect.status,
-        priority=new_defect.priority,
-        project_id=new_defect.project_id,
-        reporter_id=current_user["id"]
-    )
+    await require_project(defect.project_id)
+    # Создаём дефект; событие "создан заказ" пишется в той же транзакции
+    new_defect = await run_in_threadpool(crud.create_defect, db=db, defect=defect, reporter_id=current_user["id"])
+    if due_scheduler is not None:
+        due_scheduler.schedule(new_defect.id, new_defect.due_date, new_defect.status)
     
     return new_defect
 
 @app.put("/defects/{defect_id}", response_model=schemas.Defect)
 @app.patch("/defects/{defect_id}", response_model=schemas.Defect)
 async def update_defect(defect_id: int, defect: schemas.DefectCreate, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
-    db_defect = crud.get_defect(db, defect_id=defect_id)
+    db_defect = await run_in_threadpool(crud.get_defect, db, defect_id=defect_id)
     if db_defect is None:
         raise HTTPException(status_code=404, detail="Defect not found")
-    # Может редактировать: reporter, assignee, manager, admin
+    # Может редактировать: reporter, assignee, владелец проекта, manager, admin
     if (db_defect.reporter_id != current_user["id"] and 
         db_defect.assignee_id != current_user["id"] and 
-        current_user["role"] not in ["manager", "admin"]):
+        current_user["role"] not in ["manager", "admin"] and
+        not is_project_owner(db_defect.project_id, current_user["id"])):
         raise HTTPException(status_code=403, detail="Not authorized")
+    if defect.project_id != db_defect.project_id:
+        await require_project(defect.project_id)
     
-    # Сохраняем старый статус для события
-    old_status = db_defect.status
-    
-    # Обновляем дефект
-    updated_defect = crud.update_defect(db=db, defect_id=defect_id, defect=defect)
-    
-    # Если статус изменился, публикуем событие "обновлён статус"
-    if old_status != updated_defect.status:
-        publish_defect_status_changed(
-            defect_id=defect_id,
-            old_status=old_status,
-            new_status=updated_defect.status,
-            changed_by=current_user["id"]
-        )
-    
-    # Публикуем событие "обновлён заказ"
-    publish_defect_updated(
-        defect_id=defect_id,
-        title=updated_defect.title,
-        updated_by=current_user["id"]
-    )
+    # Обновляем дефект; события "обновлён статус" и "обновлён заказ" — в той же транзакции
+    updated_defect = await run_in_threadpool(crud.update_defect, db=db, defect_id=defect_id, defect=defect, changed_by=current_user["id"])
+    if due_scheduler is not None and updated_defect.overdue_at is None:
+        due_scheduler.schedule(defect_id, updated_defect.due_date, updated_defect.status)
     
     return updated_defect
 
 @app.delete("/defects/{defect_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_defect(defect_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+def delete_defect(defect_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
     db_defect = crud.get_defect(db, defect_id=defect_id)
     if db_defect is None:
         raise HTTPException(status_code=404, detail="Defect not found")
-    if db_defect.reporter_id != current_user["id"] and current_user["role"] not in ["manager", "admin"]:
+    if (db_defect.reporter_id != current_user["id"] and
+        current_user["role"] not in ["manager", "admin"] and
+        not is_project_owner(db_defect.project_id, current_user["id"])):
         raise HTTPException(status_code=403, detail="Not authorized")
-    crud.delete_defect(db=db, defect_id=defect_id)
+    # Событие "удалён заказ" — в той же транзакции, что и удаление
+    crud.delete_defect(db=db, defect_id=defect_id, deleted_by=current_user["id"])
+    cleanup_worker.wake()
     return
 
+@app.get("/defects/{defect_id}/status-history", response_model=list[schemas.DefectStatusHistory])
+def read_status_history(defect_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    return crud.get_status_history(db, defect_id=defect_id, skip=skip, limit=limit)
+
 @app.get("/defects/{defect_id}/comments/", response_model=list[schemas.Comment])
-async def read_comments(defect_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+def read_comments(defect_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
     return crud.get_comments_by_defect(db, defect_id=defect_id, skip=skip, limit=limit)
 
 @app.post("/defects/{defect_id}/comments/", response_model=schemas.Comment)
-async def create_comment(defect_id: int, comment: schemas.CommentCreate, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+def create_comment(defect_id: int, comment: schemas.CommentCreate, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
     return crud.create_comment(db=db, comment=comment, defect_id=defect_id, author_id=current_user["id"])
 
 @app.get("/defects/{defect_id}/attachments/", response_model=list[schemas.Attachment])
-async def read_attachments(defect_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+def read_attachments(defect_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
     return crud.get_attachments_by_defect(db, defect_id=defect_id, skip=skip, limit=limit)
 
 @app.post("/defects/{defect_id}/attachments/", response_model=schemas.Attachment)
 async def create_attachment(defect_id: int, file: UploadFile = File(...), db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
-    upload_dir = f"./attachments/{defect_id}"
-    os.makedirs(upload_dir, exist_ok=True)
-    file_location = f"{upload_dir}/{file.filename}"
-    
-    with open(file_location, "wb+") as file_object:
-        shutil.copyfileobj(file.file, file_object)
-    
-    from datetime import datetime
-    db_attachment = models.Attachment(
-        filename=file.filename,
-        file_path=file_location,
-        defect_id=defect_id,
-        uploader_id=current_user["id"]
-    )
-    db.add(db_attachment)
-    db.commit()
-    db.refresh(db_attachment)
+    # Хеш считается при потоковой записи во временный файл вне event loop
+    staged = await storage.stage_upload(file)
+    db_attachment = await run_in_threadpool(crud.create_attachment, db=db, defect_id=defect_id, filename=file.filename, uploader_id=current_user["id"], staged=staged)
+    # Миниатюры строятся в фоне; если очередь переполнена — по первому запросу
+    thumbnail_service.schedule(db_attachment.content_hash, db_attachment.filename)
     return db_attachment
 
+@app.api_route("/defects/{defect_id}/attachments/{attachment_id}/content", methods=["GET", "HEAD"])
+def download_attachment(defect_id: int, attachment_id: int, request: Request, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    db_attachment = crud.get_attachment(db, attachment_id=attachment_id)
+    if db_attachment is None or db_attachment.defect_id != defect_id:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    # Range / If-Range / If-None-Match / If-Modified-Since обрабатываются в RangeFileResponse
+    try:
+        return RangeFileResponse(
+            db_attachment.file_path,
+            request.headers,
+            method=request.method,
+            filename=db_attachment.filename,
+            media_type=db_attachment.mime_type,
+            content_hash=db_attachment.content_hash,
+        )
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Attachment file not found")
+
+@app.get("/defects/{defect_id}/attachments/{attachment_id}/thumbnail")
+async def read_attachment_thumbnail(defect_id: int, attachment_id: int, request: Request, size: str = Query("thumb", pattern="^(thumb|preview)$"), db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    db_attachment = await run_in_threadpool(crud.get_attachment, db, attachment_id=attachment_id)
+    if db_attachment is None or db_attachment.defect_id != defect_id:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    if not db_attachment.content_hash:
+        raise HTTPException(status_code=404, detail="Thumbnail not available")
+    path = await thumbnail_service.get(db_attachment.content_hash, size)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Thumbnail not available")
+    # Содержимое по хешу неизменно — клиент может кешировать надолго
+    return RangeFileResponse(
+        path,
+        request.headers,
+        media_type="image/webp",
+        content_hash=f"{db_attachment.content_hash}-{size}",
+        cache_control="private, max-age=86400, immutable",
+    )
+
 @app.delete("/defects/{defect_id}/attachments/{attachment_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_attachment(defect_id: int, attachment_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+def delete_attachment(defect_id: int, attachment_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
     db_attachment = crud.get_attachment(db, attachment_id=attachment_id)
     if db_attachment is None or db_attachment.defect_id != defect_id:
         raise HTTPException(status_code=404, detail="Attachment not found")
     if db_attachment.uploader_id != current_user["id"] and current_user["role"] not in ["manager", "admin"]:
         raise HTTPException(status_code=403, detail="Not authorized")
-    if os.path.exists(db_attachment.file_path):
-        os.remove(db_attachment.file_path)
+    # Файл удаляется, когда на blob не остаётся ссылок
     crud.delete_attachment(db=db, attachment_id=attachment_id)
     return
 
+@app.on_event("startup")
+async def start_thumbnail_service():
+    await thumbnail_service.start()
+
+@app.on_event("shutdown")
+async def stop_thumbnail_service():
+    await thumbnail_service.stop()
+
+stop_project_registry = asyncio.Event()
+
+@app.on_event("startup")
+async def start_project_registry():
+    if project_registry is not None:
+        # Удалённый проект — фоновая очистка его дефектов
+        project_registry.on_deleted.append(cleanup_worker.enqueue_project)
+        asyncio.create_task(project_registry.run(stop_project_registry))
+    await cleanup_worker.start(project_registry)
+
+@app.on_event("shutdown")
+async def stop_project_registry_task():
+    stop_project_registry.set()
+    await cleanup_worker.stop()
+
+@app.on_event("startup")
+async def start_due_scheduler():
+    if due_scheduler is not None:
+        await due_scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_due_scheduler():
+    if due_scheduler is not None:
+        await due_scheduler.stop()
+
+@app.get("/due-scheduler")
+async def read_due_scheduler():
+    """Очередь ближайших сроков планировщика просрочки"""
+    return {"enabled": due_scheduler is not None, **(due_scheduler.snapshot() if due_scheduler is not None else {})}
+
+@app.get("/project-registry")
+async def read_project_registry():
+    """Состояние локального реестра проектов"""
+    return {"enabled": project_registry is not None, **(project_registry.snapshot() if project_registry is not None else {})}
+
+@app.get("/cleanup")
+async def read_cleanup_status():
+    """Очередь каскадной очистки и результат последней сверки"""
+    return await asyncio.to_thread(cleanup_worker.snapshot)
+
+@app.get("/cleanup/jobs", response_model=list[schemas.CleanupJob])
+def read_cleanup_jobs(status: Optional[str] = None, skip: int = 0, limit: int = Query(100, ge=1, le=1000), db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    return crud.get_cleanup_jobs(db, status=status, skip=skip, limit=limit)
+
+@app.get("/cleanup/jobs/{job_id}", response_model=schemas.CleanupJob)
+def read_cleanup_job(job_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    job = crud.get_cleanup_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Cleanup job not found")
+    return job
+
+@app.post("/cleanup/sweep")
+async def run_cleanup_sweep(current_user: dict = Depends(get_current_user)):
+    """Сверка: ставит задачи на сиротские записи, оставшиеся от прежних удалений"""
+    if current_user["role"] not in ["manager", "admin"]:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return await cleanup_worker.sweep()
+
 @app.get("/health")
 async def health():
     return {"status": "healthy"}
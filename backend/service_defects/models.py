@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float, Index, text
 from datetime import datetime
-from database import Base
+from database import Base, engine, add_missing_columns, drop_index, ensure_indexes
 
 class Defect(Base):
     __tablename__ = "defects"
@@ -10,12 +10,19 @@ class Defect(Base):
     description = Column(Text, nullable=True)
     priority = Column(String, default="Средний")
     status = Column(String, default="Новая")
-    project_id = Column(Integer, nullable=False)
+    project_id = Column(Integer, nullable=False, index=True)
     reporter_id = Column(Integer, nullable=False)
     assignee_id = Column(Integer, nullable=True)
     due_date = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, nullable=True)
+    # Когда планировщик сроков пометил дефект просроченным и опубликовал defect.overdue
+    overdue_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        # Просроченные и ближайшие сроки — диапазон по due_date, статус проверяется в индексе
+        Index("ix_defects_due_status", "due_date", "status"),
+    )
 
 class Comment(Base):
     __tablename__ = "comments"
@@ -25,6 +32,11 @@ class Comment(Base):
     defect_id = Column(Integer, ForeignKey("defects.id"), nullable=False)
     author_id = Column(Integer, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # Комментарии дефекта и счётчики для списка (count + max(created_at) только по индексу)
+        Index("ix_comments_defect_created", "defect_id", "created_at"),
+    )
 
 class Attachment(Base):
     __tablename__ = "attachments"
@@ -35,7 +47,96 @@ class Attachment(Base):
     defect_id = Column(Integer, ForeignKey("defects.id"), nullable=False)
     uploader_id = Column(Integer, nullable=False)
     uploaded_at = Column(DateTime, default=datetime.utcnow)
+    # SHA-256 содержимого (ключ blob-а); None — вложение загружено до появления хранилища blob-ов
+    content_hash = Column(String(64), ForeignKey("attachment_blobs.content_hash"), nullable=True, index=True)
+    size = Column(Integer, nullable=True)
+    mime_type = Column(String, nullable=True)
+    storage_key = Column(String, nullable=True)  # путь blob-а относительно attachments/
+    # Копия defects.project_id: агрегаты занятого места по проекту читаются из индекса без join
+    project_id = Column(Integer, nullable=True)
+    
+    __table_args__ = (
+        Index("ix_attachments_project_usage", "project_id", "content_hash", "size"),
+        Index("ix_attachments_defect_uploaded", "defect_id", "uploaded_at"),
+    )
 
+class Blob(Base):
+    """Файл в контентно-адресуемом хранилище и число вложений, которые на него ссылаются"""
+    __tablename__ = "attachment_blobs"
+    
+    content_hash = Column(String(64), primary_key=True)
+    size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class DefectStatusHistory(Base):
+    """Append-only история смен статуса (одна строка на переход)"""
+    __tablename__ = "defect_status_history"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    defect_id = Column(Integer, ForeignKey("defects.id"), nullable=False)
+    project_id = Column(Integer, nullable=False)
+    from_status = Column(String, nullable=True)  # None — начальный статус при создании
+    to_status = Column(String, nullable=False)
+    changed_by = Column(Integer, nullable=False)
+    changed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # Сколько дефект пробыл в from_status; считается один раз при переходе
+    duration_seconds = Column(Float, nullable=True)
+    
+    __table_args__ = (
+        Index("ix_status_history_defect_time", "defect_id", "changed_at"),
+        # Покрывающий индекс для агрегатов time-in-status по проекту; changed_at —
+        # для фильтра since, чтобы и он проверялся по индексу, без чтения строк таблицы
+        Index("ix_status_history_project_time_in_status", "project_id", "from_status", "duration_seconds", "changed_at"),
+    )
 
 
+class CleanupJob(Base):
+    """Фоновое каскадное удаление зависимых записей (cleanup.py); счётчики — прогресс"""
+    __tablename__ = "cleanup_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # project | defect
+    target_id = Column(Integer, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending | running | done | failed | cancelled
+    requested_by = Column(Integer, nullable=True)
+    defects_removed = Column(Integer, nullable=False, default=0)
+    comments_removed = Column(Integer, nullable=False, default=0)
+    attachments_removed = Column(Integer, nullable=False, default=0)
+    history_removed = Column(Integer, nullable=False, default=0)
+    files_removed = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        Index("ix_cleanup_jobs_status", "status", "id"),
+        Index("ix_cleanup_jobs_target", "kind", "target_id", "status"),
+    )
 
+def upgrade_schema():
+    """create_all + колонки и индексы, добавленные в модели после создания таблиц"""
+    Base.metadata.create_all(bind=engine)
+    add_missing_columns("attachments", {
+        "content_hash": "VARCHAR(64)",
+        "size": "INTEGER",
+        "mime_type": "VARCHAR",
+        "storage_key": "VARCHAR",
+        "project_id": "INTEGER",
+    })
+    add_missing_columns("defects", {"overdue_at": "DATETIME"})
+    ensure_indexes(Defect.__table__)
+    ensure_indexes(Comment.__table__)
+    ensure_indexes(Attachment.__table__)
+    # Прежний индекс time-in-status был без changed_at. Вместе с ним один раз чиним
+    # project_id истории дефектов, перенесённых в другой проект до того, как
+    # update_defect стал переписывать его и в истории
+    if drop_index("defect_status_history", "ix_status_history_project_status_duration"):
+        with engine.begin() as conn:
+            conn.execute(text("""
+                UPDATE defect_status_history
+                SET project_id = (SELECT project_id FROM defects WHERE defects.id = defect_status_history.defect_id)
+                WHERE project_id != (SELECT project_id FROM defects WHERE defects.id = defect_status_history.defect_id)
+            """))
+    ensure_indexes(DefectStatusHistory.__table__)
@@ -0,0 +1,155 @@
+"""
+Локальный реестр проектов сервиса дефектов: id проекта -> owner_id.
+
+Собирается из журнала событий сервиса проектов (shared/event_consumer.py).
+При старте реестр загружает снимок /events/snapshot, затем догоняет
+события project.created / project.deleted. Проверка project_id при
+записи дефекта и проверка владельца идут по памяти, без запроса в
+сервис проектов.
+
+Промах возможен, если проект только что создан и событие ещё не
+дочитано. Реестр устаревает, если журнал недоступен дольше
+PROJECT_REGISTRY_TTL. В обоих случаях реестр догоняет журнал одним
+запросом /events/?after=<позиция> прямо в обработке запроса.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import httpx
+
+from shared.event_consumer import EventConsumer, EventLogClient
+
+logger = logging.getLogger(__name__)
+
+PROJECTS_SERVICE_URL = os.getenv("PROJECTS_SERVICE_URL", "http://localhost:8002")
+PROJECT_REGISTRY_ENABLED = os.getenv("PROJECT_REGISTRY_ENABLED", "true").lower() == "true"
+PROJECT_REGISTRY_TTL = float(os.getenv("PROJECT_REGISTRY_TTL", "60"))
+PROJECT_REGISTRY_POLL_INTERVAL = float(os.getenv("PROJECT_REGISTRY_POLL_INTERVAL", "1.0"))
+
+
+class ProjectRegistryUnavailable(Exception):
+    """Журнал проектов недоступен, а проекта нет в реестре"""
+
+
+class ProjectRegistry:
+    """
+    Read model для EventConsumer в памяти процесса. Пачки применяются в
+    потоке (asyncio.to_thread), а читают реестр из event loop. Поэтому
+    изменения — одиночные операции над dict, а снимок подменяет словарь целиком.
+    """
+
+    consumer = "defects.projects"
+    event_types = ["project.created", "project.deleted"]
+
+    def __init__(self, base_url: str = PROJECTS_SERVICE_URL, ttl: float = PROJECT_REGISTRY_TTL, poll_interval: float = PROJECT_REGISTRY_POLL_INTERVAL):
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.ready = False  # снимок загружен
+        self.synced_at: Optional[float] = None  # time.monotonic() последней успешной синхронизации
+        self.misses = 0
+        # Вызываются из потока применения пачки: (project_id, deleted_by)
+        self.on_deleted: List[Callable[[int, Optional[int]], None]] = []
+        self._owners: Dict[int, Optional[int]] = {}
+        self._loading: Optional[Dict[int, Optional[int]]] = None
+        self._position = 0
+        self._lock = asyncio.Lock()
+        self.events = EventConsumer(EventLogClient(base_url, "defects", timeout=5.0, upstream="projects"), self, event_types=self.event_types)
+
+    # ---- интерфейс read model (shared/event_consumer.py) ----
+
+    def load_checkpoint(self) -> int:
+        return self._position
+
+    def apply_batch(self, events: List[Dict[str, Any]], position: int) -> None:
+        for event in events:
+            data = event["data"]
+            if event["event_type"] == "project.created":
+                self._owners[data["project_id"]] = data.get("owner_id")
+            elif event["event_type"] == "project.deleted":
+                self._owners.pop(data["project_id"], None)
+                for listener in self.on_deleted:
+                    listener(data["project_id"], data.get("deleted_by"))
+        self._position = position
+
+    def begin_snapshot(self) -> None:
+        self._loading = {}
+
+    def load_snapshot_rows(self, rows: Iterable[Dict[str, Any]]) -> None:
+        self._loading.update((row["project_id"], row["owner_id"]) for row in rows)
+
+    def finish_snapshot(self, position: int) -> None:
+        self._owners, self._loading = self._loading, None
+        self._position = position
+
+    # ---- синхронизация ----
+
+    @property
+    def fresh(self) -> bool:
+        return self.synced_at is not None and time.monotonic() - self.synced_at < self.ttl
+
+    async def sync(self, requested_at: Optional[float] = None) -> None:
+        """Снимок при первом запуске, дальше — события после текущей позиции"""
+        async with self._lock:
+            # Пока ждали блокировку, реестр уже догнал журнал после нашего промаха
+            if requested_at is not None and self.synced_at is not None and self.synced_at >= requested_at:
+                return
+            started = time.monotonic()
+            if not self.ready:
+                await self.events.bootstrap_from_snapshot()
+                self.ready = True
+            await self.events.replay()
+            self.synced_at = started
+
+    async def run(self, stop: asyncio.Event) -> None:
+        """Фоновое догоняющее чтение журнала проектов"""
+        while not stop.is_set():
+            try:
+                await self.sync()
+            except httpx.HTTPError as e:
+                logger.warning(f"[{self.consumer}] projects event log unavailable: {e}")
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    # ---- проверки ----
+
+    async def exists(self, project_id: int) -> bool:
+        if self.fresh and project_id in self._owners:
+            return True
+        self.misses += 1
+        try:
+            await self.sync(requested_at=time.monotonic())
+        except httpx.HTTPError as e:
+            if project_id in self._owners:
+                # Журнал недоступен, но проект известен: принимаем по устаревшему реестру
+                logger.warning(f"[{self.consumer}] using stale registry for project {project_id}: {e}")
+                return True
+            raise ProjectRegistryUnavailable(str(e)) from e
+        return project_id in self._owners
+
+    def owner_of(self, project_id: int) -> Optional[int]:
+        return self._owners.get(project_id)
+
+    def project_ids(self) -> set:
+        return set(self._owners)
+
+    def knows(self, project_id: int) -> bool:
+        return project_id in self._owners
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "fresh": self.fresh,
+            "projects": len(self._owners),
+            "position": self._position,
+            "synced_ago_s": round(time.monotonic() - self.synced_at, 2) if self.synced_at is not None else None,
+            "misses": self.misses,
+        }
+
+
+project_registry: Optional[ProjectRegistry] = ProjectRegistry() if PROJECT_REGISTRY_ENABLED else None
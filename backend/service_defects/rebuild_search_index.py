@@ -0,0 +1,23 @@
+"""
+Пересборка полнотекстового индекса дефектов и комментариев.
+
+    python rebuild_search_index.py
+"""
+
+import time
+
+import models
+import search
+from database import engine
+
+
+def main() -> None:
+    models.upgrade_schema()
+    search.init_search_index(engine)
+    started = time.perf_counter()
+    search.rebuild_index(engine)
+    print(f"Search index rebuilt in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -19,10 +19,18 @@ class Defect(DefectBase):
     reporter_id: int
     created_at: datetime
     updated_at: Optional[datetime] = None
+    overdue_at: Optional[datetime] = None  # когда планировщик пометил дефект просроченным
     
     class Config:
         from_attributes = True
 
+class DefectListItem(Defect):
+    """Дефект в списке; счётчики заполняются только при include=counts"""
+    comment_count: Optional[int] = None
+    attachment_count: Optional[int] = None
+    # Последнее изменение дефекта, комментарий или вложение
+    last_activity_at: Optional[datetime] = None
+
 class CommentBase(BaseModel):
     content: str
 
@@ -47,10 +55,101 @@ class Attachment(AttachmentBase):
     defect_id: int
     uploader_id: int
     uploaded_at: datetime
+    content_hash: Optional[str] = None  # SHA-256, он же контрольная сумма
+    size: Optional[int] = None
+    mime_type: Optional[str] = None
+    storage_key: Optional[str] = None
+    
+    class Config:
+        from_attributes = True
+
+class CommentPage(BaseModel):
+    total: int
+    skip: int
+    limit: int
+    items: list[Comment]
+
+class AttachmentPage(BaseModel):
+    total: int
+    skip: int
+    limit: int
+    items: list[Attachment]
+
+class DefectDetail(DefectListItem):
+    """Карточка дефекта; comments и attachments — только запрошенные в include"""
+    comments: Optional[CommentPage] = None
+    attachments: Optional[AttachmentPage] = None
+
+class DefectStatusHistory(BaseModel):
+    id: int
+    defect_id: int
+    project_id: int
+    from_status: Optional[str] = None
+    to_status: str
+    changed_by: int
+    changed_at: datetime
+    duration_seconds: Optional[float] = None
     
     class Config:
         from_attributes = True
 
+class TimeInStatus(BaseModel):
+    status: str
+    transitions: int
+    mean_seconds: float
+    p50_seconds: float
+    p90_seconds: float
+    p95_seconds: float
+    max_seconds: float
 
+class OverdueCount(BaseModel):
+    overdue: int
+    as_of: datetime
+    project_id: Optional[int] = None
 
+class DefectSummary(BaseModel):
+    total: int
+    completed: int
+    overdue: int
+    active_projects: int
+    as_of: datetime
+    project_id: Optional[int] = None
 
+class DefectSearchHit(BaseModel):
+    id: int
+    title: str
+    status: Optional[str] = None
+    priority: Optional[str] = None
+    project_id: int
+    score: float
+    matched_in: str  # "defect" или "comment"
+    snippet: str     # HTML-экранированный фрагмент, совпадения в <mark>...</mark>
+
+class DefectSearchResult(BaseModel):
+    total: int
+    items: list[DefectSearchHit]
+
+class ProjectStorageUsage(BaseModel):
+    project_id: int
+    attachments: int
+    logical_bytes: int  # сумма размеров всех вложений
+    stored_bytes: int   # уникальные blob-ы (с учётом дедупликации)
+
+class CleanupJob(BaseModel):
+    id: int
+    kind: str
+    target_id: int
+    status: str
+    requested_by: Optional[int] = None
+    defects_removed: int
+    comments_removed: int
+    attachments_removed: int
+    history_removed: int
+    files_removed: int
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
@@ -0,0 +1,199 @@
+"""
+Полнотекстовый поиск по дефектам и комментариям (SQLite FTS5).
+
+defects_fts хранит title/description с rowid = defects.id,
+comments_fts — content с rowid = comments.id. Индекс обновляется
+в crud.py в той же транзакции, что и изменение строки.
+Для других СУБД (DATABASE_URL не SQLite) поиск идёт через LIKE.
+"""
+
+import html
+import re
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+import models
+
+FTS_TABLES = {
+    "defects_fts": "CREATE VIRTUAL TABLE defects_fts USING fts5(title, description, tokenize = 'unicode61 remove_diacritics 2')",
+    "comments_fts": "CREATE VIRTUAL TABLE comments_fts USING fts5(content, defect_id UNINDEXED, tokenize = 'unicode61 remove_diacritics 2')",
+}
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+# snippet() ставит вокруг совпадений управляющие символы, а не теги: текст
+# дефекта экранируется целиком, и только эти маркеры становятся <mark>
+_MARK_START = "\x02"
+_MARK_END = "\x03"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def is_enabled(db_or_engine) -> bool:
+    bind = db_or_engine.get_bind() if isinstance(db_or_engine, Session) else db_or_engine
+    return bind.dialect.name == "sqlite"
+
+
+def init_search_index(engine) -> None:
+    """Создаёт FTS-таблицы; если их не было, сразу строит индекс по существующим данным"""
+    if not is_enabled(engine):
+        return
+    created = False
+    with engine.begin() as conn:
+        existing = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))}
+        for name, ddl in FTS_TABLES.items():
+            if name not in existing:
+                conn.execute(text(ddl))
+                created = True
+    if created:
+        with engine.begin() as conn:
+            _rebuild(conn)
+
+
+def _rebuild(conn) -> None:
+    conn.execute(text("DELETE FROM defects_fts"))
+    conn.execute(text("DELETE FROM comments_fts"))
+    conn.execute(text("INSERT INTO defects_fts (rowid, title, description) SELECT id, title, COALESCE(description, '') FROM defects"))
+    conn.execute(text("INSERT INTO comments_fts (rowid, content, defect_id) SELECT id, content, defect_id FROM comments"))
+    # Сливаем сегменты индекса после массовой вставки
+    conn.execute(text("INSERT INTO defects_fts (defects_fts) VALUES ('optimize')"))
+    conn.execute(text("INSERT INTO comments_fts (comments_fts) VALUES ('optimize')"))
+
+
+def rebuild_index(engine) -> None:
+    """Полная пересборка индекса (см. rebuild_search_index.py)"""
+    if not is_enabled(engine):
+        return
+    with engine.begin() as conn:
+        _rebuild(conn)
+
+
+# ==================== Синхронизация из crud.py ====================
+
+def index_defect(db: Session, defect: models.Defect) -> None:
+    if not is_enabled(db):
+        return
+    db.execute(text("DELETE FROM defects_fts WHERE rowid = :id"), {"id": defect.id})
+    db.execute(
+        text("INSERT INTO defects_fts (rowid, title, description) VALUES (:id, :title, :description)"),
+        {"id": defect.id, "title": defect.title, "description": defect.description or ""},
+    )
+
+
+def unindex_defect(db: Session, defect_id: int) -> None:
+    if not is_enabled(db):
+        return
+    db.execute(text("DELETE FROM defects_fts WHERE rowid = :id"), {"id": defect_id})
+    db.execute(text("DELETE FROM comments_fts WHERE defect_id = :id"), {"id": defect_id})
+
+
+def unindex_comments(db: Session, comment_ids: list) -> None:
+    if not is_enabled(db) or not comment_ids:
+        return
+    db.execute(text("DELETE FROM comments_fts WHERE rowid = :id"), [{"id": comment_id} for comment_id in comment_ids])
+
+
+def index_comment(db: Session, comment: models.Comment) -> None:
+    if not is_enabled(db):
+        return
+    db.execute(
+        text("INSERT INTO comments_fts (rowid, content, defect_id) VALUES (:id, :content, :defect_id)"),
+        {"id": comment.id, "content": comment.content, "defect_id": comment.defect_id},
+    )
+
+
+# ==================== Поиск ====================
+
+def build_match_query(query: str) -> Optional[str]:
+    """
+    Превращает пользовательскую строку в безопасное FTS5-выражение:
+    каждое слово — префиксный терм в кавычках, термы объединяются через AND.
+    """
+    tokens = _TOKEN_RE.findall(query)
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+# bm25: чем меньше, тем релевантнее. Совпадение в заголовке весит больше описания,
+# совпадение только в комментарии — вдвое меньше совпадения в самом дефекте.
+# Для каждого дефекта берётся лучшее совпадение: голые колонки рядом с MIN()
+# в SQLite берутся из строки с минимальным score.
+SEARCH_SQL = """
+    WITH hits AS (
+        SELECT rowid AS defect_id,
+               bm25(defects_fts, 10.0, 1.0) AS score,
+               'defect' AS matched_in,
+               snippet(defects_fts, -1, :hl_start, :hl_end, '…', 16) AS snippet
+        FROM defects_fts WHERE defects_fts MATCH :match
+        UNION ALL
+        SELECT CAST(defect_id AS INTEGER),
+               bm25(comments_fts) * 0.5,
+               'comment',
+               snippet(comments_fts, 0, :hl_start, :hl_end, '…', 16)
+        FROM comments_fts WHERE comments_fts MATCH :match
+    ),
+    best AS (
+        SELECT defect_id, MIN(score) AS score, matched_in, snippet
+        FROM hits
+        GROUP BY defect_id
+    )
+    SELECT d.id, d.title, d.status, d.priority, d.project_id,
+           best.score, best.matched_in, best.snippet
+    FROM best JOIN defects d ON d.id = best.defect_id
+    WHERE (:project_id IS NULL OR d.project_id = :project_id)
+"""
+
+
+def render_snippet(raw: str) -> str:
+    """Фрагмент для клиента: HTML-экранированный текст, из разметки — только <mark>"""
+    return html.escape(raw).replace(_MARK_START, HIGHLIGHT_START).replace(_MARK_END, HIGHLIGHT_END)
+
+
+def search_defects(db: Session, query: str, project_id: Optional[int] = None, skip: int = 0, limit: int = 20):
+    """Ранжированный поиск; возвращает (total, items)"""
+    match = build_match_query(query)
+    if match is None:
+        return 0, []
+    if not is_enabled(db):
+        return _search_like(db, query, project_id, skip, limit)
+
+    params = {"match": match, "project_id": project_id, "hl_start": _MARK_START, "hl_end": _MARK_END}
+    total = db.execute(text(f"SELECT COUNT(*) FROM ({SEARCH_SQL})"), params).scalar()
+    rows = db.execute(
+        text(f"{SEARCH_SQL} ORDER BY best.score, d.id LIMIT :limit OFFSET :skip"),
+        {**params, "limit": limit, "skip": skip},
+    ).mappings().all()
+    return total, [
+        {
+            "id": row["id"],
+            "title": row["title"],
+            "status": row["status"],
+            "priority": row["priority"],
+            "project_id": row["project_id"],
+            "score": -row["score"],
+            "matched_in": row["matched_in"],
+            "snippet": render_snippet(row["snippet"]),
+        }
+        for row in rows
+    ]
+
+
+def _search_like(db: Session, query: str, project_id: Optional[int], skip: int, limit: int):
+    pattern = f"%{query}%"
+    comment_hits = db.query(models.Comment.defect_id).filter(models.Comment.content.ilike(pattern))
+    q = db.query(models.Defect).filter(
+        models.Defect.title.ilike(pattern)
+        | models.Defect.description.ilike(pattern)
+        | models.Defect.id.in_(comment_hits)
+    )
+    if project_id is not None:
+        q = q.filter(models.Defect.project_id == project_id)
+    total = q.count()
+    items = q.order_by(models.Defect.id).offset(skip).limit(limit).all()
+    return total, [
+        {"id": d.id, "title": d.title, "status": d.status, "priority": d.priority, "project_id": d.project_id, "score": 0.0, "matched_in": "defect", "snippet": html.escape(d.title)}
+        for d in items
+    ]
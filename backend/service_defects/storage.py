@@ -0,0 +1,220 @@
+"""
+Контентно-адресуемое хранилище вложений.
+
+Файл хранится один раз по SHA-256 содержимого: attachments/blobs/ab/<hash>.
+Хеш, размер и MIME-тип определяются за один проход потоковой записи
+загрузки (кусками, в threadpool), одинаковые файлы разных дефектов
+ссылаются на один blob, а учёт ссылок ведётся в таблице attachment_blobs
+(models.Blob).
+
+Счётчик ссылок меняется только через acquire/release одним UPDATE
+ref_count = ref_count ± 1 в транзакции вызывающего. Файлы кладутся
+(acquire) и удаляются (collect) внутри транзакции, которая уже изменила
+строку blob-а: строку держит блокировка записи БД (в SQLite — всей базы),
+поэтому загрузка и сборка мусора не пересекаются и между процессами.
+"""
+
+import glob
+import hashlib
+import mimetypes
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from fastapi import UploadFile
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+import models
+from database import ATTACHMENTS_DIR
+
+BLOBS_DIR = os.path.join(ATTACHMENTS_DIR, "blobs")
+TMP_DIR = os.path.join(ATTACHMENTS_DIR, "tmp")
+CHUNK_SIZE = 1024 * 1024
+
+os.makedirs(BLOBS_DIR, exist_ok=True)
+os.makedirs(TMP_DIR, exist_ok=True)
+
+@dataclass
+class StagedBlob:
+    """Загруженный во временный файл blob, ещё не опубликованный в хранилище"""
+    content_hash: str
+    size: int
+    temp_path: str
+    mime_type: str = "application/octet-stream"
+
+    @property
+    def storage_key(self) -> str:
+        return storage_key(self.content_hash)
+
+
+# Сигнатуры форматов по первым байтам: (смещение, сигнатура, MIME-тип)
+MAGIC_NUMBERS = [
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (8, b"WEBP", "image/webp"),
+    (0, b"BM", "image/bmp"),
+    (0, b"II*\x00", "image/tiff"),
+    (0, b"MM\x00*", "image/tiff"),
+    (0, b"%PDF-", "application/pdf"),
+    (0, b"\x1f\x8b", "application/gzip"),
+    (0, b"7z\xbc\xaf\x27\x1c", "application/x-7z-compressed"),
+    (0, b"Rar!\x1a\x07", "application/vnd.rar"),
+]
+
+# Форматы-контейнеры на базе ZIP (docx, xlsx, ...) различаем по расширению
+ZIP_SIGNATURE = b"PK\x03\x04"
+
+
+def detect_mime_type(head: bytes, filename: Optional[str] = None) -> str:
+    """MIME-тип по содержимому; расширение файла — только уточнение и запасной вариант"""
+    guessed = mimetypes.guess_type(filename)[0] if filename else None
+    for offset, signature, media_type in MAGIC_NUMBERS:
+        if head[offset:offset + len(signature)] == signature:
+            return media_type
+    if head.startswith(ZIP_SIGNATURE):
+        return guessed if guessed and guessed != "application/octet-stream" else "application/zip"
+    if guessed:
+        return guessed
+    if head and b"\x00" not in head[:1024]:
+        try:
+            head[:1024].decode("utf-8")
+            return "text/plain"
+        except UnicodeDecodeError:
+            pass
+    return "application/octet-stream"
+
+
+def storage_key(content_hash: str) -> str:
+    return f"blobs/{content_hash[:2]}/{content_hash}"
+
+
+def blob_path(content_hash: str) -> str:
+    return os.path.join(ATTACHMENTS_DIR, storage_key(content_hash))
+
+
+def _stage(source, filename: Optional[str] = None) -> StagedBlob:
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+    fd, temp_path = tempfile.mkstemp(dir=TMP_DIR)
+    try:
+        with os.fdopen(fd, "wb") as target:
+            while True:
+                chunk = source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if size == 0:
+                    head = chunk[:4096]
+                digest.update(chunk)
+                target.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return StagedBlob(content_hash=digest.hexdigest(), size=size, temp_path=temp_path, mime_type=detect_mime_type(head, filename))
+
+
+async def stage_upload(upload: UploadFile) -> StagedBlob:
+    """Пишет загрузку во временный файл, считая SHA-256, размер и MIME-тип на лету (вне event loop)"""
+    try:
+        return await run_in_threadpool(_stage, upload.file, upload.filename)
+    finally:
+        await upload.close()
+
+
+def publish(staged: StagedBlob) -> Tuple[str, bool]:
+    """
+    Переносит временный файл в хранилище; если такой blob уже есть,
+    временный файл просто удаляется. Вызывается из acquire.
+    Возвращает (путь, created): created — файл положен этим вызовом.
+    """
+    path = blob_path(staged.content_hash)
+    if os.path.exists(path):
+        os.remove(staged.temp_path)
+        return path, False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(staged.temp_path, path)
+    return path, True
+
+
+def add_reference(db: Session, content_hash: str, size: int) -> None:
+    """+1 ссылка одним UPDATE; строки ещё нет — вставка с ref_count = 1 (без коммита)"""
+    updated = db.query(models.Blob).filter(models.Blob.content_hash == content_hash).update(
+        {models.Blob.ref_count: models.Blob.ref_count + 1}, synchronize_session=False
+    )
+    if updated == 0:
+        db.add(models.Blob(content_hash=content_hash, size=size, ref_count=1))
+        db.flush()
+
+
+def acquire(db: Session, staged: StagedBlob) -> Tuple[str, bool]:
+    """
+    Ссылка на blob и файл в хранилище в транзакции db (без коммита).
+    Файл кладётся после UPDATE счётчика, пока строка заблокирована.
+    Возвращает (путь, created); при откате файл с created=True убрать (remove_blob).
+    """
+    add_reference(db, staged.content_hash, staged.size)
+    return publish(staged)
+
+
+def release(db: Session, content_hash: str) -> bool:
+    """-1 ссылка одним UPDATE (без коммита); True — ссылок не осталось, после коммита вызвать collect"""
+    updated = db.query(models.Blob).filter(models.Blob.content_hash == content_hash).update(
+        {models.Blob.ref_count: models.Blob.ref_count - 1}, synchronize_session=False
+    )
+    if updated == 0:
+        return False
+    return db.query(models.Blob.ref_count).filter(models.Blob.content_hash == content_hash).scalar() <= 0
+
+
+def collect(db: Session, content_hash: str) -> bool:
+    """
+    Удаляет blob без ссылок: строку и файлы, в своей транзакции.
+    Если ссылка успела появиться снова, DELETE ничего не находит и файл
+    остаётся. Файл удаляется до коммита, пока строка заблокирована: при
+    сбое коммита строка с ref_count = 0 останется, и следующий acquire
+    положит файл заново.
+    """
+    try:
+        deleted = db.query(models.Blob).filter(models.Blob.content_hash == content_hash, models.Blob.ref_count <= 0).delete(synchronize_session=False)
+        if deleted:
+            remove_blob(content_hash)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return bool(deleted)
+
+
+def discard(staged: StagedBlob) -> None:
+    if os.path.exists(staged.temp_path):
+        os.remove(staged.temp_path)
+
+
+def remove_blob(content_hash: str) -> None:
+    """Удаляет blob и производные файлы рядом с ним (<hash>.thumb.webp и т.п.)"""
+    path = blob_path(content_hash)
+    for candidate in [path] + glob.glob(glob.escape(path) + ".*"):
+        if os.path.exists(candidate):
+            os.remove(candidate)
+
+
+def scan_file(path: str, filename: Optional[str] = None):
+    """Хеш, размер и MIME-тип существующего файла (для backfill): (hash, size, mime)"""
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+    with open(path, "rb") as source:
+        while True:
+            chunk = source.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if size == 0:
+                head = chunk[:4096]
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size, detect_mime_type(head, filename)
@@ -0,0 +1,145 @@
+"""
+Миниатюры и превью для вложений-изображений.
+
+После загрузки вложения задача ставится в ограниченную очередь, которую
+разбирают несколько диспетчеров; сама обработка изображений идёт
+в ProcessPoolExecutor, чтобы не занимать GIL и event loop.
+Результаты кешируются на диске рядом с blob-ом:
+    attachments/blobs/ab/<hash>.thumb.webp
+    attachments/blobs/ab/<hash>.preview.webp
+Так как blob-ы контентно-адресуемы, одна миниатюра обслуживает
+все вложения с одинаковым содержимым.
+"""
+
+import asyncio
+import logging
+import mimetypes
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+
+import storage
+
+logger = logging.getLogger(__name__)
+
+VARIANTS = {
+    "thumb": 256,
+    "preview": 1024,
+}
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+THUMBNAIL_QUEUE_SIZE = int(os.getenv("THUMBNAIL_QUEUE_SIZE", "256"))
+# Маркер "не изображение": чтобы не пытаться повторно декодировать такие файлы
+UNSUPPORTED_SUFFIX = ".nothumb"
+
+
+def variant_path(content_hash: str, variant: str) -> str:
+    return f"{storage.blob_path(content_hash)}.{variant}.webp"
+
+
+def is_image(filename: str) -> bool:
+    media_type = mimetypes.guess_type(filename)[0]
+    return media_type is not None and media_type.startswith("image/")
+
+
+def render_variants(source_path: str, targets: Dict[str, tuple]) -> bool:
+    """
+    Выполняется в дочернем процессе. targets: {variant: (путь, макс. сторона)}.
+    Возвращает False, если файл не удалось прочитать как изображение.
+    """
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    if not os.path.exists(source_path):
+        return False
+    try:
+        with Image.open(source_path) as image:
+            largest = max(size for _, size in targets.values())
+            # Для JPEG декодируем сразу в уменьшенном масштабе — в разы быстрее
+            image.draft("RGB", (largest, largest))
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+            # От большего варианта к меньшему: каждый следующий уменьшается из предыдущего
+            for variant, (path, size) in sorted(targets.items(), key=lambda item: -item[1][1]):
+                image.thumbnail((size, size), Image.Resampling.LANCZOS, reducing_gap=3.0)
+                temp_path = f"{path}.tmp{os.getpid()}"
+                image.save(temp_path, "WEBP", quality=80, method=4)
+                os.replace(temp_path, path)
+        return True
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        with open(source_path + UNSUPPORTED_SUFFIX, "w"):
+            pass
+        return False
+
+
+class ThumbnailService:
+    """Очередь задач + пул процессов. Запускается и останавливается вместе с приложением."""
+
+    def __init__(self, workers: int = THUMBNAIL_WORKERS, queue_size: int = THUMBNAIL_QUEUE_SIZE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.queue: Optional[asyncio.Queue] = None
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self._dispatchers: list = []
+        # Задачи в работе по хешу: повторный запрос ждёт ту же задачу
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def start(self) -> None:
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        self._dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._dispatchers:
+            task.cancel()
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def schedule(self, content_hash: Optional[str], filename: str) -> bool:
+        """Ставит генерацию в очередь; при переполнении задача отбрасывается (сделается по запросу)"""
+        if self.queue is None or not content_hash or not is_image(filename) or self._is_done(content_hash):
+            return False
+        try:
+            self.queue.put_nowait(content_hash)
+            return True
+        except asyncio.QueueFull:
+            logger.warning(f"Thumbnail queue is full, skipping {content_hash}")
+            return False
+
+    async def get(self, content_hash: str, variant: str) -> Optional[str]:
+        """Путь к готовому варианту; если его нет — генерирует и ждёт. None — не изображение."""
+        path = variant_path(content_hash, variant)
+        if os.path.exists(path):
+            return path
+        if os.path.exists(storage.blob_path(content_hash) + UNSUPPORTED_SUFFIX):
+            return None
+        ok = await self._render(content_hash)
+        return path if ok and os.path.exists(path) else None
+
+    def _is_done(self, content_hash: str) -> bool:
+        base = storage.blob_path(content_hash)
+        return os.path.exists(base + UNSUPPORTED_SUFFIX) or all(os.path.exists(variant_path(content_hash, v)) for v in VARIANTS)
+
+    async def _dispatch(self) -> None:
+        while True:
+            content_hash = await self.queue.get()
+            try:
+                if not self._is_done(content_hash):
+                    await self._render(content_hash)
+            except Exception as e:
+                logger.error(f"Thumbnail generation failed for {content_hash}: {e}", exc_info=True)
+            finally:
+                self.queue.task_done()
+
+    async def _render(self, content_hash: str) -> bool:
+        future = self._inflight.get(content_hash)
+        if future is None:
+            source = storage.blob_path(content_hash)
+            targets = {variant: (variant_path(content_hash, variant), size) for variant, size in VARIANTS.items()}
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.pool, render_variants, source, targets)
+            self._inflight[content_hash] = future
+            future.add_done_callback(lambda _: self._inflight.pop(content_hash, None))
+        return await asyncio.shield(future)
+
+
+thumbnail_service = ThumbnailService()
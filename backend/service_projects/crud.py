@@ -1,32 +1,46 @@
+from typing import Optional
 from sqlalchemy.orm import Session
-import models, schemas
+import events, models, schemas
 
 def get_project(db: Session, project_id: int):
     return db.query(models.Project).filter(models.Project.id == project_id).first()
 
-def get_projects(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Project).offset(skip).limit(limit).all()
+def get_projects(db: Session, skip: int = 0, limit: int = 100, columns: Optional[tuple] = None):
+    """columns — только эти колонки в SELECT (строки Row вместо объектов модели)"""
+    if columns is None:
+        return db.query(models.Project).offset(skip).limit(limit).all()
+    return db.query(*(getattr(models.Project, name) for name in columns)).offset(skip).limit(limit).all()
 
 def create_project(db: Session, project: schemas.ProjectCreate, owner_id: int):
     db_project = models.Project(**project.model_dump(), owner_id=owner_id)
     db.add(db_project)
+    db.flush()
+    # Событие — в той же транзакции, что и проект
+    events.publish_project_created(db, project_id=db_project.id, title=db_project.title, owner_id=owner_id)
     db.commit()
     db.refresh(db_project)
     return db_project
 
-def update_project(db: Session, project_id: int, project: schemas.ProjectCreate):
+def update_project(db: Session, project_id: int, project: schemas.ProjectCreate, updated_by: Optional[int] = None):
     db_project = db.query(models.Project).filter(models.Project.id == project_id).first()
     if db_project:
         db_project.title = project.title
         db_project.description = project.description
+        events.publish_project_updated(db, project_id=project_id, title=db_project.title, updated_by=updated_by)
         db.commit()
         db.refresh(db_project)
     return db_project
 
-def delete_project(db: Session, project_id: int):
+def delete_project(db: Session, project_id: int, deleted_by: Optional[int] = None):
     db_project = db.query(models.Project).filter(models.Project.id == project_id).first()
     if db_project:
         db.delete(db_project)
+        events.publish_project_deleted(db, project_id=project_id, deleted_by=deleted_by)
         db.commit()
     return db_project
 
+
+def iter_projects_snapshot(db: Session, batch_size: int = 5000):
+    """Текущее состояние проектов для /events/snapshot, построчно и без загрузки всей таблицы"""
+    query = db.query(models.Project.id, models.Project.title, models.Project.owner_id).order_by(models.Project.id)
+    return query.yield_per(batch_size)
@@ -2,17 +2,29 @@
 Доменные события для сервиса проектов.
 
 В продакшне здесь будет интеграция с брокером сообщений (RabbitMQ, Kafka, Redis Pub/Sub).
-Сейчас это заглушка, которая логирует события.
+Сейчас события сохраняются в журнал event_log (shared/event_log.py),
+из которого их читают потребители, и дублируются в лог.
+
+Событие пишется в той же транзакции, что и изменение, которое его
+породило (outbox): publish_* вызываются до db.commit(), а ошибка
+записи откатывает изменение целиком.
 """
 
 import logging
-import json
 from datetime import datetime
 from typing import Dict, Any, Optional
 from uuid import uuid4
 
+from sqlalchemy.orm import Session
+
+from database import engine
+from shared.event_log import EventStore, on_commit
+from shared.metrics import record_event_published
+
 logger = logging.getLogger(__name__)
 
+event_store = EventStore(engine)
+
 
 class Event:
     """Доменное событие"""
@@ -35,31 +47,39 @@ class Event:
         }
 
 
-def publish_event(event: Event) -> bool:
+def publish_event(db: Session, event: Event) -> int:
     """
-    Публикует событие.
+    Публикует событие в транзакции db и возвращает позицию в журнале.
     
-    В продакшне здесь будет отправка в RabbitMQ/Kafka/Redis:
-    - await rabbitmq_client.publish(exchange="events", routing_key=event.event_type, message=event.to_json())
+    В продакшне здесь будет отправка в RabbitMQ/Kafka/Redis — из журнала,
+    отдельным релеем, а не из запроса.
     
-    Сейчас просто логируем.
+    Сейчас сохраняем в журнал событий и после коммита логируем.
+    Ошибку записи не глотаем: изменение без события не должно зафиксироваться.
     """
     try:
-        logger.info(
-            f"[EVENT] {event.event_type} | "
-            f"ID: {event.event_id} | "
-            f"User: {event.user_id} | "
-            f"Data: {json.dumps(event.data, ensure_ascii=False)}"
-        )
-        return True
-    except Exception as e:
-        logger.error(f"Failed to publish event: {e}", exc_info=True)
-        return False
+        position = event_store.append(event.to_dict(), session=db)
+    except Exception:
+        record_event_published(event.event_type, False)
+        raise
+    on_commit(db, lambda: _log_published(event, position))
+    return position
+
+
+def _log_published(event: Event, position: int) -> None:
+    # Ленивое форматирование: при отфильтрованном уровне строка не собирается,
+    # data уходит в JSON-лог отдельным полем
+    logger.info(
+        "[EVENT] %s | ID: %s | Position: %s | User: %s",
+        event.event_type, event.event_id, position, event.user_id,
+        extra={"event_data": event.data},
+    )
+    record_event_published(event.event_type, True)
 
 
 # Вспомогательные функции для быстрой публикации событий
 
-def publish_project_created(project_id: int, title: str, owner_id: int) -> bool:
+def publish_project_created(db: Session, project_id: int, title: str, owner_id: int) -> int:
     """Публикует событие 'создан заказ' (проект)"""
     event = Event(
         event_type="project.created",
@@ -70,10 +90,10 @@ def publish_project_created(project_id: int, title: str, owner_id: int) -> bool:
         },
         user_id=owner_id
     )
-    return publish_event(event)
+    return publish_event(db, event)
 
 
-def publish_project_updated(project_id: int, title: str, updated_by: int) -> bool:
+def publish_project_updated(db: Session, project_id: int, title: str, updated_by: int) -> int:
     """Публикует событие 'обновлён заказ' (проект)"""
     event = Event(
         event_type="project.updated",
@@ -84,10 +104,10 @@ def publish_project_updated(project_id: int, title: str, updated_by: int) -> boo
         },
         user_id=updated_by
     )
-    return publish_event(event)
+    return publish_event(db, event)
 
 
-def publish_project_deleted(project_id: int, deleted_by: int) -> bool:
+def publish_project_deleted(db: Session, project_id: int, deleted_by: int) -> int:
     """Публикует событие 'удалён заказ' (проект)"""
     event = Event(
         event_type="project.deleted",
@@ -97,5 +117,5 @@ def publish_project_deleted(project_id: int, deleted_by: int) -> bool:
         },
         user_id=deleted_by
     )
-    return publish_event(event)
+    return publish_event(db, event)
 
@@ -1,39 +1,36 @@
 import os
 import httpx
-import uuid
 import logging
-from fastapi import FastAPI, Depends, HTTPException, status, Request
+from typing import Optional
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from jose import JWTError, jwt
-from starlette.middleware.base import BaseHTTPMiddleware
 
 import crud, models, schemas
 from database import engine, SessionLocal
-from events import publish_project_created, publish_project_updated, publish_project_deleted
-
+from events import event_store
+from shared.event_log import create_events_router
+from shared.fieldsets import parse_fields, sparse_response
+from shared.identity import verified_subject
+from shared.logging_config import setup_logging
+from shared.metrics import InstrumentedTransport
+from shared.observability import setup_observability
+from shared.responses import CompressionMiddleware, FastJSONResponse
+
+# Логирование через очередь: файл logs/projects-service.log и stdout (shared/logging_config.py)
+setup_logging("projects-service")
 logger = logging.getLogger(__name__)
 
-# Middleware для X-Request-ID
-class RequestIDMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        request_id = request.headers.get("X-Request-ID", str(uuid.uuid4()))
-        request.state.request_id = request_id
-        logger.info(f"[{request_id}] {request.method} {request.url.path}")
-        response = await call_next(request)
-        response.headers["X-Request-ID"] = request_id
-        logger.info(f"[{request_id}] Response: {response.status_code}")
-        return response
-
 models.Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="Projects Service", version="1.0.0")
-
-# Добавляем middleware для трассировки
-app.add_middleware(RequestIDMiddleware)
+app = FastAPI(title="Projects Service", version="1.0.0", default_response_class=FastJSONResponse)
 
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", "1024")))
+# Request ID, trace, метрики и access-лог за один проход (shared/observability.py)
+setup_observability(app, "projects", engine)
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
 ALGORITHM = os.getenv("JWT_ALG", "HS256")
@@ -41,6 +38,8 @@ AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://localhost:8001")
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# Работа с БД синхронная: эндпоинты с БД — обычные def, FastAPI выполняет
+# их в threadpool, и event loop не ждёт ни запросов, ни соединений из пула
 def get_db():
     db = SessionLocal()
     try:
@@ -48,83 +47,82 @@ def get_db():
     finally:
         db.close()
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
+def projects_snapshot():
+    db = SessionLocal()
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+        for row in crud.iter_projects_snapshot(db):
+            yield {"project_id": row.id, "title": row.title, "owner_id": row.owner_id}
+    finally:
+        db.close()
+
+# Журнал доменных событий для потребителей (отчёты, кеши, индексы)
+app.include_router(create_events_router(event_store, snapshot_source=projects_snapshot))
+
+async def get_current_user(request: Request, token: str = Depends(oauth2_scheme)):
+    credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
+    # Запрос через шлюз: токен уже проверен, личность подписана (shared/identity.py)
+    if verified_subject(request.headers, token, SECRET_KEY) is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            username: str = payload.get("sub")
+            if username is None:
+                raise credentials_exception
+        except JWTError:
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
     
-    async with httpx.AsyncClient() as client:
+    async with httpx.AsyncClient(transport=InstrumentedTransport("auth")) as client:
         response = await client.get(f"{AUTH_SERVICE_URL}/auth/users/me", headers={"Authorization": f"Bearer {token}"})
         if response.status_code != 200:
             raise credentials_exception
         return response.json()
 
+LIST_FIELDS = tuple(schemas.Project.model_fields)
+
+# fields=id,title — в SELECT и в ответе только эти колонки (без description)
 @app.get("/projects/", response_model=list[schemas.Project])
-async def read_projects(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
-    return crud.get_projects(db, skip=skip, limit=limit)
+def read_projects(skip: int = 0, limit: int = 100, fields: Optional[str] = Query(None, description=f"Только эти поля (id всегда): {', '.join(LIST_FIELDS)}"), db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    selected = parse_fields(fields, LIST_FIELDS)
+    if selected is None:
+        return crud.get_projects(db, skip=skip, limit=limit)
+    return sparse_response(schemas.Project, selected, crud.get_projects(db, skip=skip, limit=limit, columns=selected))
 
 @app.get("/projects/{project_id}", response_model=schemas.Project)
-async def read_project(project_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+def read_project(project_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
     db_project = crud.get_project(db, project_id=project_id)
     if db_project is None:
         raise HTTPException(status_code=404, detail="Project not found")
     return db_project
 
 @app.post("/projects/", response_model=schemas.Project)
-async def create_project(project: schemas.ProjectCreate, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
-    # Создаём проект
+def create_project(project: schemas.ProjectCreate, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+    # Создаём проект; событие "создан заказ" пишется в той же транзакции
     new_project = crud.create_project(db=db, project=project, owner_id=current_user["id"])
     
-    # Публикуем событие "создан заказ"
-    publish_project_created(
-        project_id=new_project.id,
-        title=new_project.title,
-        owner_id=current_user["id"]
-    )
-    
     return new_project
 
 @app.put("/projects/{project_id}", response_model=schemas.Project)
-async def update_project(project_id: int, project: schemas.ProjectCreate, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+def update_project(project_id: int, project: schemas.ProjectCreate, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
     db_project = crud.get_project(db, project_id=project_id)
     if db_project is None:
         raise HTTPException(status_code=404, detail="Project not found")
     if db_project.owner_id != current_user["id"] and current_user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    # Обновляем проект
-    updated_project = crud.update_project(db=db, project_id=project_id, project=project)
-    
-    # Публикуем событие "обновлён заказ"
-    publish_project_updated(
-        project_id=project_id,
-        title=updated_project.title,
-        updated_by=current_user["id"]
-    )
+    # Обновляем проект; событие "обновлён заказ" — в той же транзакции
+    updated_project = crud.update_project(db=db, project_id=project_id, project=project, updated_by=current_user["id"])
     
     return updated_project
 
 @app.delete("/projects/{project_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_project(project_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
+def delete_project(project_id: int, db: Session = Depends(get_db), current_user: dict = Depends(get_current_user)):
     db_project = crud.get_project(db, project_id=project_id)
     if db_project is None:
         raise HTTPException(status_code=404, detail="Project not found")
     if db_project.owner_id != current_user["id"] and current_user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    # Удаляем проект
-    crud.delete_project(db=db, project_id=project_id)
-    
-    # Публикуем событие "удалён заказ"
-    publish_project_deleted(
-        project_id=project_id,
-        deleted_by=current_user["id"]
-    )
+    # Удаляем проект; событие "удалён заказ" — в той же транзакции
+    crud.delete_project(db=db, project_id=project_id, deleted_by=current_user["id"])
     
     return
 
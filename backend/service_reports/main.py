@@ -1,10 +1,11 @@
 import os
+import asyncio
 import httpx
 import csv
 from io import BytesIO, StringIO
 from datetime import datetime, timedelta
 from typing import Optional
-from fastapi import FastAPI, Depends, HTTPException, status, Query
+from fastapi import FastAPI, Depends, HTTPException, status, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.responses import StreamingResponse
@@ -12,41 +13,70 @@ from jose import JWTError, jwt
 from openpyxl import Workbook
 
 import schemas
+from shared.identity import verified_subject
+from shared.logging_config import setup_logging
+from shared.metrics import InstrumentedTransport
+from shared.observability import setup_observability
+from shared.responses import CompressionMiddleware, FastJSONResponse
+from read_model import build_consumers
 
-app = FastAPI(title="Reports Service", version="1.0.0")
+# Логирование через очередь: файл logs/reports-service.log и stdout (shared/logging_config.py)
+setup_logging("reports-service")
+app = FastAPI(title="Reports Service", version="1.0.0", default_response_class=FastJSONResponse)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", "1024")))
+# SQL в отчётах нет (read model — sqlite3 напрямую), поэтому без engine
+# Request ID, trace, метрики и access-лог за один проход (shared/observability.py)
+setup_observability(app, "reports")
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
 ALGORITHM = os.getenv("JWT_ALG", "HS256")
 AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://localhost:8001")
 DEFECTS_SERVICE_URL = os.getenv("DEFECTS_SERVICE_URL", "http://localhost:8003")
 PROJECTS_SERVICE_URL = os.getenv("PROJECTS_SERVICE_URL", "http://localhost:8002")
+# Фоновое чтение журналов событий в read model (data/reports.db); аналитика
+# читает её, когда потребитель догнал журнал, а до того — REST сервисов
+EVENT_REPLAY_ENABLED = os.getenv("EVENT_REPLAY_ENABLED", "true").lower() == "true"
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+async def get_current_user(request: Request, token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+    # Запрос через шлюз: токен уже проверен, личность подписана (shared/identity.py)
+    if verified_subject(request.headers, token, SECRET_KEY) is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            username: str = payload.get("sub")
+            if username is None:
+                raise credentials_exception
+        except JWTError:
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
     
-    async with httpx.AsyncClient() as client:
+    async with httpx.AsyncClient(transport=InstrumentedTransport("auth")) as client:
         response = await client.get(f"{AUTH_SERVICE_URL}/auth/users/me", headers={"Authorization": f"Bearer {token}"})
         if response.status_code != 200:
             raise credentials_exception
         return response.json()
 
 async def get_defects_from_service(token: str, params: dict = {}):
-    async with httpx.AsyncClient(timeout=30.0) as client:
+    async with httpx.AsyncClient(timeout=30.0, transport=InstrumentedTransport("defects")) as client:
         response = await client.get(f"{DEFECTS_SERVICE_URL}/defects/", headers={"Authorization": f"Bearer {token}"}, params=params)
         if response.status_code == 200:
             return response.json()
         return []
 
+async def get_defect_summary_from_service(token: str) -> dict:
+    """Сводка сервиса дефектов (total, completed, overdue, active_projects) — один SQL-агрегат по всей таблице"""
+    try:
+        async with httpx.AsyncClient(timeout=30.0, transport=InstrumentedTransport("defects")) as client:
+            response = await client.get(f"{DEFECTS_SERVICE_URL}/defects/metrics/summary", headers={"Authorization": f"Bearer {token}"})
+    except httpx.HTTPError:
+        raise HTTPException(status_code=503, detail="Defects service unavailable")
+    if response.status_code != 200:
+        # Нули вместо цифр выглядели бы как настоящая сводка
+        raise HTTPException(status_code=502, detail=f"Defects summary failed: {response.status_code}")
+    return response.json()
+
 @app.get("/reports/defects/export")
 async def export_defects(format: str = Query("csv", pattern="^(csv|xlsx)$"), current_user: dict = Depends(get_current_user), token: str = Depends(oauth2_scheme)):
     defects = await get_defects_from_service(token)
@@ -73,16 +103,16 @@ async def export_defects(format: str = Query("csv", pattern="^(csv|xlsx)$"), cur
 
 @app.get("/reports/analytics/summary", response_model=schemas.AnalyticsSummary)
 async def get_analytics_summary(start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, current_user: dict = Depends(get_current_user), token: str = Depends(oauth2_scheme)):
-    defects = await get_defects_from_service(token)
-    total_defects = len(defects)
-    overdue_defects = sum(1 for d in defects if d.get("due_date") and datetime.fromisoformat(d.get("due_date").replace("Z", "+00:00")) < datetime.now() and d.get("status") not in ["Закрыта", "Отменена"])
-    completed_defects = sum(1 for d in defects if d.get("status") in ["Закрыта", "Отменена"])
-    completion_percentage = (completed_defects / total_defects * 100) if total_defects > 0 else 0.0
-    active_projects = len(set(d.get("project_id") for d in defects if d.get("status") not in ["Закрыта", "Отменена"]))
-    return schemas.AnalyticsSummary(total_defects=total_defects, overdue_defects=overdue_defects, completion_percentage=round(completion_percentage, 2), active_projects=active_projects)
+    summary = await get_defect_summary_from_service(token)
+    total_defects = summary["total"]
+    completion_percentage = (summary["completed"] / total_defects * 100) if total_defects > 0 else 0.0
+    return schemas.AnalyticsSummary(total_defects=total_defects, overdue_defects=summary["overdue"], completion_percentage=round(completion_percentage, 2), active_projects=summary["active_projects"])
 
 @app.get("/reports/analytics/status-distribution", response_model=list[schemas.DefectCountByStatus])
 async def get_status_distribution(start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, current_user: dict = Depends(get_current_user), token: str = Depends(oauth2_scheme)):
+    defects_model = caught_up_model("reports.defects")
+    if defects_model is not None:
+        return [schemas.DefectCountByStatus(status=status, count=count) for status, count in await asyncio.to_thread(defects_model.status_counts)]
     defects = await get_defects_from_service(token)
     status_counts = {}
     for defect in defects:
@@ -92,6 +122,9 @@ async def get_status_distribution(start_date: Optional[datetime] = None, end_dat
 
 @app.get("/reports/analytics/priority-distribution", response_model=list[schemas.DefectCountByPriority])
 async def get_priority_distribution(start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, current_user: dict = Depends(get_current_user), token: str = Depends(oauth2_scheme)):
+    defects_model = caught_up_model("reports.defects")
+    if defects_model is not None:
+        return [schemas.DefectCountByPriority(priority=priority, count=count) for priority, count in await asyncio.to_thread(defects_model.priority_counts)]
     defects = await get_defects_from_service(token)
     priority_counts = {}
     for defect in defects:
@@ -101,6 +134,9 @@ async def get_priority_distribution(start_date: Optional[datetime] = None, end_d
 
 @app.get("/reports/analytics/creation-trend", response_model=list[schemas.DefectCreationTrendItem])
 async def get_creation_trend(days: int = Query(30), current_user: dict = Depends(get_current_user), token: str = Depends(oauth2_scheme)):
+    defects_model = caught_up_model("reports.defects")
+    if defects_model is not None:
+        return [schemas.DefectCreationTrendItem(date=datetime.fromisoformat(day), count=count) for day, count in await asyncio.to_thread(defects_model.creation_counts)]
     defects = await get_defects_from_service(token)
     date_counts = {}
     for defect in defects:
@@ -116,8 +152,17 @@ async def get_creation_trend(days: int = Query(30), current_user: dict = Depends
 
 @app.get("/reports/analytics/project-performance", response_model=list[schemas.ProjectPerformanceItem])
 async def get_project_performance(start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, current_user: dict = Depends(get_current_user), token: str = Depends(oauth2_scheme)):
+    defects_model, projects_model = caught_up_model("reports.defects"), caught_up_model("reports.projects")
+    if defects_model is not None and projects_model is not None:
+        project_stats = await asyncio.to_thread(defects_model.project_stats)
+        performance_data = []
+        for project_id, title in await asyncio.to_thread(projects_model.projects):
+            total, completed = project_stats.get(project_id, (0, 0))
+            completion_percentage = (completed / total * 100) if total > 0 else 0.0
+            performance_data.append(schemas.ProjectPerformanceItem(project_id=project_id, project_title=title, completed_defects=completed, total_defects=total, completion_percentage=round(completion_percentage, 2)))
+        return performance_data
     defects = await get_defects_from_service(token)
-    async with httpx.AsyncClient() as client:
+    async with httpx.AsyncClient(transport=InstrumentedTransport("projects")) as client:
         projects_response = await client.get(f"{PROJECTS_SERVICE_URL}/projects/", headers={"Authorization": f"Bearer {token}"})
         projects = projects_response.json() if projects_response.status_code == 200 else []
     
@@ -141,6 +186,45 @@ async def get_project_performance(start_date: Optional[datetime] = None, end_dat
     
     return performance_data
 
+# ==================== Read model из журналов событий ====================
+
+read_model_consumers = build_consumers() if EVENT_REPLAY_ENABLED else []
+stop_read_model = asyncio.Event()
+
+@app.on_event("startup")
+async def start_read_model_consumers():
+    for consumer in read_model_consumers:
+        asyncio.create_task(consumer.run(stop_read_model))
+
+@app.on_event("shutdown")
+async def stop_read_model_consumers():
+    stop_read_model.set()
+
+def caught_up_model(consumer_name: str):
+    """Read model потребителя, если он дочитал журнал до головы; None — отчёт считается через REST"""
+    for consumer in read_model_consumers:
+        if consumer.model.consumer == consumer_name and consumer.caught_up:
+            return consumer.model
+    return None
+
+@app.get("/reports/read-model/status")
+async def read_model_status(current_user: dict = Depends(get_current_user)):
+    consumers = []
+    for consumer in read_model_consumers:
+        try:
+            head = await consumer.client.head()
+        except httpx.HTTPError:
+            head = None
+        consumers.append({
+            "consumer": consumer.model.consumer,
+            "position": consumer.position,
+            "head": head,
+            "lag": head - consumer.position if head is not None else None,
+            "caught_up": consumer.caught_up,
+            "rows": await asyncio.to_thread(consumer.model.count),
+        })
+    return {"enabled": EVENT_REPLAY_ENABLED, "consumers": consumers}
+
 @app.get("/health")
 async def health():
     return {"status": "healthy"}
@@ -0,0 +1,216 @@
+"""
+Read model сервиса отчётов, собираемая из журналов событий
+сервисов дефектов и проектов (см. shared/event_consumer.py).
+
+Хранится в SQLite (data/reports.db). Чекпоинт потребителя пишется
+в той же транзакции, что и применённая пачка, поэтому после сбоя
+read model и позиция всегда согласованы.
+"""
+
+import os
+import sqlite3
+import threading
+from itertools import groupby
+from typing import Any, Dict, Iterable, List, Tuple
+
+from shared.event_consumer import EventConsumer, EventLogClient
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+os.makedirs(DATA_DIR, exist_ok=True)
+
+READ_MODEL_PATH = os.getenv("READ_MODEL_PATH", os.path.join(DATA_DIR, "reports.db"))
+DEFECTS_SERVICE_URL = os.getenv("DEFECTS_SERVICE_URL", "http://localhost:8003")
+PROJECTS_SERVICE_URL = os.getenv("PROJECTS_SERVICE_URL", "http://localhost:8002")
+
+CLOSED_STATUSES = ("Закрыта", "Отменена")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rm_checkpoints (
+    consumer TEXT PRIMARY KEY,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rm_defects (
+    defect_id INTEGER PRIMARY KEY,
+    project_id INTEGER,
+    status TEXT,
+    priority TEXT,
+    reporter_id INTEGER,
+    created_at TEXT
+);
+CREATE TABLE IF NOT EXISTS rm_projects (
+    project_id INTEGER PRIMARY KEY,
+    title TEXT,
+    owner_id INTEGER
+);
+"""
+
+
+class SQLiteReadModel:
+    """
+    Базовая read model: обработчики событий задаются в HANDLERS
+    как {event_type: (sql, функция data -> параметры)}.
+    """
+
+    consumer = ""
+    table = ""
+    HANDLERS: Dict[str, Any] = {}
+    SNAPSHOT_SQL = ""
+
+    def __init__(self, path: str = READ_MODEL_PATH):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    @property
+    def event_types(self) -> List[str]:
+        return list(self.HANDLERS)
+
+    def load_checkpoint(self) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT position FROM rm_checkpoints WHERE consumer = ?", (self.consumer,)).fetchone()
+            return row[0] if row else 0
+
+    def _save_checkpoint(self, position: int) -> None:
+        self._conn.execute(
+            "INSERT INTO rm_checkpoints (consumer, position) VALUES (?, ?) "
+            "ON CONFLICT(consumer) DO UPDATE SET position = excluded.position",
+            (self.consumer, position),
+        )
+
+    def apply_batch(self, events: List[Dict[str, Any]], position: int) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                # Подряд идущие события одного типа пишем одним executemany,
+                # порядок между типами сохраняется
+                for event_type, group in groupby(events, key=lambda e: e["event_type"]):
+                    handler = self.HANDLERS.get(event_type)
+                    if handler is None:
+                        continue
+                    sql, params = handler
+                    self._conn.executemany(sql, [params(e) for e in group])
+                self._save_checkpoint(position)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def begin_snapshot(self) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+    def load_snapshot_rows(self, rows: Iterable[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(self.SNAPSHOT_SQL, list(rows))
+            self._conn.execute("COMMIT")
+
+    def finish_snapshot(self, position: int) -> None:
+        with self._lock:
+            self._save_checkpoint(position)
+
+    def reset(self) -> None:
+        """Полная очистка перед пересборкой с нуля"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._conn.execute("DELETE FROM rm_checkpoints WHERE consumer = ?", (self.consumer,))
+            self._conn.execute("COMMIT")
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+class DefectsReadModel(SQLiteReadModel):
+    consumer = "reports.defects"
+    table = "rm_defects"
+    HANDLERS = {
+        "defect.created": (
+            "INSERT OR REPLACE INTO rm_defects (defect_id, project_id, status, priority, reporter_id, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            lambda e: (e["data"]["defect_id"], e["data"]["project_id"], e["data"]["status"], e["data"]["priority"], e["data"]["reporter_id"], e["timestamp"]),
+        ),
+        "defect.status_changed": (
+            "UPDATE rm_defects SET status = ? WHERE defect_id = ?",
+            lambda e: (e["data"]["new_status"], e["data"]["defect_id"]),
+        ),
+        # Дефект мог сменить проект и приоритет; в событиях до появления priority поле пустое
+        "defect.updated": (
+            "UPDATE rm_defects SET project_id = COALESCE(?, project_id), priority = COALESCE(?, priority) WHERE defect_id = ?",
+            lambda e: (e["data"].get("project_id"), e["data"].get("priority"), e["data"]["defect_id"]),
+        ),
+        "defect.deleted": (
+            "DELETE FROM rm_defects WHERE defect_id = ?",
+            lambda e: (e["data"]["defect_id"],),
+        ),
+    }
+    SNAPSHOT_SQL = (
+        "INSERT OR REPLACE INTO rm_defects (defect_id, project_id, status, priority, reporter_id, created_at) "
+        "VALUES (:defect_id, :project_id, :status, :priority, :reporter_id, :created_at)"
+    )
+
+    # ---- запросы аналитики (вызываются из потока) ----
+
+    def _grouped(self, column: str) -> List[Tuple[Any, int]]:
+        with self._lock:
+            return self._conn.execute(f"SELECT COALESCE({column}, 'Unknown'), COUNT(*) FROM rm_defects GROUP BY 1").fetchall()
+
+    def status_counts(self) -> List[Tuple[str, int]]:
+        return self._grouped("status")
+
+    def priority_counts(self) -> List[Tuple[str, int]]:
+        return self._grouped("priority")
+
+    def creation_counts(self) -> List[Tuple[str, int]]:
+        """Число созданных дефектов по дням: created_at — ISO-строка, день — первые 10 символов"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT substr(created_at, 1, 10) AS day, COUNT(*) FROM rm_defects WHERE created_at IS NOT NULL GROUP BY day ORDER BY day"
+            ).fetchall()
+
+    def project_stats(self) -> Dict[int, Tuple[int, int]]:
+        """{project_id: (всего, закрыто)}"""
+        placeholders = ",".join("?" * len(CLOSED_STATUSES))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT project_id, COUNT(*), SUM(status IN ({placeholders})) FROM rm_defects GROUP BY project_id", CLOSED_STATUSES
+            ).fetchall()
+        return {project_id: (total, completed) for project_id, total, completed in rows}
+
+
+
+class ProjectsReadModel(SQLiteReadModel):
+    consumer = "reports.projects"
+    table = "rm_projects"
+    HANDLERS = {
+        "project.created": (
+            "INSERT OR REPLACE INTO rm_projects (project_id, title, owner_id) VALUES (?, ?, ?)",
+            lambda e: (e["data"]["project_id"], e["data"]["title"], e["data"]["owner_id"]),
+        ),
+        "project.updated": (
+            "UPDATE rm_projects SET title = ? WHERE project_id = ?",
+            lambda e: (e["data"]["title"], e["data"]["project_id"]),
+        ),
+        "project.deleted": (
+            "DELETE FROM rm_projects WHERE project_id = ?",
+            lambda e: (e["data"]["project_id"],),
+        ),
+    }
+    SNAPSHOT_SQL = "INSERT OR REPLACE INTO rm_projects (project_id, title, owner_id) VALUES (:project_id, :title, :owner_id)"
+
+    def projects(self) -> List[Tuple[int, str]]:
+        with self._lock:
+            return self._conn.execute("SELECT project_id, COALESCE(title, '') FROM rm_projects ORDER BY project_id").fetchall()
+
+
+def build_consumers(batch_size: int = 5000) -> List[EventConsumer]:
+    """Потребители журналов дефектов и проектов для read model отчётов"""
+    defects_model = DefectsReadModel()
+    projects_model = ProjectsReadModel()
+    return [
+        EventConsumer(EventLogClient(DEFECTS_SERVICE_URL, "reports", upstream="defects"), defects_model, event_types=defects_model.event_types, batch_size=batch_size),
+        EventConsumer(EventLogClient(PROJECTS_SERVICE_URL, "reports", upstream="projects"), projects_model, event_types=projects_model.event_types, batch_size=batch_size),
+    ]
@@ -0,0 +1,43 @@
+"""
+Пересборка read model отчётов из журналов событий.
+
+Примеры:
+    python rebuild_read_model.py                  # полный replay с позиции 0
+    python rebuild_read_model.py --from-snapshot  # снимок + догоняющий replay
+    python rebuild_read_model.py --resume         # продолжить с чекпоинта
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+
+from read_model import build_consumers
+
+
+async def rebuild(from_snapshot: bool, resume: bool, batch_size: int) -> None:
+    for consumer in build_consumers(batch_size=batch_size):
+        started = time.perf_counter()
+        if not resume:
+            consumer.model.reset()
+        if from_snapshot and not resume:
+            await consumer.bootstrap_from_snapshot()
+        count = await consumer.replay()
+        elapsed = time.perf_counter() - started
+        rate = count / elapsed if elapsed > 0 else 0.0
+        print(f"{consumer.model.consumer}: {count} events, {consumer.model.count()} rows, position {consumer.position}, {elapsed:.1f}s ({rate:.0f} events/s)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rebuild reports read model from event logs")
+    parser.add_argument("--from-snapshot", action="store_true", help="start from producer snapshot instead of position 0")
+    parser.add_argument("--resume", action="store_true", help="continue from the stored checkpoint")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(rebuild(args.from_snapshot, args.resume, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
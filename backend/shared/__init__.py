@@ -0,0 +1,7 @@
+"""
+Общий код, который используют несколько сервисов.
+
+В Docker-образ каждого сервиса пакет копируется как /app/shared
+(контекст сборки — папка backend, см. docker-compose.yml).
+Локально сервисы запускаются с PYTHONPATH=backend.
+"""
@@ -0,0 +1,108 @@
+"""
+Бенчмарк fields= на страницах списков по 1000 строк: полный
+GET /defects/ (GET /projects/) против выборочных полей для таблицы.
+
+Маршруты — настоящие из main.py выбранного сервиса, БД — временный
+SQLite с --rows строками и описаниями по --description-words слов,
+проверка пользователя подменена (без auth-сервиса). Запросы идут
+in-process через httpx.ASGITransport. Печатаются p50/p99 и размер
+ответа без сжатия и с gzip.
+
+    cd backend
+    python -m shared.bench_fields --service defects --rows 1000
+    python -m shared.bench_fields --service projects --rows 1000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+SERVICES = {
+    # сервис: (сущность в списке, выборочные поля по умолчанию)
+    "defects": ("defects", "id,title,status,priority,assignee_id,due_date"),
+    "projects": ("projects", "id,title,owner_id"),
+}
+WORDS = "трещина фасад бетон арматура протечка кровля монтаж перекрытие отделка штукатурка проверка акт этаж секция".split()
+
+
+def load_service(service: str):
+    """main.py сервиса с временной БД; модули сервисов называются одинаково, поэтому один сервис на процесс"""
+    data_dir = tempfile.mkdtemp(prefix="bench-fields-")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(data_dir, service + '.db')}")
+    os.environ.setdefault("LOG_FILE", "false")
+    os.environ.setdefault("TRACE_SAMPLE_RATE", "0.01")
+    os.environ.setdefault("PROJECT_REGISTRY_ENABLED", "false")
+    os.environ.setdefault("DUE_SCHEDULER_ENABLED", "false")
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), f"service_{service}"))
+    import main
+    import models
+    from database import SessionLocal
+    main.app.dependency_overrides[main.get_current_user] = lambda: {"id": 1, "username": "bench", "role": "admin"}
+    return main, models, SessionLocal
+
+
+def seed(service: str, models, SessionLocal, rows: int, description_words: int) -> None:
+    rng = random.Random(42)
+    created = datetime(2025, 1, 1)
+    db = SessionLocal()
+    try:
+        for i in range(rows):
+            title = " ".join(rng.choices(WORDS, k=5)).capitalize()
+            description = " ".join(rng.choices(WORDS, k=description_words))
+            if service == "defects":
+                db.add(models.Defect(title=title, description=description, priority="Средний", status="Новая", project_id=rng.randint(1, 20), reporter_id=1, assignee_id=rng.randint(1, 50), due_date=created + timedelta(days=rng.randint(1, 90)), created_at=created + timedelta(minutes=i)))
+            else:
+                db.add(models.Project(title=title, description=description, owner_id=rng.randint(1, 50), created_at=created + timedelta(minutes=i)))
+        db.commit()
+    finally:
+        db.close()
+
+
+async def measure(client, path: str, params: dict, requests: int):
+    for _ in range(10):
+        (await client.get(path, params=params)).raise_for_status()
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        response = await client.get(path, params=params)
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - started) * 1000)
+    raw = len(response.content)
+    gzipped = await client.get(path, params=params, headers={"Accept-Encoding": "gzip"})
+    q = statistics.quantiles(latencies, n=100)
+    return q[49], q[98], raw, int(gzipped.headers.get("content-length", len(gzipped.content)))
+
+
+async def run(args) -> None:
+    main, models, SessionLocal = load_service(args.service)
+    seed(args.service, models, SessionLocal, args.rows, args.description_words)
+    entity, default_fields = SERVICES[args.service]
+    fields = args.fields or default_fields
+    path = f"/{entity}/"
+    import httpx
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", headers={"Accept-Encoding": "identity"}) as client:
+        print(f"GET {path}?limit={args.rows}: {args.rows} rows, description {args.description_words} words, {args.requests} requests")
+        results = {}
+        for name, params in (("all fields", {"limit": args.rows}), (f"fields={fields}", {"limit": args.rows, "fields": fields})):
+            results[name] = await measure(client, path, params, args.requests)
+            p50, p99, raw, gzipped = results[name]
+            print(f"  {name:52} p50 {p50:7.2f} ms   p99 {p99:7.2f} ms   {raw:8d} bytes   {gzipped:7d} gzip")
+    full, narrow = results["all fields"], results[f"fields={fields}"]
+    print(f"\np50: {full[0]:.2f} -> {narrow[0]:.2f} ms ({narrow[0] / full[0] - 1:+.0%}), bytes: {full[2]} -> {narrow[2]} ({narrow[2] / full[2] - 1:+.0%}), gzip: {full[3]} -> {narrow[3]} ({narrow[3] / full[3] - 1:+.0%})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List pages: all columns vs fields=")
+    parser.add_argument("--service", choices=sorted(SERVICES), default="defects")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--description-words", type=int, default=60)
+    parser.add_argument("--fields", help="поля для выборочного запроса (по умолчанию — колонки таблицы в UI)")
+    args = parser.parse_args()
+    asyncio.run(run(args))
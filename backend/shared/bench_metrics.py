@@ -0,0 +1,119 @@
+"""
+Накладные расходы метрик и трассировки и проверка бюджета.
+
+1. RequestMiddleware (shared/observability.py; запрос не попал в выборку
+   трассировки, как почти все при TRACE_SAMPLE_RATE=0.01, access-лог
+   отфильтрован): тот же ASGI-обработчик с middleware и без него, вызов
+   напрямую, без сервера и сети — разница и есть цена инструментирования.
+2. instrument_engine: SELECT по индексу в SQLite в памяти с событиями
+   движка и без них.
+3. Выдача /metrics при типичном числе серий.
+
+Бюджет: не больше BUDGET_REQUEST_US на запрос и BUDGET_QUERY_US на SQL-запрос.
+Код возврата 1, если бюджет превышен.
+
+    cd backend
+    python -m shared.bench_metrics
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+import time
+import timeit
+
+from sqlalchemy import create_engine, text
+
+from shared import metrics, tracing
+from shared.observability import RequestMiddleware
+
+BUDGET_REQUEST_US = 25.0
+BUDGET_QUERY_US = 10.0
+
+
+class FakeRoute:
+    path = "/defects/{defect_id}"
+
+
+async def endpoint(scope, receive, send):
+    scope["route"] = FakeRoute()
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def noop_receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def noop_send(message):
+    pass
+
+
+async def per_request_us(app, requests: int) -> float:
+    best = float("inf")
+    for _ in range(5):
+        started = time.perf_counter()
+        for _ in range(requests):
+            await app({"type": "http", "method": "GET", "path": "/defects/1", "headers": [(b"x-request-id", b"bench")]}, noop_receive, noop_send)
+        best = min(best, (time.perf_counter() - started) / requests)
+    return best * 1e6
+
+
+def make_engine(instrumented: bool):
+    engine = create_engine("sqlite://")
+    if instrumented:
+        metrics.instrument_engine(engine)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE defects (id INTEGER PRIMARY KEY, title TEXT)"))
+        conn.execute(text("INSERT INTO defects (id, title) VALUES (1, 'defect')"))
+    return engine
+
+
+def per_query_us(engine, queries: int) -> float:
+    statement = text("SELECT title FROM defects WHERE id = 1")
+    with engine.connect() as conn:
+        return min(timeit.repeat(lambda: conn.execute(statement).scalar(), number=queries, repeat=5)) / queries * 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Metrics overhead and budget check")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=20000)
+    args = parser.parse_args()
+    metrics.SERVICE["name"] = "bench"
+    tracing.TRACE_SAMPLE_RATE = 0.0
+    logging.getLogger("access").setLevel(logging.WARNING)
+
+    bare = asyncio.run(per_request_us(endpoint, args.requests))
+    wrapped = asyncio.run(per_request_us(RequestMiddleware(endpoint), args.requests))
+    request_overhead = wrapped - bare
+    print("HTTP middleware (per request):")
+    print(f"  without middleware:  {bare:7.2f} us")
+    print(f"  RequestMiddleware:   {wrapped:7.2f} us")
+    print(f"  overhead:            {request_overhead:7.2f} us  (budget {BUDGET_REQUEST_US:.0f} us)")
+
+    plain = per_query_us(make_engine(False), args.queries)
+    timed = per_query_us(make_engine(True), args.queries)
+    query_overhead = timed - plain
+    print("\nSQLAlchemy (per query, SQLite in memory):")
+    print(f"  without events:      {plain:7.2f} us")
+    print(f"  with events:         {timed:7.2f} us")
+    print(f"  overhead:            {query_overhead:7.2f} us  (budget {BUDGET_QUERY_US:.0f} us)")
+
+    # Примерно столько серий у сервиса дефектов: ~30 маршрутов x методы x статусы
+    for i in range(30):
+        for status in ("200", "404", "500"):
+            metrics.HTTP_REQUESTS.labels("bench", "GET", f"/route/{i}", status).inc()
+            metrics.HTTP_DURATION.labels("bench", "GET", f"/route/{i}").observe(0.01)
+    started = time.perf_counter()
+    body = metrics.registry.expose()
+    print(f"\n/metrics: {len(body)} bytes, rendered in {(time.perf_counter() - started) * 1000:.2f} ms")
+
+    within = request_overhead <= BUDGET_REQUEST_US and query_overhead <= BUDGET_QUERY_US
+    print("\nWithin budget" if within else "\nBUDGET EXCEEDED")
+    return 0 if within else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
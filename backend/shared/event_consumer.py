@@ -0,0 +1,212 @@
+"""
+Потребитель журнала событий другого сервиса (см. shared/event_log.py).
+
+Read model потребителя — любой объект с методами:
+- consumer: str — имя потребителя (ключ чекпоинта)
+- load_checkpoint() -> int — последняя применённая позиция
+- apply_batch(events, position) — применяет пачку и атомарно сохраняет позицию
+- для холодного старта из снимка (необязательно):
+  begin_snapshot(), load_snapshot_rows(rows), finish_snapshot(position)
+
+Обработчики событий в read model должны быть идемпотентны: после сбоя
+пачка может быть применена повторно.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+import httpx
+from jose import jwt
+
+from shared.identity import SERVICE_SUBJECT_PREFIX, SERVICE_TOKEN_TYPE
+from shared.metrics import InstrumentedTransport
+
+logger = logging.getLogger(__name__)
+
+SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
+ALGORITHM = os.getenv("JWT_ALG", "HS256")
+
+SERVICE_TOKEN_TTL = timedelta(minutes=60)
+
+
+def create_service_token(service_name: str, expires_delta: timedelta = SERVICE_TOKEN_TTL) -> str:
+    """JWT для межсервисных вызовов (sub = service:<имя>, typ = service)"""
+    expire = datetime.utcnow() + expires_delta
+    return jwt.encode({"sub": f"{SERVICE_SUBJECT_PREFIX}{service_name}", "typ": SERVICE_TOKEN_TYPE, "exp": expire}, SECRET_KEY, algorithm=ALGORITHM)
+
+
+class EventLogClient:
+    """HTTP-клиент к /events/* сервиса-производителя"""
+
+    def __init__(self, base_url: str, service_name: str, timeout: float = 30.0, upstream: str = "events"):
+        self.base_url = base_url.rstrip("/")
+        self.service_name = service_name
+        # Имя сервиса-производителя в метриках вызовов
+        self.upstream = upstream
+        self.timeout = timeout
+        self._token: Optional[str] = None
+        self._token_expires_at = 0.0
+
+    def _headers(self) -> Dict[str, str]:
+        # Перевыпускаем токен заранее, за минуту до истечения
+        if self._token is None or time.monotonic() > self._token_expires_at:
+            self._token = create_service_token(self.service_name)
+            self._token_expires_at = time.monotonic() + SERVICE_TOKEN_TTL.total_seconds() - 60
+        return {"Authorization": f"Bearer {self._token}"}
+
+    @staticmethod
+    def _types_param(event_types: Optional[Sequence[str]]) -> Dict[str, str]:
+        return {"types": ",".join(event_types)} if event_types else {}
+
+    async def head(self) -> int:
+        async with httpx.AsyncClient(timeout=self.timeout, transport=InstrumentedTransport(self.upstream)) as client:
+            response = await client.get(f"{self.base_url}/events/head", headers=self._headers())
+            response.raise_for_status()
+            return response.json()["head"]
+
+    async def fetch_batch(self, after: int, limit: int = 1000, event_types: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        params = {"after": after, "limit": limit, **self._types_param(event_types)}
+        async with httpx.AsyncClient(timeout=self.timeout, transport=InstrumentedTransport(self.upstream)) as client:
+            response = await client.get(f"{self.base_url}/events/", headers=self._headers(), params=params)
+            response.raise_for_status()
+            return response.json()["events"]
+
+    async def _stream_lines(self, path: str, params: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        # Без таймаута на чтение: длинный поток не должен обрываться посередине
+        timeout = httpx.Timeout(self.timeout, read=None)
+        async with httpx.AsyncClient(timeout=timeout, transport=InstrumentedTransport(self.upstream)) as client:
+            async with client.stream("GET", f"{self.base_url}{path}", headers=self._headers(), params=params) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if line:
+                        yield json.loads(line)
+
+    def stream(self, after: int = 0, until: Optional[int] = None, event_types: Optional[Sequence[str]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Все события с позицией > after (до until или текущей головы журнала)"""
+        params: Dict[str, Any] = {"after": after, **self._types_param(event_types)}
+        if until is not None:
+            params["until"] = until
+        return self._stream_lines("/events/stream", params)
+
+    def live(self, after: Optional[int] = None, event_types: Optional[Sequence[str]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Бесконечный хвост журнала: события после after и все новые по мере публикации"""
+        params: Dict[str, Any] = self._types_param(event_types)
+        if after is not None:
+            params["after"] = after
+        return self._stream_lines("/events/live", params)
+
+    def stream_snapshot(self) -> AsyncIterator[Dict[str, Any]]:
+        """Первая строка — {"position": N}, далее строки текущего состояния"""
+        return self._stream_lines("/events/snapshot", {})
+
+
+class EventConsumer:
+    """
+    Догоняющее чтение журнала в read model.
+
+    Чтение из сети и применение пачек идут параллельно через очередь
+    ограниченного размера: пока read model пишет одну пачку, следующая
+    уже скачивается, а в памяти не бывает больше queue_size пачек.
+    """
+
+    def __init__(self, client: EventLogClient, model, event_types: Optional[Sequence[str]] = None, batch_size: int = 5000, queue_size: int = 2, poll_interval: float = 1.0):
+        self.client = client
+        self.model = model
+        self.event_types = list(event_types) if event_types else None
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval
+        self.position = 0
+        # Последний проход replay дошёл до головы журнала: read model можно читать вместо REST
+        self.caught_up = False
+
+    async def _pipeline(self, source: AsyncIterator[Dict[str, Any]], apply) -> int:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+
+        async def produce():
+            batch: List[Dict[str, Any]] = []
+            async for item in source:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    await queue.put(batch)
+                    batch = []
+            if batch:
+                await queue.put(batch)
+            await queue.put(None)
+
+        producer = asyncio.create_task(produce())
+        count = 0
+        try:
+            while True:
+                batch = await queue.get()
+                if batch is None:
+                    break
+                # read model синхронная (SQLite) — применяем вне event loop
+                await asyncio.to_thread(apply, batch)
+                count += len(batch)
+            await producer
+        finally:
+            if not producer.done():
+                producer.cancel()
+        return count
+
+    async def replay(self, from_position: Optional[int] = None, until: Optional[int] = None) -> int:
+        """Применяет события после from_position (по умолчанию — после чекпоинта)"""
+        if from_position is None:
+            from_position = await asyncio.to_thread(self.model.load_checkpoint)
+        self.position = from_position
+
+        def apply(events: List[Dict[str, Any]]) -> None:
+            self.model.apply_batch(events, events[-1]["position"])
+            self.position = events[-1]["position"]
+
+        started = time.perf_counter()
+        count = await self._pipeline(self.client.stream(after=from_position, until=until, event_types=self.event_types), apply)
+        if count:
+            elapsed = time.perf_counter() - started
+            logger.info(f"[{self.model.consumer}] replayed {count} events up to {self.position} in {elapsed:.2f}s")
+        return count
+
+    async def bootstrap_from_snapshot(self) -> int:
+        """Холодный старт: состояние из снимка производителя вместо полного replay"""
+        source = self.client.stream_snapshot()
+        header = await source.__anext__()
+        position = header["position"]
+        await asyncio.to_thread(self.model.begin_snapshot)
+        count = await self._pipeline(source, self.model.load_snapshot_rows)
+        await asyncio.to_thread(self.model.finish_snapshot, position)
+        self.position = position
+        logger.info(f"[{self.model.consumer}] loaded snapshot of {count} rows at position {position}")
+        return position
+
+    async def run(self, stop: asyncio.Event, use_snapshot: bool = True) -> None:
+        """Снимок (если read model пуста) + догоняющий replay + ожидание новых событий"""
+        position = await asyncio.to_thread(self.model.load_checkpoint)
+        if position == 0 and use_snapshot and hasattr(self.model, "begin_snapshot"):
+            try:
+                await self.bootstrap_from_snapshot()
+            except httpx.HTTPError as e:
+                # Без снимка read model соберётся полным replay с начала журнала
+                logger.warning(f"[{self.model.consumer}] snapshot unavailable, falling back to replay: {e}")
+        try:
+            while not stop.is_set():
+                try:
+                    applied = await self.replay()
+                    self.caught_up = True
+                except httpx.HTTPError as e:
+                    logger.warning(f"[{self.model.consumer}] event log unavailable: {e}")
+                    self.caught_up = False
+                    applied = 0
+                if applied == 0:
+                    try:
+                        await asyncio.wait_for(stop.wait(), timeout=self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            # Потребитель остановлен или упал — read model больше не догоняет журнал
+            self.caught_up = False
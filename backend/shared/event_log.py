@@ -0,0 +1,369 @@
+"""
+Журнал доменных событий (append-only) для сервисов-производителей.
+
+Каждое опубликованное событие получает монотонно растущую позицию —
+это первичный ключ таблицы event_log. Потребители (отчёты, кеши,
+поисковые индексы) читают журнал с нужной позиции пачками по ключу
+(id > after), поэтому стоимость чтения не зависит от того, как далеко
+от начала журнала находится потребитель.
+
+Эндпоинты /events/* внутренние: шлюз их не проксирует, а доступ
+проверяется по подписи JWT без запроса в auth-сервис. Пускают только
+сервисный токен (create_service_token): обычный токен пользователя
+подписан тем же ключом, но получает 403.
+/events/live — бесконечный хвост журнала для ленты изменений шлюза
+(api_gateway/feed.py): новые события приходят сразу после append()
+в этом же процессе, без опроса БД по таймеру.
+
+Сервисы пишут событие через append(event, session=db) в транзакции
+изменения, которое его породило (outbox): строка журнала появляется
+вместе с изменением или не появляется вовсе. Читателей будит коммит
+этой транзакции (on_commit), откат их не трогает.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from fastapi.security import OAuth2PasswordBearer
+from jose import JWTError, jwt
+from pydantic import BaseModel
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, Text, event as sa_event, func, select
+from sqlalchemy.orm import Session
+
+from shared.identity import SERVICE_SUBJECT_PREFIX, SERVICE_TOKEN_TYPE
+
+logger = logging.getLogger(__name__)
+
+SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
+ALGORITHM = os.getenv("JWT_ALG", "HS256")
+
+# Максимальный размер одной пачки для /events/ и шаг чтения для /events/stream
+MAX_BATCH_SIZE = 10000
+STREAM_BATCH_SIZE = 5000
+# Пустая строка в /events/live, если новых событий нет столько секунд:
+# держит соединение живым через прокси и обнаруживает отключившегося читателя
+LIVE_HEARTBEAT_INTERVAL = 15.0
+
+metadata = MetaData()
+
+event_log = Table(
+    "event_log",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("event_id", String(36), nullable=False, unique=True),
+    Column("event_type", String, nullable=False),
+    Column("user_id", Integer, nullable=True),
+    Column("timestamp", String, nullable=False),
+    # data храним уже сериализованным: при выдаче потока он не перекодируется
+    Column("data", Text, nullable=False),
+)
+
+event_checkpoints = Table(
+    "event_checkpoints",
+    metadata,
+    Column("consumer", String, primary_key=True),
+    Column("position", Integer, nullable=False, default=0),
+    Column("updated_at", DateTime, default=datetime.utcnow),
+)
+
+
+def _row_to_event(row) -> Dict[str, Any]:
+    return {
+        "position": row.id,
+        "event_id": row.event_id,
+        "event_type": row.event_type,
+        "data": json.loads(row.data),
+        "user_id": row.user_id,
+        "timestamp": row.timestamp,
+    }
+
+
+def _row_to_ndjson(row) -> str:
+    # Собираем строку вручную, чтобы не делать json.loads/json.dumps для data
+    return (
+        f'{{"position":{row.id},"event_id":{json.dumps(row.event_id)},'
+        f'"event_type":{json.dumps(row.event_type)},"data":{row.data},'
+        f'"user_id":{json.dumps(row.user_id)},"timestamp":{json.dumps(row.timestamp)}}}\n'
+    )
+
+
+# ==================== Действия после коммита ====================
+
+_AFTER_COMMIT_KEY = "event_log.after_commit"
+
+
+def on_commit(session: Session, callback: Callable[[], None]) -> None:
+    """
+    Выполнить callback после коммита текущей транзакции session.
+    При откате (или закрытии сессии без коммита) callback отбрасывается.
+    """
+    session.info.setdefault(_AFTER_COMMIT_KEY, []).append(callback)
+
+
+@sa_event.listens_for(Session, "after_commit")
+def _run_after_commit(session: Session) -> None:
+    for callback in session.info.pop(_AFTER_COMMIT_KEY, ()):
+        # Транзакция уже зафиксирована: ошибка колбэка не должна выглядеть как ошибка коммита
+        try:
+            callback()
+        except Exception as e:
+            logger.error("After-commit callback failed: %s", e, exc_info=True)
+
+
+@sa_event.listens_for(Session, "after_transaction_end")
+def _drop_after_commit(session: Session, transaction) -> None:
+    # После коммита список уже пуст; здесь остаются колбэки откаченной транзакции
+    if transaction.parent is None:
+        session.info.pop(_AFTER_COMMIT_KEY, None)
+
+
+class AppendNotifier:
+    """
+    Будит читателей /events/live после append().
+
+    append() вызывается и из event loop, и из threadpool, поэтому
+    пробуждение передаётся в loop через call_soon_threadsafe. Счётчик
+    version закрывает гонку "прочитал пусто — событие — начал ждать":
+    читатель запоминает version до чтения БД и не ждёт, если он изменился.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._event: Optional[asyncio.Event] = None
+
+    def notify(self) -> None:
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self) -> None:
+        self.version += 1
+        if self._event is not None:
+            self._event.set()
+            self._event = None
+
+    async def wait(self, version: int, timeout: float) -> None:
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        if self.version != version:
+            return
+        if self._event is None:
+            self._event = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+class EventStore:
+    """Append-only журнал событий и чекпоинты потребителей в БД сервиса"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.notifier = AppendNotifier()
+        metadata.create_all(bind=engine)
+
+    def append(self, event: Dict[str, Any], session: Optional[Session] = None) -> int:
+        """
+        Добавляет событие (формат Event.to_dict()) и возвращает его позицию.
+
+        С session строка пишется в транзакции сессии и фиксируется её
+        коммитом; без session — в отдельной транзакции.
+        """
+        insert = event_log.insert().values(
+            event_id=event["event_id"],
+            event_type=event["event_type"],
+            user_id=event.get("user_id"),
+            timestamp=event["timestamp"],
+            data=json.dumps(event["data"], ensure_ascii=False),
+        )
+        if session is not None:
+            position = session.execute(insert).inserted_primary_key[0]
+            # После коммита: разбуженный читатель увидит строку
+            on_commit(session, self.notifier.notify)
+            return position
+        with self.engine.begin() as conn:
+            position = conn.execute(insert).inserted_primary_key[0]
+        self.notifier.notify()
+        return position
+
+    def head(self) -> int:
+        """Позиция последнего события (0 — журнал пуст)"""
+        with self.engine.connect() as conn:
+            return conn.execute(select(func.max(event_log.c.id))).scalar() or 0
+
+    def _batch_query(self, after: int, limit: int, event_types: Optional[Sequence[str]], until: Optional[int]):
+        query = select(event_log).where(event_log.c.id > after)
+        if until is not None:
+            query = query.where(event_log.c.id <= until)
+        if event_types:
+            query = query.where(event_log.c.event_type.in_(event_types))
+        return query.order_by(event_log.c.id).limit(limit)
+
+    def read_batch(self, after: int = 0, limit: int = 1000, event_types: Optional[Sequence[str]] = None, until: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Пачка событий с позицией > after в порядке записи"""
+        with self.engine.connect() as conn:
+            return [_row_to_event(row) for row in conn.execute(self._batch_query(after, limit, event_types, until))]
+
+    def iter_ndjson(self, after: int = 0, until: Optional[int] = None, event_types: Optional[Sequence[str]] = None, batch_size: int = STREAM_BATCH_SIZE) -> Iterator[bytes]:
+        """
+        Поток событий в формате NDJSON: один кусок на пачку.
+
+        Верхняя граница фиксируется в начале чтения, поэтому поток конечен,
+        а в памяти одновременно находится не больше одной пачки.
+        """
+        if until is None:
+            until = self.head()
+        while after < until:
+            with self.engine.connect() as conn:
+                rows = conn.execute(self._batch_query(after, batch_size, event_types, until)).all()
+            if not rows:
+                return
+            after = rows[-1].id
+            yield "".join(_row_to_ndjson(row) for row in rows).encode("utf-8")
+
+    def _read_ndjson(self, after: int, event_types: Optional[Sequence[str]], batch_size: int):
+        with self.engine.connect() as conn:
+            rows = conn.execute(self._batch_query(after, batch_size, event_types, None)).all()
+        if not rows:
+            return after, b""
+        return rows[-1].id, "".join(_row_to_ndjson(row) for row in rows).encode("utf-8")
+
+    async def iter_live(self, after: Optional[int] = None, event_types: Optional[Sequence[str]] = None, heartbeat: float = LIVE_HEARTBEAT_INTERVAL, batch_size: int = STREAM_BATCH_SIZE) -> AsyncIterator[bytes]:
+        """
+        Бесконечный NDJSON-поток событий после after (по умолчанию — с текущей головы).
+        Чтение БД — в threadpool; между событиями поток ждёт append(), а не опрашивает БД.
+        """
+        if after is None:
+            after = await asyncio.to_thread(self.head)
+        # Первая строка сразу: клиент получает заголовки ответа, не дожидаясь события
+        yield b"\n"
+        while True:
+            version = self.notifier.version
+            after, chunk = await asyncio.to_thread(self._read_ndjson, after, event_types, batch_size)
+            if chunk:
+                yield chunk
+                continue
+            await self.notifier.wait(version, heartbeat)
+            if self.notifier.version == version:
+                yield b"\n"
+
+    def get_checkpoint(self, consumer: str) -> int:
+        with self.engine.connect() as conn:
+            position = conn.execute(
+                select(event_checkpoints.c.position).where(event_checkpoints.c.consumer == consumer)
+            ).scalar()
+            return position or 0
+
+    def commit_checkpoint(self, consumer: str, position: int) -> None:
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                event_checkpoints.update()
+                .where(event_checkpoints.c.consumer == consumer)
+                .values(position=position, updated_at=datetime.utcnow())
+            )
+            if result.rowcount == 0:
+                conn.execute(event_checkpoints.insert().values(consumer=consumer, position=position, updated_at=datetime.utcnow()))
+
+
+# ==================== HTTP API журнала ====================
+
+class CheckpointUpdate(BaseModel):
+    position: int
+
+
+service_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+
+
+def verify_service_token(token: str = Depends(service_oauth2_scheme)) -> Dict[str, Any]:
+    """Подпись, срок и признак сервисного токена — без запроса в auth-сервис"""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
+    if payload.get("sub") is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload", headers={"WWW-Authenticate": "Bearer"})
+    if payload.get("typ") != SERVICE_TOKEN_TYPE or not str(payload["sub"]).startswith(SERVICE_SUBJECT_PREFIX):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Service token required")
+    return payload
+
+
+def _parse_types(types: Optional[str]) -> Optional[List[str]]:
+    return [t for t in types.split(",") if t] if types else None
+
+
+def create_events_router(store: EventStore, snapshot_source: Optional[Callable[[], Iterable[Dict[str, Any]]]] = None) -> APIRouter:
+    """
+    Роутер /events для сервиса-производителя.
+
+    snapshot_source — генератор текущего состояния агрегатов; если он задан,
+    доступен /events/snapshot для холодного старта потребителя.
+    """
+    router = APIRouter(prefix="/events", tags=["events"], dependencies=[Depends(verify_service_token)])
+
+    @router.get("/")
+    def read_events(after: int = 0, limit: int = Query(1000, ge=1, le=MAX_BATCH_SIZE), types: Optional[str] = None):
+        events = store.read_batch(after=after, limit=limit, event_types=_parse_types(types))
+        return {
+            "events": events,
+            "next_after": events[-1]["position"] if events else after,
+            "head": store.head(),
+        }
+
+    @router.get("/head")
+    def read_head():
+        return {"head": store.head()}
+
+    @router.get("/stream")
+    def stream_events(after: int = 0, until: Optional[int] = None, types: Optional[str] = None):
+        return StreamingResponse(
+            store.iter_ndjson(after=after, until=until, event_types=_parse_types(types)),
+            media_type="application/x-ndjson",
+        )
+
+    @router.get("/live")
+    async def live_events(after: Optional[int] = None, types: Optional[str] = None):
+        # no-transform: CompressionMiddleware не держит компрессор на всё время жизни потока
+        return StreamingResponse(
+            store.iter_live(after=after, event_types=_parse_types(types)),
+            media_type="application/x-ndjson",
+            headers={"Cache-Control": "no-cache, no-transform"},
+        )
+
+    @router.get("/snapshot")
+    def stream_snapshot():
+        if snapshot_source is None:
+            raise HTTPException(status_code=404, detail="Snapshot is not supported")
+
+        def generate():
+            # Позицию фиксируем до чтения состояния: события после неё
+            # потребитель применит поверх снимка (обработчики идемпотентны)
+            yield (json.dumps({"position": store.head()}) + "\n").encode("utf-8")
+            lines = []
+            for row in snapshot_source():
+                lines.append(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+                if len(lines) >= STREAM_BATCH_SIZE:
+                    yield "".join(lines).encode("utf-8")
+                    lines = []
+            if lines:
+                yield "".join(lines).encode("utf-8")
+
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+    @router.get("/checkpoints/{consumer}")
+    def read_checkpoint(consumer: str):
+        return {"consumer": consumer, "position": store.get_checkpoint(consumer), "head": store.head()}
+
+    @router.put("/checkpoints/{consumer}")
+    def update_checkpoint(consumer: str, checkpoint: CheckpointUpdate):
+        store.commit_checkpoint(consumer, checkpoint.position)
+        return {"consumer": consumer, "position": checkpoint.position}
+
+    return router
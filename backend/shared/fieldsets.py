@@ -0,0 +1,44 @@
+"""
+Выборочные поля в списках: GET /defects/?fields=id,title,status.
+
+parse_fields сверяет запрошенные поля с allow-list схемы ответа
+(неизвестное поле — 400) и всегда добавляет id. Сервис выбирает в
+SELECT только эти колонки. sparse_response кодирует строки моделью,
+собранной из тех же полей базовой схемы: типы и формат дат остаются
+прежними, просто лишних ключей нет. Модели кешируются по набору полей.
+"""
+
+from functools import lru_cache
+from typing import Iterable, Optional, Sequence, Tuple, Type
+
+from fastapi import HTTPException
+from pydantic import BaseModel, ConfigDict, TypeAdapter, create_model
+
+from shared.responses import FastJSONResponse
+
+ALWAYS_FIELDS = ("id",)
+
+
+def parse_fields(fields: Optional[str], allowed: Sequence[str]) -> Optional[Tuple[str, ...]]:
+    """fields=a,b -> ("id", "a", "b") в порядке allowed; None — поля не заданы"""
+    if fields is None:
+        return None
+    requested = {part.strip() for part in fields.split(",") if part.strip()}
+    unknown = requested - set(allowed)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    requested.update(ALWAYS_FIELDS)
+    return tuple(name for name in allowed if name in requested)
+
+
+@lru_cache(maxsize=256)
+def _list_adapter(model: Type[BaseModel], fields: Tuple[str, ...]) -> TypeAdapter:
+    definitions = {name: (model.model_fields[name].annotation, model.model_fields[name]) for name in fields}
+    narrowed = create_model(f"{model.__name__}Fields", __config__=ConfigDict(from_attributes=True), **definitions)
+    return TypeAdapter(list[narrowed])
+
+
+def sparse_response(model: Type[BaseModel], fields: Tuple[str, ...], rows: Iterable) -> FastJSONResponse:
+    """Список строк (Row или объекты с атрибутами) только с полями fields"""
+    adapter = _list_adapter(model, fields)
+    return FastJSONResponse(adapter.dump_python(adapter.validate_python(list(rows), from_attributes=True), mode="json"))
@@ -0,0 +1,59 @@
+"""
+Подписанные заголовки личности пользователя от API Gateway.
+
+Шлюз проверяет JWT и передаёт сервисам subject и срок действия токена
+с HMAC-подписью (ключ — общий SECRET_KEY). Подпись привязана к хешу
+самого токена, поэтому заголовки нельзя переставить к другому токену.
+Сервис сверяет HMAC вместо повторного разбора JWT; если заголовков нет
+(прямой вызов сервиса в обход шлюза), токен декодируется как раньше.
+
+Заголовки X-Auth-* от клиента шлюз не пропускает (в сервисы уходят
+только заголовки из FORWARDED_REQUEST_HEADERS).
+
+Здесь же признаки сервисного токена для журналов событий: их выпускает
+потребитель (shared/event_consumer.py), проверяет производитель
+(shared/event_log.py). Модуль без зависимостей, чтобы потребителю не
+тянуть хранилище производителя.
+"""
+
+import hashlib
+import hmac
+import time
+from typing import Mapping, Optional
+
+SUBJECT_HEADER = "X-Auth-Subject"
+EXPIRES_HEADER = "X-Auth-Expires"
+SIGNATURE_HEADER = "X-Auth-Signature"
+
+# Сервисный токен: sub = service:<имя> и claim typ. Токены auth-сервиса
+# несут только sub = username, а имя пользователя может начинаться с "service:"
+SERVICE_SUBJECT_PREFIX = "service:"
+SERVICE_TOKEN_TYPE = "service"
+
+
+def _signature(secret: str, subject: str, expires: int, token: str) -> str:
+    token_digest = hashlib.sha256(token.encode()).hexdigest()
+    message = f"{subject}\n{expires}\n{token_digest}".encode()
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def identity_headers(subject: str, expires: int, token: str, secret: str) -> dict:
+    return {
+        SUBJECT_HEADER: subject,
+        EXPIRES_HEADER: str(expires),
+        SIGNATURE_HEADER: _signature(secret, subject, expires, token),
+    }
+
+
+def verified_subject(headers: Mapping[str, str], token: str, secret: str) -> Optional[str]:
+    """subject из заголовков шлюза, если подпись верна и срок не истёк, иначе None"""
+    subject = headers.get(SUBJECT_HEADER)
+    expires = headers.get(EXPIRES_HEADER)
+    signature = headers.get(SIGNATURE_HEADER)
+    if not subject or not expires or not signature or not expires.isdigit():
+        return None
+    if int(expires) < time.time():
+        return None
+    if not hmac.compare_digest(signature, _signature(secret, subject, int(expires), token)):
+        return None
+    return subject
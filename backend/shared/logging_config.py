@@ -0,0 +1,177 @@
+"""
+Логирование сервисов: очередь и фоновый поток записи.
+
+logger.info() в обработчике запроса только подставляет аргументы в
+сообщение и кладёт запись в очередь (QueueHandler); форматирование,
+запись в файл logs/<service>.log и в stdout (для docker logs) выполняет
+фоновый поток QueueListener.
+Поэтому медленный диск или переполненный pipe stdout не останавливают
+event loop.
+
+Настройки (переменные окружения, общие для всех сервисов):
+- LOG_LEVEL — уровень (INFO);
+- LOG_FORMAT — json (по умолчанию) или text;
+- LOG_FILE — писать ли файл logs/<service>.log (true), LOG_DIR — каталог;
+- LOG_QUEUE_SIZE — ёмкость очереди (10000 записей);
+- LOG_QUEUE_POLICY — что делать при полной очереди: drop (запись
+  отбрасывается и считается в log_records_dropped_total) или block
+  (поток ждёт, пока писатель освободит место);
+- LOG_REQUEST_SAMPLE_RATE — доля запросов, чьи access-логи пишутся
+  (1.0). Решение принимается по request_id, поэтому у запроса либо все
+  строки, либо ни одной. WARNING и выше пишутся всегда.
+- LOG_SAMPLED_LOGGERS — логгеры access-логов (access,uvicorn.access).
+"""
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import zlib
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from shared import tracing
+from shared.metrics import registry
+
+LOGS_DROPPED = registry.counter("log_records_dropped_total", "Log records dropped because the log queue was full", ("service",))
+
+# Атрибуты LogRecord, которые не считаются пользовательскими полями (extra=...)
+STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "service", "request_id", "trace_id"}
+
+
+class JSONFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON; поля из extra=... попадают в объект как есть"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "service": getattr(record, "service", None),
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            data["request_id"] = record.request_id
+        if getattr(record, "trace_id", None):
+            data["trace_id"] = record.trace_id
+        for key, value in record.__dict__.items():
+            if key not in STANDARD_ATTRS and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class ContextFilter(logging.Filter):
+    """
+    Добавляет к записи сервис, request_id и trace_id текущего запроса.
+    Работает в потоке, который пишет лог: contextvars фонового писателя пусты.
+    """
+
+    def __init__(self, service: str):
+        super().__init__()
+        self.service = service
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.service = self.service
+        if not getattr(record, "request_id", None):
+            record.request_id = tracing.current_request_id.get()
+        span = tracing.current_span.get()
+        record.trace_id = span.trace_id if span is not None and span.sampled else None
+        return True
+
+
+class RequestSampler(logging.Filter):
+    """Пропускает access-логи sample_rate доли запросов; решение стабильно для request_id"""
+
+    def __init__(self, sample_rate: float, loggers):
+        super().__init__()
+        self.threshold = int(sample_rate * 0xFFFFFFFF)
+        self.loggers = set(loggers)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or record.name not in self.loggers:
+            return True
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            return zlib.crc32(request_id.encode("utf-8")) <= self.threshold
+        return random.random() * 0xFFFFFFFF <= self.threshold
+
+
+class BoundedQueueHandler(QueueHandler):
+    def __init__(self, log_queue: queue.Queue, policy: str, service: str):
+        super().__init__(log_queue)
+        self.block = policy == "block"
+        self.dropped = LOGS_DROPPED.labels(service)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Как в стандартном QueueHandler, сообщение подставляется здесь, в потоке
+        # запроса: к моменту записи изменяемые аргументы могли поменяться.
+        # exc_info не сворачиваем в текст — JSONFormatter пишет исключение
+        # отдельным полем уже в потоке писателя.
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.block:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped.inc()
+
+
+_listener = None
+
+
+def setup_logging(service_name: str = "backend-service") -> None:
+    """
+    Настраивает корневой логгер сервиса: очередь + фоновый писатель
+    в файл logs/<service_name>.log и stdout. Повторный вызов ничего не делает.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    log_level = os.getenv("LOG_LEVEL", "INFO").upper()
+    if os.getenv("LOG_FORMAT", "json") == "json":
+        formatter = JSONFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s [%(levelname)s] [%(name)s] [%(request_id)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
+
+    handlers = [logging.StreamHandler()]
+    if os.getenv("LOG_FILE", "true").lower() == "true":
+        logs_dir = os.getenv("LOG_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logs"))
+        os.makedirs(logs_dir, exist_ok=True)
+        # Ротация по ~5 МБ, до 3 файлов
+        handlers.append(RotatingFileHandler(os.path.join(logs_dir, f"{service_name}.log"), maxBytes=5 * 1024 * 1024, backupCount=3, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+    queue_handler = BoundedQueueHandler(log_queue, os.getenv("LOG_QUEUE_POLICY", "drop"), service_name)
+    queue_handler.addFilter(ContextFilter(service_name))
+    sampled_loggers = [name for name in os.getenv("LOG_SAMPLED_LOGGERS", "access,uvicorn.access").split(",") if name]
+    queue_handler.addFilter(RequestSampler(float(os.getenv("LOG_REQUEST_SAMPLE_RATE", "1.0")), sampled_loggers))
+
+    root_logger = logging.getLogger()
+    root_logger.setLevel(log_level)
+    root_logger.handlers = [queue_handler]
+    # uvicorn пишет в stdout своими обработчиками прямо из event loop —
+    # переводим его логгеры в общую очередь
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # При остановке процесса дописываем то, что осталось в очереди
+    atexit.register(_listener.stop)
@@ -0,0 +1,297 @@
+"""
+Метрики сервисов в текстовом формате Prometheus (GET /metrics).
+
+Без внешних зависимостей: счётчики, gauge и гистограммы с фиксированными
+корзинами. Запись — O(число корзин) под коротким threading.Lock:
+синхронные обработчики и события SQLAlchemy выполняются в threadpool.
+
+Что собирается:
+- http_requests_total / http_request_duration_seconds — по шаблону
+  маршрута (/defects/{defect_id}, а не /defects/42), методу и статусу;
+  http_requests_in_flight — запросы в обработке (пишет RequestMiddleware,
+  shared/observability.py);
+- db_query_duration_seconds / db_query_errors_total — каждый SQL-запрос
+  через события движка SQLAlchemy (instrument_engine); для сэмплированных
+  запросов тот же замер пишется в trace как span (shared/tracing.py);
+- http_client_request_duration_seconds — вызовы других сервисов через
+  httpx, по имени сервиса (InstrumentedTransport, он же передаёт
+  traceparent и X-Request-ID);
+- events_published_total — публикация доменных событий.
+
+Метки только с ограниченным набором значений: неизвестные пути попадают
+в одну метку "<unmatched>", иначе сканирование URL раздуло бы память.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import httpx
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import Scope
+
+from shared import tracing
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str):
+        # Значения меток — строки: ключ словаря без преобразований на горячем пути
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(self._sample_lines(key, child))
+        return lines
+
+    def _sample_lines(self, key, child) -> List[str]:
+        return [f"{self.name}{_labels_text(self.labelnames, key)} {_format_value(child.value)}"]
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+
+class _HistogramValue:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        # Счётчики по корзинам без накопления; последняя — +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = REQUEST_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def _sample_lines(self, key, child) -> List[str]:
+        with child._lock:
+            counts = list(child.counts)
+            total_sum = child.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            labels = _labels_text(self.labelnames, key, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _labels_text(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total_sum)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = REQUEST_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def expose(self) -> bytes:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.expose())
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+registry = Registry()
+
+# Имя сервиса в метках задаёт setup_metrics; до вызова — "unknown"
+SERVICE = {"name": "unknown"}
+
+PROCESS_START_TIME = registry.gauge("process_start_time_seconds", "Start time of the process since unix epoch")
+PROCESS_START_TIME.labels().set(time.time())
+
+HTTP_REQUESTS = registry.counter("http_requests_total", "HTTP requests handled", ("service", "method", "route", "status"))
+HTTP_DURATION = registry.histogram("http_request_duration_seconds", "HTTP request latency until the last body chunk", ("service", "method", "route"))
+HTTP_IN_FLIGHT = registry.gauge("http_requests_in_flight", "HTTP requests being handled", ("service",))
+
+DB_DURATION = registry.histogram("db_query_duration_seconds", "SQL statement execution time", ("service", "operation"), QUERY_BUCKETS)
+DB_ERRORS = registry.counter("db_query_errors_total", "SQL statements that raised", ("service", "operation"))
+
+CLIENT_DURATION = registry.histogram("http_client_request_duration_seconds", "Outgoing HTTP call latency until response headers", ("service", "upstream", "method", "status"))
+
+EVENTS_PUBLISHED = registry.counter("events_published_total", "Domain events published to the event log", ("service", "event_type", "result"))
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def route_template(scope: Scope) -> str:
+    """Шаблон маршрута, который выбрал роутер FastAPI (scope["route"])"""
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    return path if path else UNMATCHED_ROUTE
+
+
+def _statement_operation(statement: str) -> str:
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+    return operation if operation in ("SELECT", "INSERT", "UPDATE", "DELETE", "PRAGMA") else "OTHER"
+
+
+def instrument_engine(engine) -> None:
+    """Время каждого SQL-запроса движка по типу операции (SELECT/INSERT/...)"""
+    # sqlalchemy есть только у сервисов с БД; шлюз и отчёты импортируют модуль без него
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append((time.perf_counter(), time.time_ns()))
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started, started_ns = conn.info["query_started"].pop()
+        operation = _statement_operation(statement)
+        DB_DURATION.labels(SERVICE["name"], operation).observe(time.perf_counter() - started)
+        tracing.record_span(f"db {operation}", "client", started_ns, time.time_ns(), {"db.operation": operation, "db.statement": statement[:300]})
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        stack = context.connection.info.get("query_started") if context.connection is not None else None
+        if stack:
+            stack.pop()
+        DB_ERRORS.labels(SERVICE["name"], _statement_operation(context.statement or "")).inc()
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """
+    Транспорт httpx, который замеряет вызовы сервиса upstream:
+    httpx.AsyncClient(transport=InstrumentedTransport("auth")).
+    Ошибки соединения и таймауты попадают в метку status="error".
+    Каждая попытка — отдельный client span; traceparent и X-Request-ID
+    текущего запроса уходят в заголовках.
+    """
+
+    def __init__(self, upstream: str, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.upstream = upstream
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        status = "error"
+        with tracing.span(f"{request.method} {self.upstream}", "client") as client_span:
+            request.headers.update(tracing.outgoing_headers())
+            try:
+                response = await self.transport.handle_async_request(request)
+                status = str(response.status_code)
+                return response
+            finally:
+                CLIENT_DURATION.labels(SERVICE["name"], self.upstream, request.method, status).observe(time.perf_counter() - started)
+                client_span.set("peer.service", self.upstream)
+                # Без query string: в ней текст поиска и фильтры пользователя
+                client_span.set("http.url", str(request.url.copy_with(query=None)))
+                client_span.set("http.status_code", status)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def record_event_published(event_type: str, ok: bool) -> None:
+    EVENTS_PUBLISHED.labels(SERVICE["name"], event_type, "ok" if ok else "error").inc()
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    return Response(registry.expose(), media_type=CONTENT_TYPE)
+
+
+def setup_metrics(app, service: str, engine=None, expose: bool = True) -> None:
+    """
+    GET /metrics (expose=False — без маршрута, для публичного шлюза) и,
+    если передан engine, время SQL-запросов; middleware — в setup_observability
+    """
+    SERVICE["name"] = service
+    if expose:
+        app.add_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
+    if engine is not None:
+        instrument_engine(engine)
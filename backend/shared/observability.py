@@ -0,0 +1,119 @@
+"""
+Наблюдаемость HTTP-запросов в одном чистом ASGI middleware.
+
+RequestMiddleware за один проход по запросу:
+- назначает X-Request-ID (из заголовка клиента или новый) — он виден
+  обработчикам в заголовках и request.state.request_id и возвращается
+  в ответе;
+- открывает серверный span (shared/tracing.py). Входящий traceparent
+  продолжается только во внутренних сервисах: шлюз (edge=True) стоит на
+  границе и начинает trace сам, иначе клиент мог бы флагом sampled
+  включить запись span-ов для всех своих запросов;
+- считает метрики: запросы в обработке, время до последнего куска тела,
+  счётчик по статусу (shared/metrics.py);
+- пишет одну строку access-лога в конце запроса (логгер "access",
+  сэмплирование — LOG_REQUEST_SAMPLE_RATE в shared/logging_config.py).
+
+В отличие от BaseHTTPMiddleware, здесь нет отдельной задачи и канала
+памяти на каждый запрос: сообщения send/receive проходят насквозь,
+потоковые ответы (NDJSON, CSV, файлы) отдаются клиенту по мере готовности.
+"""
+
+import logging
+import time
+import uuid
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from shared import metrics, tracing
+
+access_logger = logging.getLogger("access")
+
+REQUEST_ID_HEADER = b"x-request-id"
+
+
+class RequestMiddleware:
+    def __init__(self, app: ASGIApp, trust_traceparent: bool = True):
+        self.app = app
+        self.trust_traceparent = trust_traceparent
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        headers = Headers(scope=scope)
+        request_id = headers.get("x-request-id")
+        if not request_id:
+            request_id = str(uuid.uuid4())
+            scope["headers"] = [*scope["headers"], (REQUEST_ID_HEADER, request_id.encode("latin-1"))]
+        scope.setdefault("state", {})["request_id"] = request_id
+
+        incoming = tracing.parse_traceparent(headers.get("traceparent")) if self.trust_traceparent else None
+        if incoming is not None:
+            trace_id, parent_id, sampled = incoming
+            server_span = tracing.Span(scope["method"], "server", trace_id, parent_id, sampled)
+        else:
+            server_span = tracing.start_span(scope["method"], "server", parent=None)
+        span_token = tracing.current_span.set(server_span)
+        request_id_token = tracing.current_request_id.set(request_id)
+
+        service = metrics.SERVICE["name"]
+        in_flight = metrics.HTTP_IN_FLIGHT.labels(service)
+        in_flight.inc()
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                MutableHeaders(scope=message)["x-request-id"] = request_id
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            server_span.status = "error"
+            server_span.set("error", type(e).__name__)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            in_flight.dec()
+            tracing.current_span.reset(span_token)
+            tracing.current_request_id.reset(request_id_token)
+
+            method = scope["method"]
+            # Роутер дописывает "route" в тот же scope, поэтому шаблон известен после ответа
+            route = metrics.route_template(scope)
+            metrics.HTTP_DURATION.labels(service, method, route).observe(elapsed)
+            metrics.HTTP_REQUESTS.labels(service, method, route, str(status_code)).inc()
+
+            if server_span.sampled:
+                server_span.name = f"{method} {route}"
+                server_span.set("http.method", method)
+                server_span.set("http.target", scope["path"])
+                server_span.set("http.status_code", status_code)
+                server_span.set("request_id", request_id)
+                if status_code >= 500:
+                    server_span.status = "error"
+            server_span.finish()
+
+            access_logger.info(
+                "%s %s %s %.1fms", method, scope["path"], status_code, elapsed * 1000,
+                extra={"request_id": request_id, "route": route, "status": status_code, "duration_ms": round(elapsed * 1000, 2)},
+            )
+
+
+def setup_observability(app, service: str, engine=None, edge: bool = False) -> None:
+    """
+    RequestMiddleware, GET /metrics, GET /traces и время SQL-запросов
+    (если передан engine). Вызывать после остальных add_middleware:
+    так замер охватывает и CORS, и сжатие. edge=True — сервис принимает
+    запросы извне (шлюз): traceparent клиента не продолжается, а /metrics
+    и /traces наружу не публикуются.
+    """
+    metrics.setup_metrics(app, service, engine, expose=not edge)
+    tracing.setup_tracing(app, service, expose=not edge)
+    app.add_middleware(RequestMiddleware, trust_traceparent=not edge)
@@ -0,0 +1,246 @@
+"""
+Общий слой ответов: быстрый JSON и сжатие по Accept-Encoding.
+
+FastJSONResponse кодирует JSON через orjson (если пакет установлен,
+иначе компактный json.dumps). CompressionMiddleware — чистый ASGI
+middleware: выбирает zstd, br или gzip по Accept-Encoding клиента и
+сжимает текстовые ответы больше minimum_size. Потоковые ответы (NDJSON,
+CSV) сжимаются по кускам с flush после каждого куска.
+
+Не сжимаются: ответы с Content-Encoding (уже сжаты), с Accept-Ranges /
+Content-Range (файлы вложений, иначе ломаются диапазоны), 204/206/304,
+бинарные типы (изображения, xlsx, архивы), text/event-stream и ответы
+с Cache-Control: no-transform.
+
+brotli и zstandard — необязательные зависимости: без них кодировка
+просто не предлагается.
+"""
+
+import json
+import zlib
+from typing import Any, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "application/x-yaml",
+    "image/svg+xml",
+}
+SKIP_STATUSES = {204, 206, 304}
+# Куски больше этого сжимаются в threadpool (zlib, brotli и zstd отпускают GIL),
+# чтобы сжатие большого списка не блокировало event loop на десятки миллисекунд
+THREADPOOL_THRESHOLD = 64 * 1024
+
+
+def is_compressible(content_type: str) -> bool:
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES or media_type.endswith(("+json", "+xml"))
+
+
+class GzipEncoder:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class BrotliEncoder:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.process(data) + self._compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+def supported_encodings() -> List[str]:
+    """В порядке предпочтения сервера: лучшее сжатие на единицу CPU — первым"""
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return encodings
+
+
+def negotiate_encoding(accept_encoding: str, supported: List[str]) -> Optional[str]:
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    wildcard = accepted.get("*", 0.0)
+    candidates = [(accepted.get(name, wildcard), -index, name) for index, name in enumerate(supported)]
+    q, _, name = max(candidates)
+    return name if q > 0 else None
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4, zstd_level: int = 3):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {"gzip": gzip_level, "br": brotli_quality, "zstd": zstd_level}
+        self.encodings = supported_encodings()
+
+    def create_encoder(self, encoding: str):
+        if encoding == "zstd":
+            return ZstdEncoder(self.levels["zstd"])
+        if encoding == "br":
+            return BrotliEncoder(self.levels["br"])
+        return GzipEncoder(self.levels["gzip"])
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        # Без подходящей кодировки ответ не сжимается, но Vary ему всё равно нужен
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+        await self.app(scope, receive, CompressionResponder(self, encoding, send).handle)
+
+
+class CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding: Optional[str], send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.send = send
+        self.start: Optional[Message] = None
+        self.encoder = None
+        self.passthrough = False
+
+    def _should_compress(self, headers: Headers, status: int) -> bool:
+        return (
+            status not in SKIP_STATUSES
+            and "content-encoding" not in headers
+            and "content-range" not in headers
+            and "accept-ranges" not in headers
+            and is_compressible(headers.get("content-type", ""))
+            # Долгие потоки событий (SSE, /events/live) не сжимаются: состояние
+            # компрессора — сотни КБ на соединение, а мелкие события с flush почти не ужимаются
+            and "no-transform" not in headers.get("cache-control", "")
+            and not headers.get("content-type", "").startswith("text/event-stream")
+        )
+
+    @staticmethod
+    async def _encode(func, body: bytes) -> bytes:
+        if len(body) >= THREADPOOL_THRESHOLD:
+            return await run_in_threadpool(func, body)
+        return func(body)
+
+    def _vary_start(self) -> Message:
+        """
+        Заголовки несжатого ответа, который мог быть сжат (другой клиент или
+        тело побольше): кеш должен различать ответы по Accept-Encoding
+        """
+        headers = MutableHeaders(raw=list(self.start["headers"]))
+        headers.add_vary_header("Accept-Encoding")
+        return {**self.start, "headers": headers.raw}
+
+    def _encoded_start(self, length: Optional[int]) -> Message:
+        headers = MutableHeaders(raw=list(self.start["headers"]))
+        headers["content-encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if length is None:
+            del headers["content-length"]
+        else:
+            headers["content-length"] = str(length)
+        # Сжатое тело — другие байты: сильный ETag становится слабым
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["etag"] = f"W/{etag}"
+        return {**self.start, "headers": headers.raw}
+
+    async def handle(self, message: Message) -> None:
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            # Заголовки отправим, когда увидим первый кусок тела
+            self.start = message
+            return
+        if self.passthrough or message_type != "http.response.body":
+            # zerocopysend и прочие расширения ASGI отдаются как есть
+            if self.start is not None:
+                await self.send(self.start)
+                self.start = None
+            if self.encoder is None:
+                self.passthrough = True
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.encoder is None:
+            headers = Headers(raw=self.start["headers"])
+            compressible = self._should_compress(headers, self.start["status"])
+            if not compressible or self.encoding is None or (not more_body and len(body) < self.middleware.minimum_size):
+                self.passthrough = True
+                await self.send(self._vary_start() if compressible else self.start)
+                self.start = None
+                await self.send(message)
+                return
+            self.encoder = self.middleware.create_encoder(self.encoding)
+            if not more_body:
+                compressed = await self._encode(self.encoder.finish, body)
+                await self.send(self._encoded_start(len(compressed)))
+                await self.send({"type": "http.response.body", "body": compressed, "more_body": False})
+                return
+            await self.send(self._encoded_start(None))
+            self.start = None
+
+        data = await self._encode(self.encoder.compress if more_body else self.encoder.finish, body)
+        await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
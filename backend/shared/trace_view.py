@@ -0,0 +1,102 @@
+"""
+Просмотр trace-ов: собирает span-ы всех сервисов и печатает дерево
+с длительностями — видно, где ушло время в запросе через несколько сервисов.
+
+Источники span-ов:
+- JSON Lines файлы (TRACE_EXPORTER=file:<путь>);
+- GET /traces/{trace_id} запущенных сервисов (TRACE_EXPORTER=memory).
+
+    cd backend
+    python -m shared.trace_view logs/traces-*.jsonl               # самые медленные trace-ы
+    python -m shared.trace_view logs/traces-*.jsonl --trace <trace_id>
+    python -m shared.trace_view --url http://localhost:8001 --url http://localhost:8003 --trace <trace_id>
+"""
+
+import argparse
+import glob
+import json
+from collections import defaultdict
+from typing import Dict, List
+
+
+def load_files(patterns: List[str]) -> List[Dict]:
+    spans = []
+    for pattern in patterns:
+        for path in glob.glob(pattern):
+            with open(path, encoding="utf-8") as f:
+                spans.extend(json.loads(line) for line in f if line.strip())
+    return spans
+
+
+def load_urls(urls: List[str], trace_id: str) -> List[Dict]:
+    import httpx
+
+    spans = []
+    for url in urls:
+        response = httpx.get(f"{url.rstrip('/')}/traces/{trace_id}", timeout=5.0)
+        response.raise_for_status()
+        spans.extend(response.json()["spans"])
+    return spans
+
+
+def print_tree(spans: List[Dict]) -> None:
+    by_id = {span["span_id"]: span for span in spans}
+    children = defaultdict(list)
+    roots = []
+    for span in spans:
+        if span["parent_id"] in by_id:
+            children[span["parent_id"]].append(span)
+        else:
+            roots.append(span)
+    trace_start = min(span["start"] for span in spans)
+
+    def walk(span: Dict, depth: int) -> None:
+        offset = (span["start"] - trace_start) / 1e6
+        mark = " !" if span["status"] == "error" else ""
+        print(f"{offset:9.2f} ms {span['duration_ms'] or 0:9.2f} ms  {'  ' * depth}[{span['service']}] {span['name']}{mark}")
+        for child in sorted(children[span["span_id"]], key=lambda item: item["start"]):
+            walk(child, depth + 1)
+
+    print(f"{'start':>12} {'duration':>12}")
+    for root in sorted(roots, key=lambda item: item["start"]):
+        walk(root, 0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Assemble and print distributed traces")
+    parser.add_argument("files", nargs="*", help="JSON Lines files written by TRACE_EXPORTER=file:...")
+    parser.add_argument("--url", action="append", default=[], help="service base URL with TRACE_EXPORTER=memory")
+    parser.add_argument("--trace", help="trace_id to print")
+    parser.add_argument("--slowest", type=int, default=10)
+    args = parser.parse_args()
+
+    spans = load_files(args.files)
+    if args.url:
+        if not args.trace:
+            parser.error("--url requires --trace")
+        spans.extend(load_urls(args.url, args.trace))
+
+    traces = defaultdict(list)
+    for span in spans:
+        traces[span["trace_id"]].append(span)
+
+    if args.trace:
+        if args.trace not in traces:
+            print(f"Trace {args.trace} not found")
+            return
+        print_tree(traces[args.trace])
+        return
+
+    # Длительность trace-а — от начала первого span-а до конца последнего
+    durations = []
+    for trace_id, items in traces.items():
+        start = min(span["start"] for span in items)
+        end = max(span["start"] + (span["duration_ms"] or 0) * 1e6 for span in items)
+        services = sorted({span["service"] for span in items})
+        durations.append(((end - start) / 1e6, trace_id, len(items), services))
+    for duration, trace_id, count, services in sorted(durations, reverse=True)[:args.slowest]:
+        print(f"{trace_id}  {duration:9.2f} ms  {count:4d} spans  {', '.join(services)}")
+
+
+if __name__ == "__main__":
+    main()
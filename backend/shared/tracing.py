@@ -0,0 +1,280 @@
+"""
+Распределённая трассировка по W3C Trace Context (заголовок traceparent).
+
+    traceparent: 00-<trace_id, 32 hex>-<parent span_id, 16 hex>-<flags, 01 = sampled>
+
+RequestMiddleware (shared/observability.py) открывает серверный span
+на каждый запрос: продолжает trace из входящего traceparent или
+начинает новый. Текущий span хранится в contextvar, поэтому его видят
+и обработчики в threadpool, и события SQLAlchemy, и исходящие вызовы httpx. Исходящие вызовы через
+shared.metrics.InstrumentedTransport получают свой client span и
+передают дальше traceparent и X-Request-ID.
+
+Сэмплирование head-based: решение принимает шлюз с вероятностью
+TRACE_SAMPLE_RATE, внутренние сервисы следуют флагу из traceparent.
+traceparent от внешнего клиента шлюз не продолжает (edge=True в
+setup_observability) — флаг sampled задают только свои сервисы. Для несэмплированных запросов span-ы не записываются —
+только генерируются идентификаторы для заголовков, это единицы микросекунд.
+
+Экспорт (TRACE_EXPORTER):
+- "memory" (по умолчанию) — кольцевой буфер последних span-ов,
+  GET /traces и GET /traces/{trace_id} в каждом сервисе, кроме шлюза
+  (его порт публичный, span-ы других пользователей там не отдаются);
+- "file:<путь>" — JSON Lines, запись в фоновом потоке. Файлы нескольких
+  сервисов собирает в дерево shared/trace_view.py;
+- "none" — без экспорта.
+"""
+
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "memory")
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "10000"))
+
+
+class Span:
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_id", "sampled", "start", "end", "attributes", "status", "service")
+
+    def __init__(self, name: str, kind: str, trace_id: str, parent_id: Optional[str], sampled: bool):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = new_span_id()
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.start = time.time_ns()
+        self.end: Optional[int] = None
+        self.attributes: Dict[str, Any] = {}
+        self.status = "ok"
+        self.service = TRACER["service"]
+
+    def set(self, key: str, value: Any) -> None:
+        if self.sampled:
+            self.attributes[key] = value
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def finish(self, end: Optional[int] = None) -> None:
+        self.end = end or time.time_ns()
+        if self.sampled:
+            export(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "service": self.service,
+            "name": self.name,
+            "kind": self.kind,
+            "start": self.start,
+            "duration_ms": round((self.end - self.start) / 1e6, 3) if self.end else None,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+def new_trace_id() -> str:
+    return f"{random.getrandbits(128):032x}"
+
+
+def new_span_id() -> str:
+    return f"{random.getrandbits(64):016x}"
+
+
+def parse_traceparent(value: Optional[str]):
+    """(trace_id, parent_id, sampled) или None, если заголовок некорректен"""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) < 4 or len(parts[0]) != 2 or parts[0] == "ff":
+        return None
+    version, trace_id, parent_id, flags = parts[:4]
+    if version == "00" and len(parts) != 4:
+        return None
+    if len(trace_id) != 32 or len(parent_id) != 16 or len(flags) != 2:
+        return None
+    try:
+        sampled = bool(int(flags, 16) & 1)
+        int(trace_id, 16)
+        int(parent_id, 16)
+    except ValueError:
+        return None
+    if trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id.lower(), parent_id.lower(), sampled
+
+
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+current_request_id: ContextVar[Optional[str]] = ContextVar("current_request_id", default=None)
+
+# Имя сервиса задаёт setup_tracing
+TRACER = {"service": "unknown"}
+
+
+def start_span(name: str, kind: str = "internal", parent: Optional[Span] = None) -> Span:
+    parent = parent or current_span.get()
+    if parent is None:
+        return Span(name, kind, new_trace_id(), None, random.random() < TRACE_SAMPLE_RATE)
+    return Span(name, kind, parent.trace_id, parent.span_id, parent.sampled)
+
+
+@contextmanager
+def span(name: str, kind: str = "internal") -> Iterator[Span]:
+    """Дочерний span текущего; ошибка внутри блока помечает span как error"""
+    child = start_span(name, kind)
+    token = current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.status = "error"
+        child.set("error", type(e).__name__)
+        raise
+    finally:
+        current_span.reset(token)
+        child.finish()
+
+
+def record_span(name: str, kind: str, start: int, end: int, attributes: Dict[str, Any], status: str = "ok") -> None:
+    """Готовый дочерний span текущего (для событий, у которых известны только начало и конец)"""
+    parent = current_span.get()
+    if parent is None or not parent.sampled:
+        return
+    child = Span(name, kind, parent.trace_id, parent.span_id, True)
+    child.start = start
+    child.attributes.update(attributes)
+    child.status = status
+    child.finish(end)
+
+
+def outgoing_headers() -> Dict[str, str]:
+    """traceparent и X-Request-ID для исходящего вызова из текущего контекста"""
+    headers = {}
+    active = current_span.get()
+    if active is not None:
+        headers["traceparent"] = active.traceparent()
+    request_id = current_request_id.get()
+    if request_id is not None:
+        headers["X-Request-ID"] = request_id
+    return headers
+
+
+# ==================== Экспорт ====================
+
+class MemoryExporter:
+    """Последние max_spans span-ов процесса, сгруппированные по trace_id"""
+
+    def __init__(self, max_spans: int = 10000):
+        self.max_spans = max_spans
+        self._traces: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        data = span.to_dict()
+        with self._lock:
+            spans = self._traces.get(span.trace_id)
+            if spans is None:
+                spans = self._traces[span.trace_id] = []
+            spans.append(data)
+            self._count += 1
+            while self._count > self.max_spans and self._traces:
+                _, dropped = self._traces.popitem(last=False)
+                self._count -= len(dropped)
+
+    def get_trace(self, trace_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return sorted(self._traces.get(trace_id, []), key=lambda item: item["start"])
+
+    def recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = list(self._traces.items())[-limit:]
+        result = []
+        for trace_id, spans in reversed(items):
+            root = min(spans, key=lambda item: item["start"])
+            result.append({"trace_id": trace_id, "root": root["name"], "spans": len(spans), "duration_ms": root["duration_ms"]})
+        return result
+
+
+class FileExporter:
+    """JSON Lines; запись и flush в фоновом потоке, чтобы не блокировать event loop"""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._queue: "queue.SimpleQueue[Dict[str, Any]]" = queue.SimpleQueue()
+        threading.Thread(target=self._writer, name="trace-exporter", daemon=True).start()
+
+    def export(self, span: Span) -> None:
+        self._queue.put(span.to_dict())
+
+    def _writer(self) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                batch = [self._queue.get()]
+                while True:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                f.write("".join(json.dumps(item, ensure_ascii=False) + "\n" for item in batch))
+                f.flush()
+
+
+def create_exporter(url: str):
+    if url == "none":
+        return None
+    if url.startswith("file:"):
+        return FileExporter(url[len("file:"):])
+    if url != "memory":
+        raise ValueError(f"Unknown trace exporter: {url}")
+    return MemoryExporter(TRACE_BUFFER_SIZE)
+
+
+exporter = create_exporter(TRACE_EXPORTER)
+
+
+def export(span: Span) -> None:
+    if exporter is None:
+        return
+    try:
+        exporter.export(span)
+    except Exception as e:
+        logger.warning(f"Span export failed: {e}")
+
+
+# ==================== HTTP API ====================
+
+async def list_traces(request: Request) -> JSONResponse:
+    limit = int(request.query_params.get("limit", "50"))
+    return JSONResponse({"service": TRACER["service"], "sample_rate": TRACE_SAMPLE_RATE, "traces": exporter.recent(limit)})
+
+
+async def get_trace(request: Request) -> JSONResponse:
+    return JSONResponse({"trace_id": request.path_params["trace_id"], "spans": exporter.get_trace(request.path_params["trace_id"])})
+
+
+def setup_tracing(app, service: str, expose: bool = True) -> None:
+    """Имя сервиса в span-ах и, для TRACE_EXPORTER=memory и expose=True, GET /traces"""
+    TRACER["service"] = service
+    if expose and isinstance(exporter, MemoryExporter):
+        app.add_route("/traces", list_traces, methods=["GET"], include_in_schema=False)
+        app.add_route("/traces/{trace_id}", get_trace, methods=["GET"], include_in_schema=False)